@@ -17,6 +17,7 @@ from app.models.responses import (
 )
 from app.services.agent_service import AgentService
 from app.services.browser_service import BrowserService
+from app.core.agent_runner import get_loop_lag_stats, get_model_cascade_stats, get_step_latency_histograms
 
 api_router = APIRouter(prefix="/api", tags=["api"])
 agent_service = AgentService()
@@ -56,6 +57,21 @@ async def stop_agent(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found or already completed")
     return {"status": "stopped"}
 
+@api_router.get("/metrics/latency")
+async def get_latency_metrics():
+    """Get the latency histograms of the agent step phases, per task and per model"""
+    return get_step_latency_histograms()
+
+@api_router.get("/metrics/loop")
+async def get_loop_metrics():
+    """Get the event loop lag histogram and the number of calls that blocked the loop"""
+    return get_loop_lag_stats()
+
+@api_router.get("/metrics/cascade")
+async def get_cascade_metrics():
+    """Get the calls, hit rate and latency of the model cascade tiers per model, and the escalations"""
+    return get_model_cascade_stats()
+
 @api_router.post("/research/run")
 async def run_research(
     request: ResearchRequest,
@@ -17,7 +17,12 @@ from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import BrowserContextConfig
 from browser_use.browser.browser import BrowserConfig
 from browser_use.browser.context import BrowserContextWindowSize
+from src.utils.checkpoint import checkpoint_path
 from src.utils.deep_research import deep_research
+from src.utils.model_cascade import get_cascade_stats
+from src.utils.offload import EventLoopLagMonitor, run_in_thread, shutdown_pools
+from src.utils.skill_store import SkillStore
+from src.utils.step_profiler import get_latency_histograms
 
 # Global variables for browser instances
 _global_browser = None
@@ -47,6 +52,7 @@ async def run_browser_agent(
     tool_calling_method: str,
     chrome_cdp: Optional[str],
     max_input_tokens: int,
+    resume_run_id: Optional[str] = None,
     on_update: Optional[Callable[[Dict[str, Any]], None]] = None
 ) -> Dict[str, Any]:
     """
@@ -108,6 +114,7 @@ async def run_browser_agent(
                 tool_calling_method=tool_calling_method,
                 chrome_cdp=chrome_cdp,
                 max_input_tokens=max_input_tokens,
+                resume_run_id=resume_run_id,
                 on_update=on_update
             )
         else:  # "org" agent type
@@ -150,6 +157,7 @@ async def run_custom_agent(
     tool_calling_method,
     chrome_cdp,
     max_input_tokens,
+    resume_run_id=None,
     on_update=None
 ):
     """Run the custom agent implementation"""
@@ -169,7 +177,21 @@ async def run_custom_agent(
         else:
             chrome_path = None
 
-        controller = CustomController()
+        skill_store = get_skill_store()
+        checkpoint_dir = os.getenv("CHECKPOINT_DIR", "") or None
+        checkpoint_file = None
+        if resume_run_id:
+            # only the run the client asks for is resumed, with its cookies
+            if not checkpoint_dir:
+                raise ValueError("Resuming a run needs CHECKPOINT_DIR")
+            if os.path.basename(resume_run_id) != resume_run_id:
+                raise ValueError(f"Invalid run id: {resume_run_id}")
+            checkpoint_file = checkpoint_path(checkpoint_dir, task, resume_run_id)
+            if not os.path.exists(checkpoint_file):
+                raise ValueError(f"No checkpoint of the run {resume_run_id} for this task")
+        # jsonl histories are appended step by step by the agent, with their screenshots in a shared blob store
+        jsonl_history = os.getenv("HISTORY_FORMAT", "json").lower() == "jsonl"
+        controller = CustomController(skill_store=skill_store)
 
         # Initialize global browser if needed
         if (_global_browser is None) or (cdp_url and cdp_url != ""):
@@ -209,19 +231,44 @@ async def run_custom_agent(
             max_actions_per_step=max_actions_per_step,
             tool_calling_method=tool_calling_method,
             max_input_tokens=max_input_tokens,
-            generate_gif=True
+            compaction_llm=_get_env_llm("HISTORY_COMPACTION"),
+            cache_friendly_prompt=os.getenv("CACHE_FRIENDLY_PROMPT", "false").lower() == "true",
+            optimize_screenshots=os.getenv("OPTIMIZE_SCREENSHOTS", "false").lower() == "true",
+            max_image_tokens=int(os.getenv("MAX_IMAGE_TOKENS")) if os.getenv("MAX_IMAGE_TOKENS") else None,
+            dom_delta=os.getenv("DOM_DELTA_PROMPT", "false").lower() == "true",
+            max_element_tokens=int(os.getenv("MAX_ELEMENT_TOKENS")) if os.getenv("MAX_ELEMENT_TOKENS") else None,
+            detect_loops=os.getenv("DETECT_LOOPS", "false").lower() == "true",
+            cascade_llm=_get_env_llm("CASCADE"),
+            hedge_llm=_get_env_llm("HEDGE"),
+            hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "90")),
+            checkpoint_dir=checkpoint_dir,
+            generate_gif=True,
+            gif_max_size=int(os.getenv("GIF_MAX_SIZE", "1280")),
+            gif_max_frames=int(os.getenv("GIF_MAX_FRAMES", "100")),
+            history_dir=save_agent_history_path if jsonl_history else None,
+            history_blob_dir=os.getenv("HISTORY_BLOB_DIR", "./tmp/history_blobs"),
         )
 
         # Set up a task for periodic screenshot capture if on_update is provided
         if on_update:
+            # a resumed run keeps the id of the interrupted one
+            on_update({"run_id": resume_run_id or _global_agent.state.agent_id})
             screenshot_task = asyncio.create_task(periodic_screenshot_capture(_global_browser_context, _global_agent, on_update))
 
-        # Run the agent
-        history = await _global_agent.run(max_steps=max_steps)
+        # Run the agent, from the checkpoint of the interrupted run the client asked to resume
+        if checkpoint_file:
+            history = await _global_agent.resume_from_checkpoint(checkpoint_file, max_steps=max_steps)
+        else:
+            history = await _global_agent.run(max_steps=max_steps)
 
         # Save history
-        history_file = os.path.join(save_agent_history_path, f"{_global_agent.state.agent_id}.json")
-        _global_agent.save_history(history_file)
+        if jsonl_history:
+            history_file = _global_agent.history_path
+        else:
+            history_file = os.path.join(save_agent_history_path, f"{_global_agent.state.agent_id}.json")
+            await run_in_thread(_global_agent.save_history, history_file)
+        if skill_store is not None:
+            await run_in_thread(skill_store.learn, history)
 
         # Prepare the result
         final_result = history.final_result()
@@ -253,7 +300,10 @@ async def run_custom_agent(
                 "model_thoughts": model_thoughts,
                 "recording_path": latest_recording,
                 "trace_file": trace_file_path,
-                "history_file": history_file
+                "history_file": history_file,
+                "stop_reason": _global_agent.state.stop_reason,
+                "steps_saved": _global_agent.state.steps_saved,
+                "run_id": _global_agent.state.agent_id,
             })
 
         return {
@@ -263,7 +313,10 @@ async def run_custom_agent(
             "model_thoughts": model_thoughts,
             "recording_path": latest_recording,
             "trace_file": trace_file_path,
-            "history_file": history_file
+            "history_file": history_file,
+            "stop_reason": _global_agent.state.stop_reason,
+            "steps_saved": _global_agent.state.steps_saved,
+            "run_id": _global_agent.state.agent_id,
         }
     except Exception as e:
         import traceback
@@ -352,6 +405,64 @@ async def run_deep_research(
             "file_path": None
         }
 
+async def warm_up_llm_models():
+    """Create the LLM clients listed in LLM_WARMUP_MODELS (provider:model_name,...) ahead of the first task"""
+    await utils.warm_up_llm_models(os.getenv("LLM_WARMUP_MODELS", ""))
+
+async def close_llm_clients():
+    """Close the connection pools of the cached LLM clients"""
+    await utils.close_llm_clients()
+
+def _get_env_llm(prefix):
+    """Get the model set by <prefix>_MODEL (provider:model_name), None if it is not set"""
+    model_spec = os.getenv(f"{prefix}_MODEL", "")
+    if ":" not in model_spec:
+        return None
+    provider, model_name = model_spec.strip().split(":", 1)
+    return utils.get_llm_model(provider, model_name=model_name, temperature=0.0)
+
+_skill_store = None
+
+def get_skill_store():
+    """Get the skills learned from the successful runs, stored in SKILL_STORE_PATH, None if it is not set"""
+    global _skill_store
+    path = os.getenv("SKILL_STORE_PATH", "")
+    if not path:
+        return None
+    if _skill_store is None or _skill_store.path != path:
+        _skill_store = SkillStore(path)
+    return _skill_store
+
+_loop_lag_monitor = None
+
+def start_loop_lag_monitor():
+    """Flag the calls blocking the event loop longer than LOOP_LAG_THRESHOLD_MS, 0 disables"""
+    global _loop_lag_monitor
+    threshold_ms = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+    if threshold_ms > 0 and _loop_lag_monitor is None:
+        _loop_lag_monitor = EventLoopLagMonitor(threshold_ms=threshold_ms)
+        _loop_lag_monitor.start()
+
+def stop_loop_lag_monitor():
+    """Stop the monitor and the worker pools of the offloaded work"""
+    global _loop_lag_monitor
+    if _loop_lag_monitor is not None:
+        _loop_lag_monitor.stop()
+        _loop_lag_monitor = None
+    shutdown_pools()
+
+def get_loop_lag_stats() -> Dict[str, Any]:
+    """Get the event loop lag histogram and the number of blocking calls flagged"""
+    return _loop_lag_monitor.to_dict() if _loop_lag_monitor is not None else {}
+
+def get_step_latency_histograms() -> Dict[str, Any]:
+    """Get the per task and per model latency histograms of the agent step phases"""
+    return get_latency_histograms()
+
+def get_model_cascade_stats() -> Dict[str, Any]:
+    """Get the calls, hit rate and latency of the cascade tiers per model, and the escalations"""
+    return get_cascade_stats()
+
 async def periodic_screenshot_capture(browser_context, agent, on_update, interval=1.0):
     """Periodically capture screenshots and send them to the client"""
     try:
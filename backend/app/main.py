@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 
 from app.api.router import api_router
 from app.api.websocket import websocket_router
+from app.core.agent_runner import close_llm_clients, start_loop_lag_monitor, stop_loop_lag_monitor, \
+    warm_up_llm_models
 
 # Load environment variables
 load_dotenv()
@@ -44,6 +46,14 @@ async def startup_event():
     os.makedirs("./tmp/traces", exist_ok=True)
     os.makedirs("./tmp/agent_history", exist_ok=True)
     os.makedirs("./tmp/webui_settings", exist_ok=True)
+    # Open LLM connection pools before the first task arrives
+    await warm_up_llm_models()
+    start_loop_lag_monitor()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_loop_lag_monitor()
+    await close_llm_clients()
 
 # Mount static files for recordings
 app.mount("/recordings", StaticFiles(directory="./tmp/record_videos"), name="recordings")
@@ -25,6 +25,7 @@ class AgentRunRequest(BaseModel):
     max_input_tokens: int = Field(default=128000, description="Maximum input tokens")
     task: str = Field(description="Task description for the agent")
     add_infos: Optional[str] = Field(default="", description="Additional information for the agent")
+    resume_run_id: Optional[str] = Field(default=None, description="Run id of an interrupted run of the same task to resume from its last checkpoint")
 
 class ResearchRequest(BaseModel):
     """Request model for running a research task"""
@@ -17,6 +17,7 @@ class AgentStatusResponse(BaseModel):
     recording_path: Optional[str] = Field(default=None, description="Path to the recording")
     trace_path: Optional[str] = Field(default=None, description="Path to the trace file")
     history_path: Optional[str] = Field(default=None, description="Path to the agent history file")
+    run_id: Optional[str] = Field(default=None, description="Run id of the agent, to resume the run after a crash")
     screenshot: Optional[str] = Field(default=None, description="Base64 encoded screenshot")
     progress: float = Field(default=0.0, description="Progress of the task (0.0 to 1.0)")
 
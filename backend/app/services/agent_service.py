@@ -24,6 +24,7 @@ class AgentTask:
         self.recording_path = None
         self.trace_path = None
         self.history_path = None
+        self.run_id = None
         self.screenshot = None
         self.progress = 0.0
         self.task = None
@@ -166,6 +167,8 @@ class AgentService:
                 task_obj.model_actions = update["model_actions"]
             if "model_thoughts" in update:
                 task_obj.model_thoughts = update["model_thoughts"]
+            if "run_id" in update:
+                task_obj.run_id = update["run_id"]
             
             # Schedule notification to subscribers
             asyncio.create_task(self._notify_subscribers(task_id))
@@ -202,6 +205,7 @@ class AgentService:
                     "recording_path": task_obj.recording_path,
                     "trace_path": task_obj.trace_path,
                     "history_path": task_obj.history_path,
+                    "run_id": task_obj.run_id,
                     "screenshot": task_obj.screenshot,
                     "progress": task_obj.progress
                 }
@@ -225,6 +229,7 @@ class AgentService:
                 "recording_path": task_obj.recording_path,
                 "trace_path": task_obj.trace_path,
                 "history_path": task_obj.history_path,
+                "run_id": task_obj.run_id,
                 "screenshot": task_obj.screenshot,
                 "progress": task_obj.progress
             }
@@ -26,13 +26,11 @@ from browser_use.agent.views import (
     StepMetadata,
     ToolCallingMethod,
 )
-from browser_use.agent.gif import create_history_gif
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext
 from browser_use.browser.views import BrowserStateHistory
 from browser_use.controller.service import Controller
 from browser_use.telemetry.views import (
-    AgentEndTelemetryEvent,
     AgentRunTelemetryEvent,
     AgentStepTelemetryEvent,
 )
@@ -43,14 +41,36 @@ from langchain_core.messages import (
     HumanMessage,
     AIMessage
 )
+from langchain_core.messages.ai import UsageMetadata, add_usage
 from browser_use.browser.views import BrowserState, BrowserStateHistory
 from browser_use.agent.prompts import PlannerPrompt
 
+from browser_use.controller.registry.views import ActionModel
 from json_repair import repair_json
+from src.controller.custom_controller import CustomController
+from src.utils.agent_memory import AgentMemory
 from src.utils.agent_state import AgentState
+from src.utils.checkpoint import AgentCheckpoint, checkpoint_history_path, checkpoint_path, load_checkpoint, \
+    remove_checkpoint, save_checkpoint
+from src.utils.element_pruning import ElementPruner
+from src.utils.gif_recorder import GifRecorder
+from src.utils.history_store import BlobStore, HistoryReader, HistoryWriter, load_history
+from src.utils.hedging import HedgePolicy, backoff_delay, get_retry_after, is_rate_limit_error
+from src.utils.llm_cache import evict_cached_response
+from src.utils.loop_detection import ESCALATE, STOP, LoopDetector, LoopVerdict
+from src.utils.offload import run_in_thread
+from src.utils.model_cascade import FAST_TIER, PRIMARY_TIER, ModelCascade, get_model_name
+from src.utils.schema_cache import cached_output_model
+from src.utils.replay import is_done_action, replayable_actions, resolve_element, same_page
+from src.utils.prompt_cache import add_cache_breakpoints, get_cached_input_tokens, supports_cache_control
+from src.utils.screenshot import ScreenshotOptimizer, get_image_provider
+from src.utils.step_profiler import StepProfiler, record_step_timings
+from src.utils.stream_parser import AgentOutputStreamParser
+from src.utils.token_counter import get_token_counter
 
 from .custom_message_manager import CustomMessageManager, CustomMessageManagerSettings
-from .custom_views import CustomAgentOutput, CustomAgentStepInfo, CustomAgentState
+from .custom_views import CustomAgentEndTelemetryEvent, CustomAgentOutput, CustomAgentSettings, \
+    CustomAgentStepInfo, CustomAgentState, CustomStepMetadata
 
 logger = logging.getLogger(__name__)
 
@@ -80,7 +100,7 @@ class CustomAgent(Agent):
             save_conversation_path: Optional[str] = None,
             save_conversation_path_encoding: Optional[str] = 'utf-8',
             max_failures: int = 3,
-            retry_delay: int = 10,
+            retry_delay: int = 10,  # Upper bound of the backoff after a rate limit error
             system_prompt_class: Type[SystemPrompt] = SystemPrompt,
             agent_prompt_class: Type[AgentMessagePrompt] = AgentMessagePrompt,
             max_input_tokens: int = 128000,
@@ -105,6 +125,27 @@ class CustomAgent(Agent):
             page_extraction_llm: Optional[BaseChatModel] = None,
             planner_llm: Optional[BaseChatModel] = None,
             planner_interval: int = 1,  # Run planner every N steps
+            background_planner: bool = False,  # Plan concurrently with the actions, for the next step
+            llm_timeout: Optional[float] = None,  # Timeout in seconds for every LLM call
+            stream_actions: bool = False,  # Execute actions while the LLM response is streamed
+            token_counter: Optional[Callable[[str], int]] = None,  # Defaults to the tokenizer of the llm if known
+            compaction_llm: Optional[BaseChatModel] = None,  # Summarizes the history cut to fit max_input_tokens
+            summary_max_tokens: int = 1000,
+            cache_friendly_prompt: bool = False,  # Keep the prompt prefix stable for provider prompt caching
+            memory_max_tokens: int = 2000,
+            optimize_screenshots: bool = False,  # Skip unchanged screenshots and downscale the others
+            max_image_tokens: Optional[int] = None,  # Image token budget, defaults to one per provider
+            dom_delta: bool = False,  # Send the changes of the element list instead of the full list
+            max_element_tokens: Optional[int] = None,  # Keep the elements most relevant to the task within budget
+            cascade_llm: Optional[BaseChatModel] = None,  # Fast model tried first, llm answers the escalated steps
+            hedge_llm: Optional[BaseChatModel] = None,  # Also asked when the llm is slower than hedge_percentile
+            hedge_percentile: float = 90,
+            detect_loops: bool = False,  # Hint, escalate, then stop when the agent repeats itself
+            checkpoint_dir: Optional[str] = None,  # Save the run after every step, see resume_from_checkpoint()
+            gif_max_size: int = 1280,  # Longest side of the GIF frames in pixels
+            gif_max_frames: int = 100,  # Long runs drop every other frame above this
+            history_dir: Optional[str] = None,  # Append every step to <history_dir>/<agent_id>.jsonl
+            history_blob_dir: str = "./tmp/history_blobs",  # Screenshots and long contents of the jsonl histories
             # Inject state
             injected_agent_state: Optional[AgentState] = None,
             context: Context | None = None,
@@ -141,8 +182,51 @@ class CustomAgent(Agent):
             injected_agent_state=injected_agent_state,
             context=context,
         )
+        self.settings = CustomAgentSettings(
+            **dict(self.settings),
+            llm_timeout=llm_timeout,
+            stream_actions=stream_actions,
+            cache_friendly_prompt=cache_friendly_prompt,
+            memory_max_tokens=memory_max_tokens,
+            background_planner=background_planner,
+        )
         self.state = injected_agent_state or CustomAgentState()
         self.add_infos = add_infos
+        self._llm_task: Optional[asyncio.Task] = None
+        self._planner_task: Optional[asyncio.Task] = None
+        self._cascade = ModelCascade(cascade_llm, llm) if cascade_llm is not None else None
+        self._hedge_llm = hedge_llm
+        self._hedge = HedgePolicy(percentile=hedge_percentile) if hedge_llm is not None else None
+        self._loop_detector = LoopDetector(can_escalate=self._cascade is not None) if detect_loops else None
+        self._checkpoint_dir = checkpoint_dir
+        self._history_dir = history_dir
+        self._history_blobs = BlobStore(history_blob_dir)
+        self._history_writer: Optional[HistoryWriter] = None
+        # history of the checkpoints, appended step by step next to them
+        self._checkpoint_writer: Optional[HistoryWriter] = None
+        # frames rendered and appended to the GIF after every step
+        self._gif_recorder: Optional[GifRecorder] = None
+        if generate_gif:
+            self._gif_recorder = GifRecorder(
+                task=task,
+                output_path=generate_gif if isinstance(generate_gif, str) else 'agent_history.gif',
+                max_size=gif_max_size,
+                max_frames=gif_max_frames,
+            )
+        # checkpoint being resumed, applied to the step info when the run starts
+        self._resumed: Optional[AgentCheckpoint] = None
+        # notes for the next state message: loop warnings, replayed steps
+        self._state_notes: List[str] = []
+        # model answering the current step, the fast model of the cascade unless the step is escalated
+        self._step_llm: BaseChatModel = llm
+        self._step_tier: Optional[str] = None
+        if self._cascade is not None:
+            self._set_step_tier(FAST_TIER)
+        self._step_profiler = StepProfiler()
+        self._step_usage: Optional[UsageMetadata] = None
+        # results of the actions executed while streaming the answer of the current step
+        self._streamed_results: list[ActionResult] = []
+        token_counter = token_counter or get_token_counter(llm)
         self._message_manager = CustomMessageManager(
             task=task,
             system_message=self.settings.system_prompt_class(
@@ -155,7 +239,20 @@ class CustomAgent(Agent):
                 message_context=self.settings.message_context,
                 sensitive_data=sensitive_data,
                 available_file_paths=self.settings.available_file_paths,
-                agent_prompt_class=agent_prompt_class
+                agent_prompt_class=agent_prompt_class,
+                token_counter=token_counter,
+                compaction_llm=compaction_llm,
+                summary_max_tokens=summary_max_tokens,
+                cache_friendly_prompt=cache_friendly_prompt,
+                screenshot_optimizer=ScreenshotOptimizer(
+                    provider=get_image_provider(llm),
+                    max_image_tokens=max_image_tokens,
+                ) if optimize_screenshots else None,
+                dom_delta=dom_delta,
+                element_pruner=ElementPruner(
+                    max_tokens=max_element_tokens,
+                    token_counter=token_counter,
+                ) if max_element_tokens else None,
             ),
             state=self.state.message_manager_state,
         )
@@ -182,8 +279,8 @@ class CustomAgent(Agent):
         """Setup dynamic action models from controller's registry"""
         # Get the dynamic action model from controller's registry
         self.ActionModel = self.controller.registry.create_action_model()
-        # Create output model with the dynamic actions
-        self.AgentOutput = CustomAgentOutput.type_with_custom_actions(self.ActionModel)
+        # Create output model with the dynamic actions, once per action model
+        self.AgentOutput = cached_output_model(self.ActionModel, CustomAgentOutput.type_with_custom_actions)
 
     def update_step_info(
             self, model_output: CustomAgentOutput, step_info: CustomAgentStepInfo = None
@@ -196,37 +293,134 @@ class CustomAgent(Agent):
 
         step_info.step_number += 1
         important_contents = model_output.current_state.important_contents
-        if (
-                important_contents
-                and "None" not in important_contents
-                and important_contents not in step_info.memory
-        ):
-            step_info.memory += important_contents + "\n"
+        if important_contents and "None" not in important_contents:
+            step_info.memory_store.add(important_contents, step_info.step_number)
+            step_info.memory = step_info.memory_store.render()
+        step_info.next_goal = model_output.current_state.next_goal
 
-        logger.info(f"🧠 All Memory: \n{step_info.memory}")
+        logger.debug(f"🧠 Memory: {len(step_info.memory_store)} entries, {step_info.memory_store.tokens} tokens, "
+                     f"{step_info.memory_store.dropped} dropped")
 
-    @time_execution_async("--get_next_action")
-    async def get_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
-        """Get next action from LLM based on current state"""
-        fixed_input_messages = self._convert_input_messages(input_messages)
-        ai_message = self.llm.invoke(fixed_input_messages)
-        self.message_manager._add_message_with_tokens(ai_message)
+    def _start_llm_task(self, llm_coroutine: Awaitable[Any]) -> asyncio.Task:
+        """Run an llm call as a task bounded by llm_timeout, so that stop() can cancel it"""
+        self._llm_task = asyncio.create_task(asyncio.wait_for(llm_coroutine, timeout=self.settings.llm_timeout))
+        return self._llm_task
 
-        if hasattr(ai_message, "reasoning_content"):
-            logger.info("🤯 Start Deep Thinking: ")
-            logger.info(ai_message.reasoning_content)
-            logger.info("🤯 End Deep Thinking")
+    async def _wait_llm_task(self, llm_task: asyncio.Task) -> Any:
+        """Wait for an llm task, turning a stop() cancellation into InterruptedError"""
+        try:
+            return await llm_task
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'LLM call timed out after {self.settings.llm_timeout} seconds')
+        except asyncio.CancelledError:
+            # stop() cancelled the llm call, not the step itself
+            current_task = asyncio.current_task()
+            if llm_task.cancelled() and self.state.stopped and not (current_task and current_task.cancelling()):
+                raise InterruptedError
+            raise
+        finally:
+            if self._llm_task is llm_task:
+                self._llm_task = None
+
+    async def _ainvoke_llm(self, llm: BaseChatModel, input_messages: list[BaseMessage]) -> BaseMessage:
+        """
+        Call the llm without blocking the event loop.
+        The call is bounded by llm_timeout and is cancelled as soon as the agent is stopped.
+        """
+        return await self._wait_llm_task(self._start_llm_task(llm.ainvoke(input_messages)))
+
+    async def _ainvoke_and_load(self, llm: BaseChatModel, input_messages: list[BaseMessage]) \
+            -> tuple[BaseMessage, Optional[AgentOutput]]:
+        """Call the llm and validate its answer on the offload threads, the output is None if it does not parse"""
+        ai_message = await llm.ainvoke(input_messages)
+        try:
+            return ai_message, await run_in_thread(self._load_model_output, ai_message)
+        except Exception:
+            await run_in_thread(evict_cached_response, llm, input_messages)
+            return ai_message, None
+
+    async def _ainvoke_llm_hedged(self, input_messages: list[BaseMessage]) \
+            -> tuple[BaseMessage, Optional[AgentOutput]]:
+        """
+        Call the step llm, and the hedge llm too if the step llm has not answered by the hedge deadline
+        or failed before it. The first answer that parses wins and the other call is cancelled.
+        The messages are converted for each of the two models.
+        Returns the answer with its parsed output, None if no answer parsed.
+        """
+        (ai_message, loaded), from_hedge = await self._wait_llm_task(self._start_llm_task(self._hedge.race(
+            lambda: self._ainvoke_and_load(self._step_llm, self._convert_input_messages(input_messages)),
+            lambda: self._ainvoke_and_load(
+                self._hedge_llm, self._convert_input_messages(input_messages, self._hedge_llm)),
+            lambda answer: answer[1] is not None,
+        )))
+        if from_hedge:
+            logger.info("🏇 The hedge model answered first")
+        return ai_message, loaded
 
+    async def _handle_step_error(self, error: Exception) -> list[ActionResult]:
+        """Handle the step errors, backing off adaptively from rate limits instead of waiting retry_delay"""
+        if not is_rate_limit_error(error):
+            return await super()._handle_step_error(error)
+        error_msg = AgentError.format_error(error, include_trace=logger.isEnabledFor(logging.DEBUG))
+        self.state.consecutive_failures += 1
+        delay = backoff_delay(self.state.consecutive_failures, max_delay=self.settings.retry_delay,
+                              retry_after=get_retry_after(error))
+        logger.warning(f'❌ Result failed {self.state.consecutive_failures}/{self.settings.max_failures} times, '
+                       f'retrying in {delay:.1f}s:\n {error_msg}')
+        await asyncio.sleep(delay)
+        return [ActionResult(error=error_msg, include_in_memory=True)]
+
+    def stop(self) -> None:
+        """Stop the agent and interrupt the in-flight LLM call"""
+        super().stop()
+        if self._llm_task and not self._llm_task.done():
+            self._llm_task.cancel()
+        self._cancel_background_planner()
+
+    def _set_step_tier(self, tier: Optional[str]) -> None:
+        self._step_tier = tier
+        self._step_llm = self._cascade.llms[tier] if tier is not None else self.llm
+
+    def _select_step_llm(self, state: BrowserState) -> None:
+        """Pick the cascade tier answering the step from the outcome of the previous steps"""
+        if self._cascade is None:
+            return
+        last_output = self.state.history.history[-1].model_output if self.state.history.history else None
+        last_evaluation = last_output.current_state.evaluation_previous_goal if last_output else None
+        tier, _ = self._cascade.select(state, last_evaluation, self.state.consecutive_failures)
+        self._set_step_tier(tier)
+
+    def _convert_input_messages(self, input_messages: list[BaseMessage],
+                                llm: Optional[BaseChatModel] = None) -> list[BaseMessage]:
+        """
+        Convert input messages to the format of llm, the step llm by default,
+        with prompt cache breakpoints if enabled and supported by llm
+        """
+        llm = llm or self._step_llm
+        model_name = self.model_name if llm is self.llm else get_model_name(llm)
+        if model_name == 'deepseek-reasoner' or model_name.startswith('deepseek-r1'):
+            input_messages = convert_input_messages(input_messages, model_name)
+        if self.settings.cache_friendly_prompt and supports_cache_control(llm):
+            input_messages = add_cache_breakpoints(input_messages)
+        return input_messages
+
+    def _load_model_output(self, ai_message: BaseMessage) -> AgentOutput:
+        """Validate the llm response against the agent output model, without logging"""
         if isinstance(ai_message.content, list):
             ai_content = ai_message.content[0]
         else:
             ai_content = ai_message.content
 
+        ai_content = ai_content.replace("```json", "").replace("```", "")
+        ai_content = repair_json(ai_content)
+        parsed_json = json.loads(ai_content)
+        return self.AgentOutput(**parsed_json)
+
+    def _parse_model_output(self, ai_message: BaseMessage, parsed: Optional[AgentOutput] = None) -> AgentOutput:
+        """Parse the llm response into the agent output model, unless it was parsed already"""
         try:
-            ai_content = ai_content.replace("```json", "").replace("```", "")
-            ai_content = repair_json(ai_content)
-            parsed_json = json.loads(ai_content)
-            parsed: AgentOutput = self.AgentOutput(**parsed_json)
+            if parsed is None:
+                parsed = self._load_model_output(ai_message)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -243,46 +437,207 @@ class CustomAgent(Agent):
         self._log_response(parsed)
         return parsed
 
-    async def _run_planner(self) -> Optional[str]:
-        """Run the planner to analyze state and suggest next steps"""
-        # Skip planning if no planner_llm is set
-        if not self.settings.planner_llm:
-            return None
+    @time_execution_async("--get_next_action")
+    async def get_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
+        """Get next action from LLM based on current state"""
+        fixed_input_messages = self._convert_input_messages(input_messages)
+        llm_start_time = time.time()
+        loaded = None
+        with self._step_profiler.phase("llm"):
+            if self._hedge is not None:
+                # the hedged answers are parsed as they arrive to pick the first valid one
+                ai_message, loaded = await self._ainvoke_llm_hedged(input_messages)
+            else:
+                ai_message = await self._ainvoke_llm(self._step_llm, fixed_input_messages)
+        llm_seconds = time.time() - llm_start_time
+        self._step_usage = getattr(ai_message, "usage_metadata", None)
+        self.message_manager._add_message_with_tokens(ai_message)
 
-        # Create planner message history using full message history
-        planner_messages = [
-            PlannerPrompt(self.controller.registry.get_prompt_description()).get_system_message(),
-            *self.message_manager.get_messages()[1:],  # Use full message history except the first
-        ]
+        if hasattr(ai_message, "reasoning_content"):
+            logger.info("🤯 Start Deep Thinking: ")
+            logger.info(ai_message.reasoning_content)
+            logger.info("🤯 End Deep Thinking")
 
-        if not self.settings.use_vision_for_planner and self.settings.use_vision:
-            last_state_message: HumanMessage = planner_messages[-1]
-            # remove image from last state message
-            new_msg = ''
-            if isinstance(last_state_message.content, list):
-                for msg in last_state_message.content:
-                    if msg['type'] == 'text':
-                        new_msg += msg['text']
-                    elif msg['type'] == 'image_url':
-                        continue
-            else:
-                new_msg = last_state_message.content
+        with self._step_profiler.phase("parse"):
+            try:
+                if loaded is not None:
+                    parsed = self._parse_model_output(ai_message, loaded)
+                else:
+                    # json repair and validation of long outputs take milliseconds, keep the loop free for other agents
+                    parsed = await run_in_thread(self._parse_model_output, ai_message)
+            except ValueError:
+                # a cached answer that can't be parsed would be replayed by the retry
+                await run_in_thread(evict_cached_response, self._step_llm, fixed_input_messages)
+                if self._cascade is None:
+                    raise
+                self._cascade.record(self._step_tier, llm_seconds, valid=False)
+                if self._step_tier != FAST_TIER:
+                    raise
+                parsed = None
+        if parsed is None:
+            # the fast model could not answer, ask the primary model the same question
+            history = self.message_manager.state.history
+            history.remove_messages(len(history.messages) - 1, len(history.messages))
+            self._set_step_tier(PRIMARY_TIER)
+            self._cascade.escalate("parse_failure")
+            return await self.get_next_action(input_messages)
+        if self._cascade is not None:
+            self._cascade.record(self._step_tier, llm_seconds, valid=True)
+        return parsed
 
-            planner_messages[-1] = HumanMessage(content=new_msg)
+    @time_execution_async("--get_next_action_streaming")
+    async def get_next_action_streaming(
+            self, input_messages: list[BaseMessage]
+    ) -> tuple[AgentOutput, list[ActionResult]]:
+        """
+        Stream the LLM response and execute every action as soon as its JSON object is closed.
+        From the first action that can't be validated, the actions run once the response is fully parsed.
+        Returns the fully parsed output together with the results of the executed actions.
+        """
+        fixed_input_messages = self._convert_input_messages(input_messages)
+        action_queue: asyncio.Queue[Optional[ActionModel]] = asyncio.Queue()
+        parser = AgentOutputStreamParser()
+        dispatched = 0
 
-        # Get planner output
-        response = await self.settings.planner_llm.ainvoke(planner_messages)
-        plan = str(response.content)
+        async def stream_actions() -> str:
+            nonlocal dispatched
+            dispatching = True
+            try:
+                async for chunk in self._step_llm.astream(fixed_input_messages):
+                    if getattr(chunk, "usage_metadata", None):
+                        self._step_usage = add_usage(self._step_usage, chunk.usage_metadata)
+                    content = chunk.content
+                    if isinstance(content, list):
+                        content = "".join(c.get("text", "") if isinstance(c, dict) else str(c) for c in content)
+                    for action_json in parser.feed(content):
+                        if not dispatching:
+                            continue
+                        try:
+                            action = self.ActionModel(**action_json)
+                        except Exception as e:
+                            # the actions after it may depend on it, leave them all to the full parse
+                            logger.debug(f"Could not validate streamed action {action_json}: {e}")
+                            dispatching = False
+                            action_queue.put_nowait(None)
+                            continue
+                        action_queue.put_nowait(action)
+                        dispatched += 1
+                return parser.text
+            finally:
+                if dispatching:
+                    action_queue.put_nowait(None)
+
+        # the actions run while the response streams, the llm phase is the streaming time left after them
+        llm_start_time = time.time()
+        llm_task = self._start_llm_task(stream_actions())
+        try:
+            with self._step_profiler.phase("llm"):
+                with self._step_profiler.phase("multi_act"):
+                    result = await self.multi_act_streaming(action_queue)
+                self._streamed_results = result
+                ai_content = await self._wait_llm_task(llm_task)
+        finally:
+            if not llm_task.done():
+                llm_task.cancel()
+
+        llm_seconds = time.time() - llm_start_time
+        ai_message = AIMessage(content=ai_content)
+        self.message_manager._add_message_with_tokens(ai_message)
+        with self._step_profiler.phase("parse"):
+            try:
+                # json repair and validation of long outputs take milliseconds, keep the loop free for other agents
+                parsed = await run_in_thread(self._parse_model_output, ai_message)
+            except ValueError:
+                await run_in_thread(evict_cached_response, self._step_llm, fixed_input_messages)
+                # the actions may have run already, the step records their results with the error,
+                # and the next step is escalated by the failure instead
+                if self._cascade is not None:
+                    self._cascade.record(self._step_tier, llm_seconds, valid=False)
+                raise
+        if self._cascade is not None:
+            self._cascade.record(self._step_tier, llm_seconds, valid=True)
+        if action_queue.empty() and dispatched < len(parsed.action):
+            # every streamed action ran without ending the step, but the stream stopped at an action
+            # that could not be validated, or found none: execute the fully parsed actions from there
+            with self._step_profiler.phase("multi_act"):
+                result = result + await self.multi_act(parsed.action[dispatched:])
+        return parsed, result
+
+    @time_execution_async("--multi-act-streaming")
+    async def multi_act_streaming(self, action_queue: asyncio.Queue) -> list[ActionResult]:
+        """Execute actions from a queue filled by the LLM stream, until None is received"""
+        results = []
+
+        cached_selector_map = await self.browser_context.get_selector_map()
+        cached_path_hashes = set(e.hash.branch_path_hash for e in cached_selector_map.values())
+
+        await self.browser_context.remove_highlights()
+
+        i = 0
+        while i < self.settings.max_actions_per_step:
+            action = await action_queue.get()
+            if action is None:
+                break
+            if i != 0:
+                await asyncio.sleep(self.browser_context.config.wait_between_actions)
+            if action.get_index() is not None and i != 0:
+                new_state = await self.browser_context.get_state()
+                new_path_hashes = set(e.hash.branch_path_hash for e in new_state.selector_map.values())
+                if not new_path_hashes.issubset(cached_path_hashes):
+                    # next action requires index but there are new elements on the page
+                    msg = f'Something new appeared after action {i}'
+                    logger.info(msg)
+                    results.append(ActionResult(extracted_content=msg, include_in_memory=True))
+                    break
+
+            await self._raise_if_stopped_or_paused()
+
+            result = await self.controller.act(
+                action,
+                self.browser_context,
+                self.settings.page_extraction_llm,
+                self.sensitive_data,
+                self.settings.available_file_paths,
+                context=self.context,
+            )
+            results.append(result)
+
+            logger.debug(f'Executed streamed action {i + 1}')
+            i += 1
+            if result.is_done or result.error:
+                break
+
+        return results
+
+    def _strip_planner_images(self, message: BaseMessage) -> BaseMessage:
+        """Text of a state message, without its screenshot unless the planner uses vision"""
+        if self.settings.use_vision_for_planner or not self.settings.use_vision:
+            return message
+        # remove image from last state message
+        new_msg = ''
+        if isinstance(message.content, list):
+            for msg in message.content:
+                if msg['type'] == 'text':
+                    new_msg += msg['text']
+                elif msg['type'] == 'image_url':
+                    continue
+        else:
+            new_msg = message.content
+        return HumanMessage(content=new_msg)
+
+    def _append_to_state_message(self, text: str) -> None:
+        """Append a text to the current state message"""
         last_state_message = self.message_manager.get_messages()[-1]
         if isinstance(last_state_message, HumanMessage):
-            # remove image from last state message
             if isinstance(last_state_message.content, list):
                 for msg in last_state_message.content:
                     if msg['type'] == 'text':
-                        msg['text'] += f"\nPlanning Agent outputs plans:\n {plan}\n"
+                        msg['text'] += text
             else:
-                last_state_message.content += f"\nPlanning Agent outputs plans:\n {plan}\n "
+                last_state_message.content += text
+            self.message_manager.update_message_tokens(-1)
 
+    def _log_plan(self, plan: str, response: BaseMessage) -> None:
         try:
             plan_json = json.loads(plan.replace("```json", "").replace("```", ""))
             logger.info(f'📋 Plans:\n{json.dumps(plan_json, indent=4)}')
@@ -297,8 +652,76 @@ class CustomAgent(Agent):
         except Exception as e:
             logger.debug(f'Error parsing planning analysis: {e}')
             logger.info(f'📋 Plans: {plan}')
+
+    async def _run_planner(self) -> Optional[str]:
+        """Run the planner to analyze state and suggest next steps"""
+        # Skip planning if no planner_llm is set
+        if not self.settings.planner_llm:
+            return None
+
+        # Create planner message history using full message history
+        planner_messages = [
+            PlannerPrompt(self.controller.registry.get_prompt_description()).get_system_message(),
+            *self.message_manager.get_messages()[1:],  # Use full message history except the first
+        ]
+        planner_messages[-1] = self._strip_planner_images(planner_messages[-1])
+
+        # Get planner output
+        response = await self._ainvoke_llm(self.settings.planner_llm, planner_messages)
+        plan = str(response.content)
+        self._append_to_state_message(f"\nPlanning Agent outputs plans:\n {plan}\n")
+        self._log_plan(plan, response)
         return plan
 
+    def _start_background_planner(self, state_message: BaseMessage, model_output: AgentOutput) -> None:
+        """
+        Plan the next steps while the actions of model_output execute.
+        The planner only sees the current state and output, the memory in the state message carries the rest.
+        """
+        if self._planner_task is not None and not self._planner_task.done():
+            # the previous plan is still being made, the steps don't wait for it
+            return
+        planner_messages = [
+            PlannerPrompt(self.controller.registry.get_prompt_description()).get_system_message(),
+            self._strip_planner_images(state_message),
+            AIMessage(content=model_output.model_dump_json(exclude_unset=True)),
+            HumanMessage(content="The actions above are being executed. Plan the next steps."),
+        ]
+        self._planner_task = asyncio.create_task(asyncio.wait_for(
+            self.settings.planner_llm.ainvoke(planner_messages), timeout=self.settings.llm_timeout))
+
+    def _add_background_plan(self) -> None:
+        """Add the plan made during the previous steps to the current state message, if it is ready"""
+        planner_task = self._planner_task
+        if planner_task is None or not planner_task.done():
+            return
+        self._planner_task = None
+        if planner_task.cancelled():
+            return
+        if planner_task.exception() is not None:
+            logger.warning(f"⚠️ Background planner failed: {planner_task.exception()!r}")
+            return
+        response = planner_task.result()
+        plan = str(response.content)
+        self.state.last_plan = plan
+        self._append_to_state_message(f"\nPlanning Agent outputs plans:\n {plan}\n")
+        self._log_plan(plan, response)
+
+    def _cancel_background_planner(self) -> None:
+        if self._planner_task is not None and not self._planner_task.done():
+            self._planner_task.cancel()
+
+    def _handle_loop(self, verdict: Optional[LoopVerdict]) -> None:
+        """Respond to a loop detected by the loop detector"""
+        if verdict is None:
+            return
+        if verdict.response == STOP:
+            self.state.stop_reason = f"Stopped early, the agent is stuck ({verdict.reason}): {verdict.message}"
+            return
+        if verdict.response == ESCALATE:
+            self._cascade.force_primary(verdict.reason)
+        self._state_notes.append(f"Warning: {verdict.message}")
+
     @time_execution_async("--step")
     async def step(self, step_info: Optional[CustomAgentStepInfo] = None) -> None:
         """Execute one step of the task"""
@@ -308,23 +731,49 @@ class CustomAgent(Agent):
         result: list[ActionResult] = []
         step_start_time = time.time()
         tokens = 0
+        profiler = self._step_profiler = StepProfiler()
+        self._step_usage = None
+        self._streamed_results = []
 
         try:
-            state = await self.browser_context.get_state()
+            with profiler.phase("get_state"):
+                state = await self.browser_context.get_state()
             await self._raise_if_stopped_or_paused()
 
-            self.message_manager.add_state_message(state, self.state.last_action, self.state.last_result, step_info,
-                                                   self.settings.use_vision)
+            with profiler.phase("add_state_message"):
+                await self.message_manager.prepare_screenshot(state, self.settings.use_vision)
+                self.message_manager.add_state_message(state, self.state.last_action, self.state.last_result,
+                                                       step_info, self.settings.use_vision)
+            self._select_step_llm(state)
+
+            for note in self._state_notes:
+                self._append_to_state_message(f"\n{note}\n")
+            self._state_notes = []
+            skills = self.controller.describe_skills(state.url) if isinstance(self.controller, CustomController) \
+                else ""
+            if skills:
+                self._append_to_state_message(f"\nSkills for this site, run them with use_skill:\n{skills}\n")
 
             # Run planner at specified intervals if planner is configured
-            if self.settings.planner_llm and self.state.n_steps % self.settings.planner_interval == 0:
-                await self._run_planner()
+            if self.settings.planner_llm and self.settings.background_planner:
+                self._add_background_plan()
+            elif self.settings.planner_llm and self.state.n_steps % self.settings.planner_interval == 0:
+                with profiler.phase("planner"):
+                    await self._run_planner()
+            self.message_manager.cut_messages()
             input_messages = self.message_manager.get_messages()
             tokens = self._message_manager.state.history.current_tokens
 
+            state_message_removed = False
             try:
-                model_output = await self.get_next_action(input_messages)
+                if self.settings.stream_actions:
+                    model_output, result = await self.get_next_action_streaming(input_messages)
+                else:
+                    model_output = await self.get_next_action(input_messages)
                 self.update_step_info(model_output, step_info)
+                if (self.settings.planner_llm and self.settings.background_planner
+                        and self.state.n_steps % self.settings.planner_interval == 0):
+                    self._start_background_planner(input_messages[-1], model_output)
                 self.state.n_steps += 1
 
                 if self.register_new_step_callback:
@@ -332,34 +781,40 @@ class CustomAgent(Agent):
 
                 if self.settings.save_conversation_path:
                     target = self.settings.save_conversation_path + f'_{self.state.n_steps}.txt'
-                    save_conversation(input_messages, model_output, target,
-                                      self.settings.save_conversation_path_encoding)
+                    await run_in_thread(save_conversation, input_messages, model_output, target,
+                                        self.settings.save_conversation_path_encoding)
 
                 if self.model_name != "deepseek-reasoner":
                     # remove prev message
                     self.message_manager._remove_state_message_by_index(-1)
+                    state_message_removed = True
                 await self._raise_if_stopped_or_paused()
             except Exception as e:
                 # model call failed, remove last state message from history
-                self.message_manager._remove_state_message_by_index(-1)
+                if not state_message_removed:
+                    self.message_manager._remove_state_message_by_index(-1)
                 raise e
 
-            result: list[ActionResult] = await self.multi_act(model_output.action)
+            if not self.settings.stream_actions:
+                with profiler.phase("multi_act"):
+                    result = await self.multi_act(model_output.action)
+            made_progress = False
             for ret_ in result:
                 if ret_.extracted_content and "Extracted page" in ret_.extracted_content:
                     # record every extracted page
-                    if ret_.extracted_content[:100] not in self.state.extracted_content:
-                        self.state.extracted_content += ret_.extracted_content
+                    made_progress |= self.state.add_extracted_page(ret_.extracted_content, state.url)
             self.state.last_result = result
             self.state.last_action = model_output.action
             if len(result) > 0 and result[-1].is_done:
-                if not self.state.extracted_content:
-                    self.state.extracted_content = step_info.memory
-                result[-1].extracted_content = self.state.extracted_content
+                result[-1].extracted_content = self.state.get_extracted_content() or step_info.memory
                 logger.info(f"📄 Result: {result[-1].extracted_content}")
 
             self.state.consecutive_failures = 0
 
+            if self._loop_detector is not None:
+                actions = [a.model_dump(exclude_unset=True) for a in model_output.action]
+                self._handle_loop(self._loop_detector.observe(state, actions, made_progress))
+
         except InterruptedError:
             logger.debug('Agent paused')
             self.state.last_result = [
@@ -371,35 +826,285 @@ class CustomAgent(Agent):
             return
 
         except Exception as e:
-            result = await self._handle_step_error(e)
+            # the actions streamed before the failure ran, their results belong to the step too
+            result = self._streamed_results + await self._handle_step_error(e)
             self.state.last_result = result
 
         finally:
             step_end_time = time.time()
-            actions = [a.model_dump(exclude_unset=True) for a in model_output.action] if model_output else []
-            self.telemetry.capture(
-                AgentStepTelemetryEvent(
-                    agent_id=self.state.agent_id,
-                    step=self.state.n_steps,
-                    actions=actions,
-                    consecutive_failures=self.state.consecutive_failures,
-                    step_error=[r.error for r in result if r.error] if result else ['No result'],
+            with profiler.phase("history"):
+                actions = [a.model_dump(exclude_unset=True) for a in model_output.action] if model_output else []
+                self.telemetry.capture(
+                    AgentStepTelemetryEvent(
+                        agent_id=self.state.agent_id,
+                        step=self.state.n_steps,
+                        actions=actions,
+                        consecutive_failures=self.state.consecutive_failures,
+                        step_error=[r.error for r in result if r.error] if result else ['No result'],
+                    )
                 )
+                metadata = None
+                if result and state:
+                    metadata = CustomStepMetadata(
+                        step_number=self.state.n_steps,
+                        step_start_time=step_start_time,
+                        step_end_time=step_end_time,
+                        input_tokens=tokens,
+                    )
+                    metadata.cached_input_tokens, metadata.uncached_input_tokens = \
+                        get_cached_input_tokens(self._step_usage)
+                    metadata.llm_tier = self._step_tier
+                    if metadata.cached_input_tokens is not None:
+                        logger.info(f"💾 Input tokens: {metadata.cached_input_tokens} cached, "
+                                    f"{metadata.uncached_input_tokens} uncached")
+                    self._make_history_item(model_output, state, result, metadata)
+            profiler.timings["step"] = time.time() - step_start_time
+            if metadata:
+                metadata.phase_timings.update(profiler.timings)
+            model_name = self.model_name
+            if self._cascade is not None:
+                model_name = getattr(self._step_llm, "model_name", None) or getattr(self._step_llm, "model", None) \
+                             or f"{self.model_name}:{self._step_tier}"
+            record_step_timings(self.state.agent_id, model_name, profiler.timings)
+            # summarize the messages cut from the history while the next step starts
+            self.message_manager.start_compaction()
+            logger.debug(f"⏱️ Step phases: {json.dumps({k: round(v, 3) for k, v in profiler.timings.items()})}")
+
+    async def _replay_step(self, history_item: AgentHistory, replay_done: bool) -> Optional[str]:
+        """Re-execute the actions of a saved step, returns why the page diverged from the saved run, if it did"""
+        actions = replayable_actions(history_item)
+        if not replay_done and any(is_done_action(a) for a in actions):
+            return "the final answer is left to the live agent"
+        step_start_time = time.time()
+        state = await self.browser_context.get_state()
+        if not same_page(state.url, history_item.state.url):
+            return f"expected {history_item.state.url}, found {state.url}"
+
+        first_state = state
+        executed_actions: list[ActionModel] = []
+        results: list[ActionResult] = []
+        divergence = None
+        for i, action in enumerate(actions):
+            action = action.model_copy(deep=True)
+            if i != 0:
+                await asyncio.sleep(self.browser_context.config.wait_between_actions)
+                state = await self.browser_context.get_state()
+            interacted = history_item.state.interacted_element
+            historical_element = interacted[i] if interacted and i < len(interacted) else None
+            if action.get_index() is not None and historical_element is not None:
+                element = resolve_element(historical_element, state)
+                if element is None:
+                    divergence = f"element <{historical_element.tag_name}> {historical_element.xpath} not found"
+                    break
+                if element.highlight_index != action.get_index():
+                    logger.debug(f"Element moved, index {action.get_index()} -> {element.highlight_index}")
+                    action.set_index(element.highlight_index)
+            await self._raise_if_stopped_or_paused()
+            result = await self.controller.act(
+                action,
+                self.browser_context,
+                self.settings.page_extraction_llm,
+                self.sensitive_data,
+                self.settings.available_file_paths,
+                context=self.context,
             )
-            if not result:
-                return
-
-            if state:
-                metadata = StepMetadata(
-                    step_number=self.state.n_steps,
-                    step_start_time=step_start_time,
-                    step_end_time=step_end_time,
-                    input_tokens=tokens,
-                )
-                self._make_history_item(model_output, state, result, metadata)
+            executed_actions.append(action)
+            results.append(result)
+            if result.extracted_content and "Extracted page" in result.extracted_content:
+                self.state.add_extracted_page(result.extracted_content, state.url)
+            if result.error:
+                divergence = f"action failed: {result.error}"
+                break
+
+        if executed_actions:
+            model_output = history_item.model_output.model_copy(update={"action": executed_actions})
+            self._make_history_item(model_output, first_state, results, CustomStepMetadata(
+                step_number=self.state.n_steps,
+                step_start_time=step_start_time,
+                step_end_time=time.time(),
+                input_tokens=0,
+                replayed=True,
+            ))
+            self.state.n_steps += 1
+            self.state.last_action = executed_actions
+            self.state.last_result = results
+        return divergence
+
+    async def replay(self, history: AgentHistoryList | str, max_steps: int = 100,
+                     replay_done: bool = False) -> AgentHistoryList:
+        """
+        Re-execute the actions of a saved history without calling the llm, resolving the elements again
+        when their indices shifted. From the first step that diverges, the live agent continues the task.
+        The final done step is left to the live agent unless replay_done is set, so that the answer is fresh.
+        """
+        replayed_goals = []
+        try:
+            if isinstance(history, str):
+                history = await run_in_thread(load_history, history, self.AgentOutput, self._history_blobs.directory)
+            if self.initial_actions:
+                self.state.last_result = await self.multi_act(self.initial_actions, check_for_new_elements=False)
+                self.initial_actions = None
+
+            for i, history_item in enumerate(history.history):
+                if not replayable_actions(history_item):
+                    # the step failed in the saved run, nothing to replay
+                    continue
+                divergence = await self._replay_step(history_item, replay_done)
+                if divergence is not None:
+                    logger.info(f"🎬 Replay stopped at step {i + 1}/{len(history.history)}: {divergence}")
+                    break
+                replayed_goals.append(history_item.model_output.current_state.next_goal)
+        except BaseException:
+            # run() won't be reached to close them
+            await self._close()
+            raise
+        logger.info(f"🎬 Replayed {len(replayed_goals)} steps without the llm")
+
+        if replayed_goals and not self.state.history.is_done():
+            self._state_notes.append("These goals were already reached by replaying a previous run of the task: "
+                                     + "; ".join(replayed_goals))
+        return await self.run(max_steps=max(max_steps - len(replayed_goals), 1))
+
+    def _make_history_item(
+            self,
+            model_output: AgentOutput | None,
+            state: BrowserState,
+            result: list[ActionResult],
+            metadata: Optional[StepMetadata] = None,
+    ) -> None:
+        super()._make_history_item(model_output, state, result, metadata)
+        if self._gif_recorder is not None:
+            self._gif_recorder.add_step(self.state.history.history[-1])
+        if self._history_dir:
+            # the last step is written with the next one, run() may still add its final result
+            self._get_history_writer().write_new(self.state.history.history[:-1])
+
+    @property
+    def history_path(self) -> Optional[str]:
+        """JSONL history of the run, None unless history_dir is set"""
+        if not self._history_dir:
+            return None
+        return os.path.join(self._history_dir, f"{self.state.agent_id}.jsonl")
+
+    def _get_history_writer(self) -> HistoryWriter:
+        # opened on first use, a resumed run continues the file of its agent id
+        if self._history_writer is None or self._history_writer.path != self.history_path:
+            self._history_writer = HistoryWriter(self.history_path, self._history_blobs)
+        return self._history_writer
+
+    async def _close_checkpoint_writer(self) -> None:
+        if self._checkpoint_writer is not None:
+            await run_in_thread(self._checkpoint_writer.close)
+            self._checkpoint_writer = None
+
+    async def _close_history_writer(self) -> None:
+        if self._history_dir:
+            writer = self._get_history_writer()
+            writer.write_new(self.state.history.history)
+            await run_in_thread(writer.close)
+            self._history_writer = None
+
+    def _dump_state(self) -> Dict[str, Any]:
+        """The agent state as json without its history, with the actions dumped by their own action models"""
+        state = self.state.model_dump(mode="json", exclude={"history", "last_action", "message_manager_state"})
+        state["last_action"] = [a.model_dump(exclude_unset=True) for a in self.state.last_action] \
+            if self.state.last_action else None
+        state["message_manager_state"] = self.state.message_manager_state.model_dump(mode="json")
+        return state
+
+    def _load_state(self, data: Dict[str, Any], history: List[AgentHistory]) -> CustomAgentState:
+        data = json.loads(json.dumps(data))
+        last_action = data.pop("last_action", None)
+        state = CustomAgentState.model_validate(data)
+        state.history = AgentHistoryList(history=history)
+        state.last_action = [self.ActionModel.model_validate(a) for a in last_action] if last_action else None
+        state.paused = state.stopped = False
+        return state
+
+    def _get_checkpoint_writer(self) -> HistoryWriter:
+        path = checkpoint_history_path(self._checkpoint_path)
+        if self._checkpoint_writer is None or self._checkpoint_writer.path != path:
+            self._checkpoint_writer = HistoryWriter(path, self._history_blobs)
+        return self._checkpoint_writer
+
+    @property
+    def _checkpoint_path(self) -> str:
+        return checkpoint_path(self._checkpoint_dir, self.task, self.state.agent_id)
+
+    async def _save_checkpoint(self, step_info: CustomAgentStepInfo, steps_done: int) -> None:
+        """
+        Save the state after a completed step, with the cookies and the url to restore the browser.
+        Only the new steps of the history are written, appended to the JSONL file of the checkpoint.
+        """
+        session = await self.browser_context.get_session()
+        page = await self.browser_context.get_current_page()
+        writer = self._get_checkpoint_writer()
+        writer.write_new(self.state.history.history)
+        await run_in_thread(writer.flush)
+        checkpoint = AgentCheckpoint(
+            task=self.task,
+            add_infos=self.add_infos,
+            max_steps=step_info.max_steps,
+            steps_done=steps_done,
+            step_number=step_info.step_number,
+            next_goal=step_info.next_goal,
+            memory=[(entry.text, entry.step) for entry in step_info.memory_store.entries.values()],
+            url=page.url,
+            cookies=await session.context.cookies(),
+            state=self._dump_state(),
+            history_steps=writer.steps,
+            history_blob_dir=self._history_blobs.directory,
+        )
+        path = self._checkpoint_path
+        await run_in_thread(save_checkpoint, checkpoint, path)
+        logger.debug(f"💾 Checkpoint saved to {path}")
+
+    async def resume_from_checkpoint(self, checkpoint: AgentCheckpoint | str,
+                                     max_steps: Optional[int] = None) -> AgentHistoryList:
+        """
+        Continue a run from its checkpoint: restore the agent state, the memory, the cookies and the page,
+        then run the steps left of max_steps, the limit of the interrupted run by default.
+        The agent must be created with the same task, controller and settings.
+        """
+        if isinstance(checkpoint, str):
+            path = checkpoint
+            checkpoint = load_checkpoint(path)
+        else:
+            path = checkpoint_path(self._checkpoint_dir, checkpoint.task, checkpoint.state["agent_id"])
+        history_path = checkpoint_history_path(path)
+        history = []
+        if checkpoint.history_steps:
+            reader = HistoryReader(history_path, BlobStore(checkpoint.history_blob_dir))
+            history = await run_in_thread(reader.read, self.AgentOutput, 0, checkpoint.history_steps,
+                                          metadata_model=CustomStepMetadata)
+        self.state = self._load_state(checkpoint.state, history)
+        if self._checkpoint_dir:
+            # the steps written after the checkpoint was saved are done again
+            await run_in_thread(self._get_checkpoint_writer().truncate, checkpoint.history_steps)
+        self.message_manager.restore_state(self.state.message_manager_state)
+        if self._gif_recorder is not None:
+            for history_item in self.state.history.history:
+                self._gif_recorder.add_step(history_item)
+        # the initial actions ran before the checkpoint
+        self.initial_actions = None
+
+        session = await self.browser_context.get_session()
+        if checkpoint.cookies:
+            await session.context.add_cookies(checkpoint.cookies)
+        if checkpoint.url and checkpoint.url != "about:blank":
+            await self.browser_context.navigate_to(checkpoint.url)
+        logger.info(f"💾 Resuming {self.state.agent_id} after {checkpoint.steps_done}/{checkpoint.max_steps} steps "
+                    f"on {checkpoint.url}")
+
+        if max_steps is not None:
+            checkpoint = checkpoint.model_copy(update={"max_steps": max_steps})
+        self._resumed = checkpoint
+        return await self.run(max_steps=max(checkpoint.max_steps - checkpoint.steps_done, 1))
 
     async def run(self, max_steps: int = 100) -> AgentHistoryList:
         """Execute the task with maximum number of steps"""
+        steps_taken = 0
+        self.state.steps_saved = 0
         try:
             self._log_agent_run()
 
@@ -414,7 +1119,25 @@ class CustomAgent(Agent):
                 step_number=1,
                 max_steps=max_steps,
                 memory="",
+                memory_store=AgentMemory(
+                    max_tokens=self.settings.memory_max_tokens,
+                    token_counter=self.message_manager.settings.token_counter,
+                ),
             )
+            steps_before = 0
+            if self._resumed is not None:
+                step_info.max_steps = self._resumed.max_steps
+                step_info.step_number = self._resumed.step_number
+                step_info.next_goal = self._resumed.next_goal
+                for text, step in self._resumed.memory:
+                    step_info.memory_store.add(text, step)
+                step_info.memory = step_info.memory_store.render()
+                steps_before = self._resumed.steps_done
+                self._resumed = None
+
+            if self.state.history.is_done():
+                # a replayed history completed the task already
+                return self.state.history
 
             for step in range(max_steps):
                 # Check if we should stop due to too many failures
@@ -433,6 +1156,21 @@ class CustomAgent(Agent):
                         break
 
                 await self.step(step_info)
+                steps_taken += 1
+                if self._checkpoint_dir:
+                    try:
+                        await self._save_checkpoint(step_info, steps_before + step + 1)
+                    except Exception as e:
+                        logger.warning(f"Failed to save the checkpoint: {e}")
+
+                if self.state.stop_reason and not self.state.history.is_done():
+                    logger.error(f"❌ {self.state.stop_reason}")
+                    self.state.steps_saved = max_steps - step - 1
+                    self.state.history.history[-1].result.append(ActionResult(
+                        error=self.state.stop_reason,
+                        extracted_content=self.state.get_extracted_content() or step_info.memory,
+                    ))
+                    break
 
                 if self.state.history.is_done():
                     if self.settings.validate_output and step < max_steps - 1:
@@ -443,36 +1181,55 @@ class CustomAgent(Agent):
                     break
             else:
                 logger.info("❌ Failed to complete task in maximum steps")
-                if not self.state.extracted_content:
-                    self.state.history.history[-1].result[-1].extracted_content = step_info.memory
-                else:
-                    self.state.history.history[-1].result[-1].extracted_content = self.state.extracted_content
+                self.state.history.history[-1].result[-1].extracted_content = \
+                    self.state.get_extracted_content() or step_info.memory
 
+            if self._checkpoint_dir:
+                # the run ended, nothing left to resume
+                await self._close_checkpoint_writer()
+                await run_in_thread(remove_checkpoint, self._checkpoint_path)
             return self.state.history
 
         finally:
+            self.message_manager.cancel_compaction()
+            self._cancel_background_planner()
+            if self.message_manager.settings.screenshot_optimizer is not None:
+                self.message_manager.settings.screenshot_optimizer.log_stats()
+            if self.message_manager.dom_delta is not None:
+                self.message_manager.dom_delta.log_stats()
+            if self.message_manager.settings.element_pruner is not None:
+                self.message_manager.settings.element_pruner.log_stats()
+            if self._cascade is not None:
+                self._cascade.log_stats()
+            if self._hedge is not None:
+                self._hedge.log_stats()
+            if self.state.steps_saved:
+                logger.info(f"🔁 Loop detection saved {self.state.steps_saved} steps")
             self.telemetry.capture(
-                AgentEndTelemetryEvent(
+                CustomAgentEndTelemetryEvent(
                     agent_id=self.state.agent_id,
                     is_done=self.state.history.is_done(),
                     success=self.state.history.is_successful(),
                     steps=self.state.n_steps,
-                    max_steps_reached=self.state.n_steps >= max_steps,
+                    # n_steps also counts the steps of a resumed or replayed run
+                    max_steps_reached=steps_taken >= max_steps,
+                    steps_saved=self.state.steps_saved,
                     errors=self.state.history.errors(),
                     total_input_tokens=self.state.history.total_input_tokens(),
                     total_duration_seconds=self.state.history.total_duration_seconds(),
                 )
             )
+            await self._close()
 
-            if not self.injected_browser_context:
-                await self.browser_context.close()
-
-            if not self.injected_browser and self.browser:
-                await self.browser.close()
+    async def _close(self) -> None:
+        """Close the browser unless it was injected, flush the history and checkpoint writers and the GIF"""
+        if not self.injected_browser_context:
+            await self.browser_context.close()
 
-            if self.settings.generate_gif:
-                output_path: str = 'agent_history.gif'
-                if isinstance(self.settings.generate_gif, str):
-                    output_path = self.settings.generate_gif
+        if not self.injected_browser and self.browser:
+            await self.browser.close()
 
-                create_history_gif(task=self.task, history=self.state.history, output_path=output_path)
+        await self._close_history_writer()
+        await self._close_checkpoint_writer()
+        if self._gif_recorder is not None:
+            await self._gif_recorder.finish()
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import pdb
-from typing import List, Optional, Type, Dict
+from typing import Callable, List, Optional, Type, Dict
 
 from browser_use.agent.message_manager.service import MessageManager
-from browser_use.agent.message_manager.views import MessageHistory
+from browser_use.agent.message_manager.views import ManagedMessage, MessageHistory, MessageMetadata
 from browser_use.agent.prompts import SystemPrompt, AgentMessagePrompt
 from browser_use.agent.views import ActionResult, AgentStepInfo, ActionModel
 from browser_use.browser.views import BrowserState
@@ -22,7 +23,12 @@ from langchain_core.messages import (
     SystemMessage
 )
 from langchain_openai import ChatOpenAI
+from pydantic import ConfigDict, PrivateAttr
 from ..utils.llm import DeepSeekR1ChatOpenAI
+from ..utils.dom_delta import DOM_BASE_MESSAGE_ID, DomDeltaTracker
+from ..utils.element_pruning import ElementPruner
+from ..utils.offload import run_in_thread
+from ..utils.screenshot import SCREENSHOT_MESSAGE_ID, ScreenshotOptimizer
 from .custom_prompts import CustomAgentMessagePrompt
 
 logger = logging.getLogger(__name__)
@@ -30,6 +36,126 @@ logger = logging.getLogger(__name__)
 
 class CustomMessageManagerSettings(MessageManagerSettings):
     agent_prompt_class: Type[AgentMessagePrompt] = AgentMessagePrompt
+    # counts the tokens of a text, None estimates them from estimated_characters_per_token
+    token_counter: Optional[Callable[[str], int]] = None
+    # cheap model folding the messages evicted by cut_messages into a summary, None drops them
+    compaction_llm: Optional[BaseChatModel] = None
+    summary_max_tokens: int = 1000
+    # let the agent prompt class put the per-step fields at the end of the state message
+    cache_friendly_prompt: bool = False
+    # deduplicates and downscales the screenshots of the state messages
+    screenshot_optimizer: Optional[ScreenshotOptimizer] = None
+    # pin the element list of a page in the history and send only its changes in the state messages
+    dom_delta: bool = False
+    # keeps the elements of large pages most relevant to the task within a token budget
+    element_pruner: Optional[ElementPruner] = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+SUMMARY_MESSAGE_ID = "history_summary"
+# messages the state messages refer to, kept when the oldest messages are cut
+PINNED_MESSAGE_IDS = (DOM_BASE_MESSAGE_ID, SCREENSHOT_MESSAGE_ID)
+
+SUMMARY_PROMPT = """You compact the history of a browser automation agent.
+You get the current summary of the earlier steps and the messages that no longer fit in the context.
+Write an updated summary that keeps everything the agent needs to continue its task without repeating work:
+pages visited, actions done and their outcome, information found, and what remains to be done.
+Drop greetings, reasoning that led nowhere and repeated content.
+Answer with the summary only, in at most {max_tokens} tokens."""
+
+
+class CustomMessageHistory(MessageHistory):
+    """
+    Message history keeping the positions of its human messages,
+    so that the latest state message is found and removed without scanning the history.
+    """
+
+    _human_indices: List[int] = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context) -> None:
+        super().model_post_init(__context)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._human_indices = [i for i, m in enumerate(self.messages) if isinstance(m.message, HumanMessage)]
+
+    def add_message(self, message: BaseMessage, metadata: MessageMetadata, position: int | None = None) -> None:
+        """Add message with metadata to history"""
+        if position is None:
+            if isinstance(message, HumanMessage):
+                self._human_indices.append(len(self.messages))
+            self.messages.append(ManagedMessage(message=message, metadata=metadata))
+        else:
+            self.messages.insert(position, ManagedMessage(message=message, metadata=metadata))
+            self._reindex()
+        self.current_tokens += metadata.tokens
+
+    def update_tokens(self, index: int, tokens: int) -> None:
+        """Update the cached token count of a message whose content changed"""
+        self.current_tokens += tokens - self.messages[index].metadata.tokens
+        self.messages[index].metadata.tokens = tokens
+
+    def remove_messages(self, start: int, end: int) -> None:
+        """Remove the messages[start:end] slice at once"""
+        end = min(end, len(self.messages))
+        if start >= end:
+            return
+        self.current_tokens -= sum(m.metadata.tokens for m in self.messages[start:end])
+        del self.messages[start:end]
+        removed = end - start
+        self._human_indices = [i if i < start else i - removed for i in self._human_indices
+                               if not start <= i < end]
+
+    def remove_indices(self, indices: List[int]) -> None:
+        """Remove the messages at the sorted indices, each run of consecutive ones at once"""
+        end = None
+        for i in reversed(indices):
+            if end is None:
+                start, end = i, i + 1
+            elif i == start - 1:
+                start = i
+            else:
+                self.remove_messages(start, end)
+                start, end = i, i + 1
+        if end is not None:
+            self.remove_messages(start, end)
+
+    def human_message_index(self, nth_latest: int = 1) -> Optional[int]:
+        """Position of the nth latest human message, None if there are fewer"""
+        if len(self._human_indices) < nth_latest:
+            return None
+        index = self._human_indices[-nth_latest]
+        if index >= len(self.messages) or not isinstance(self.messages[index].message, HumanMessage):
+            # the messages were changed behind our back
+            self._reindex()
+            if len(self._human_indices) < nth_latest:
+                return None
+            index = self._human_indices[-nth_latest]
+        return index
+
+    def remove_human_message(self, nth_latest: int = 1) -> None:
+        """Remove the nth latest human message, which is the state message for nth_latest=1"""
+        index = self.human_message_index(nth_latest)
+        if index is None:
+            return
+        self.current_tokens -= self.messages[index].metadata.tokens
+        del self.messages[index]
+        del self._human_indices[-nth_latest]
+        for j in range(len(self._human_indices) - nth_latest + 1, len(self._human_indices)):
+            self._human_indices[j] -= 1
+
+    def remove_oldest_message(self) -> None:
+        """Remove oldest non-system message"""
+        for i, msg in enumerate(self.messages):
+            if not isinstance(msg.message, SystemMessage):
+                self.remove_messages(i, i + 1)
+                break
+
+    def remove_last_state_message(self) -> None:
+        """Remove last state message from history"""
+        if len(self.messages) > 2 and isinstance(self.messages[-1].message, HumanMessage):
+            self.remove_messages(len(self.messages) - 1, len(self.messages))
 
 
 class CustomMessageManager(MessageManager):
@@ -40,6 +166,11 @@ class CustomMessageManager(MessageManager):
             settings: MessageManagerSettings = MessageManagerSettings(),
             state: MessageManagerState = MessageManagerState(),
     ):
+        self._use_custom_history(state)
+        self.context_content = ""
+        self._evicted_messages: List[BaseMessage] = []
+        self._compaction_task: Optional[asyncio.Task] = None
+        self.dom_delta: Optional[DomDeltaTracker] = DomDeltaTracker() if settings.dom_delta else None
         super().__init__(
             task=task,
             system_message=system_message,
@@ -47,6 +178,30 @@ class CustomMessageManager(MessageManager):
             state=state
         )
 
+    @staticmethod
+    def _use_custom_history(state: MessageManagerState) -> None:
+        if not isinstance(state.history, CustomMessageHistory):
+            state.history = CustomMessageHistory(
+                messages=state.history.messages,
+                current_tokens=sum(m.metadata.tokens for m in state.history.messages),
+            )
+
+    def restore_state(self, state: MessageManagerState) -> None:
+        """Continue from the messages of a checkpointed run"""
+        self._use_custom_history(state)
+        self.state = state
+        messages = state.history.messages
+        # the context message follows the system message, when there is one
+        self.context_content = ""
+        if len(messages) > 1 and isinstance(messages[1].message, HumanMessage) \
+                and messages[1].message.id not in (SUMMARY_MESSAGE_ID, *PINNED_MESSAGE_IDS):
+            self.context_content = messages[1].message.content
+        if self.dom_delta is not None:
+            # the next state message lists all the elements again
+            self.dom_delta.reset()
+        if self.settings.screenshot_optimizer is not None:
+            self.settings.screenshot_optimizer.reset()
+
     def _init_messages(self) -> None:
         """Initialize the message history with system message, context, task, and other initial messages"""
         self._add_message_with_tokens(self.system_prompt)
@@ -68,14 +223,123 @@ class CustomMessageManager(MessageManager):
             context_message = HumanMessage(content=self.context_content)
             self._add_message_with_tokens(context_message)
 
+    def _count_text_tokens(self, text: str) -> int:
+        """Count tokens in a text string"""
+        if self.settings.token_counter is not None:
+            return self.settings.token_counter(text)
+        return super()._count_text_tokens(text)
+
+    def update_message_tokens(self, index: int = -1) -> None:
+        """Recount the tokens of a message after its content was changed in place"""
+        message = self.state.history.messages[index].message
+        self.state.history.update_tokens(index, self._count_tokens(message))
+
+    def _summary_index(self) -> Optional[int]:
+        """Position of the history summary message, None before the first compaction"""
+        index = 2 if self.context_content else 1
+        messages = self.state.history.messages
+        if index < len(messages) and messages[index].message.id == SUMMARY_MESSAGE_ID:
+            return index
+        return None
+
     def cut_messages(self):
         """Get current message list, potentially trimmed to max tokens"""
-        diff = self.state.history.current_tokens - self.settings.max_input_tokens
-        min_message_len = 2 if self.context_content is not None else 1
+        max_input_tokens = self.settings.max_input_tokens
+        summary_index = self._summary_index()
+        if self.settings.compaction_llm is not None:
+            # keep room for the summary to grow up to its budget
+            summary_tokens = self.state.history.messages[summary_index].metadata.tokens if summary_index is not None else 0
+            max_input_tokens -= max(self.settings.summary_max_tokens - summary_tokens, 0)
+        diff = self.state.history.current_tokens - max_input_tokens
+        if diff <= 0:
+            return
+        min_message_len = 2 if self.context_content else 1
+        if summary_index is not None:
+            min_message_len += 1
+
+        # find the oldest messages holding enough tokens and remove them at once,
+        # the latest message holds the current state and is kept, and so are the pinned messages it refers to
+        messages = self.state.history.messages
+        evicted = []
+        end = min_message_len
+        while diff > 0 and end < len(messages) - 1:
+            if messages[end].message.id not in PINNED_MESSAGE_IDS:
+                diff -= messages[end].metadata.tokens
+                evicted.append(end)
+            end += 1
+        if self.settings.compaction_llm is not None:
+            self._evicted_messages.extend(messages[i].message for i in evicted)
+        self.state.history.remove_indices(evicted)
+
+    def start_compaction(self) -> None:
+        """Fold the evicted messages into the history summary in the background"""
+        if not self._evicted_messages or self.settings.compaction_llm is None:
+            return
+        if self._compaction_task is not None and not self._compaction_task.done():
+            # the next call picks up the messages evicted in the meantime
+            return
+        evicted_messages, self._evicted_messages = self._evicted_messages, []
+        self._compaction_task = asyncio.create_task(self._compact(evicted_messages))
 
-        while diff > 0 and len(self.state.history.messages) > min_message_len:
-            self.state.history.remove_message(min_message_len)  # always remove the oldest message
-            diff = self.state.history.current_tokens - self.settings.max_input_tokens
+    async def wait_compaction(self) -> None:
+        """Wait for the running compaction, if any"""
+        if self._compaction_task is not None:
+            await asyncio.shield(self._compaction_task)
+
+    def cancel_compaction(self) -> None:
+        """Cancel the running compaction, its evicted messages are dropped"""
+        if self._compaction_task is not None and not self._compaction_task.done():
+            self._compaction_task.cancel()
+
+    async def _compact(self, evicted_messages: List[BaseMessage]) -> None:
+        summary_index = self._summary_index()
+        summary = self.state.history.messages[summary_index].message.content if summary_index is not None else "None"
+        evicted = []
+        for message in evicted_messages:
+            if isinstance(message.content, list):
+                # images are not summarized
+                content = "".join(item["text"] for item in message.content
+                                  if isinstance(item, dict) and item.get("type") == "text")
+            else:
+                content = message.content
+            evicted.append(f"{message.type}: {content}")
+        max_tokens = self.settings.summary_max_tokens
+        try:
+            response = await self.settings.compaction_llm.ainvoke([
+                SystemMessage(content=SUMMARY_PROMPT.format(max_tokens=max_tokens)),
+                HumanMessage(content=f"Current summary:\n{summary}\n\nMessages to fold in:\n" + "\n".join(evicted)),
+            ])
+        except Exception as e:
+            logger.warning(f"⚠️ History compaction failed, {len(evicted_messages)} evicted messages are dropped: {e}")
+            return
+
+        summary = str(response.content).strip()
+        tokens = self._count_text_tokens(summary)
+        if tokens > max_tokens:
+            summary = summary[:int(len(summary) * max_tokens / tokens)]
+        self._set_summary(summary)
+        logger.debug(f"🗜️ Folded {len(evicted_messages)} messages into the history summary")
+
+    def _set_summary(self, summary: str) -> None:
+        message = HumanMessage(content=f"Summary of the earlier steps of the task:\n{summary}", id=SUMMARY_MESSAGE_ID)
+        summary_index = self._summary_index()
+        if summary_index is None:
+            self._add_message_with_tokens(message, position=2 if self.context_content else 1)
+            return
+        if self.settings.sensitive_data:
+            message = self._filter_sensitive_data(message)
+        self.state.history.messages[summary_index].message = message
+        self.update_message_tokens(summary_index)
+
+    async def prepare_screenshot(self, state: BrowserState, use_vision: bool = True) -> None:
+        """Decode, hash and encode the screenshot of the next state message on the offload threads"""
+        screenshot_optimizer = self.settings.screenshot_optimizer
+        if screenshot_optimizer is None or not state.screenshot or not use_vision:
+            return
+        if self._pinned_index(SCREENSHOT_MESSAGE_ID) is None:
+            # nothing to compare with, send the screenshot even if it is unchanged
+            screenshot_optimizer.reset()
+        await run_in_thread(screenshot_optimizer.prepare, state.screenshot)
 
     def add_state_message(
             self,
@@ -87,23 +351,56 @@ class CustomMessageManager(MessageManager):
     ) -> None:
         """Add browser state as human message"""
         # otherwise add state message and result to next message (which will not stay in memory)
+        prompt_kwargs = {}
+        if self.settings.cache_friendly_prompt:
+            prompt_kwargs["cache_friendly"] = True
+        screenshot_optimizer = self.settings.screenshot_optimizer
+        if screenshot_optimizer is not None:
+            if self._pinned_index(SCREENSHOT_MESSAGE_ID) is None:
+                # nothing to compare with, send the screenshot even if it is unchanged
+                screenshot_optimizer.reset()
+            prompt_kwargs["screenshot_optimizer"] = screenshot_optimizer
+        if self.dom_delta is not None:
+            prompt_kwargs["dom_delta"] = self.dom_delta
+        if self.settings.element_pruner is not None:
+            prompt_kwargs["element_pruner"] = self.settings.element_pruner
         state_message = self.settings.agent_prompt_class(
             state,
             actions,
             result,
             include_attributes=self.settings.include_attributes,
             step_info=step_info,
+            **prompt_kwargs,
         ).get_user_message(use_vision)
+        if self.dom_delta is not None and self.dom_delta.pending_base is not None:
+            self._pin_message(HumanMessage(content=self.dom_delta.pending_base, id=DOM_BASE_MESSAGE_ID))
+            self.dom_delta.pending_base = None
+        if screenshot_optimizer is not None and screenshot_optimizer.pending_image is not None:
+            self._pin_message(HumanMessage(content=[
+                {'type': 'text', 'text': 'Latest screenshot of the page:'},
+                {'type': 'image_url', 'image_url': {'url': screenshot_optimizer.pending_image}},
+            ], id=SCREENSHOT_MESSAGE_ID))
+            screenshot_optimizer.pending_image = None
         self._add_message_with_tokens(state_message)
 
+    def _pinned_index(self, message_id: str) -> Optional[int]:
+        messages = self.state.history.messages
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].message.id == message_id:
+                return i
+        return None
+
+    def _pin_message(self, message: HumanMessage) -> None:
+        """Replace the pinned message with the same id, which the state messages refer to"""
+        index = self._pinned_index(message.id)
+        if index is not None:
+            self.state.history.remove_messages(index, index + 1)
+        self._add_message_with_tokens(message)
+
     def _remove_state_message_by_index(self, remove_ind=-1) -> None:
-        """Remove state message by index from history"""
-        i = len(self.state.history.messages) - 1
-        remove_cnt = 0
-        while i >= 0:
-            if isinstance(self.state.history.messages[i].message, HumanMessage):
-                remove_cnt += 1
-            if remove_cnt == abs(remove_ind):
-                self.state.history.messages.pop(i)
-                break
-            i -= 1
+        """Remove state message by index from history, unless it is a pinned message or the summary"""
+        history = self.state.history
+        index = history.human_message_index(abs(remove_ind))
+        if index is None or history.messages[index].message.id in (SUMMARY_MESSAGE_ID, *PINNED_MESSAGE_IDS):
+            return
+        history.remove_human_message(abs(remove_ind))
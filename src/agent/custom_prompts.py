@@ -7,17 +7,26 @@ from browser_use.browser.views import BrowserState
 from langchain_core.messages import HumanMessage, SystemMessage
 from datetime import datetime
 import importlib
+from functools import lru_cache
 
+from src.utils.dom_delta import DomDeltaTracker
+from src.utils.element_pruning import ElementPruner
+from src.utils.screenshot import ScreenshotOptimizer
 from .custom_views import CustomAgentStepInfo
 
 
+@lru_cache(maxsize=None)
+def _read_prompt_template(package: str, filename: str) -> str:
+    # This works both in development and when installed as a package
+    with importlib.resources.files(package).joinpath(filename).open('r') as f:
+        return f.read()
+
+
 class CustomSystemPrompt(SystemPrompt):
     def _load_prompt_template(self) -> None:
-        """Load the prompt template from the markdown file."""
+        """Load the prompt template from the markdown file, read once per process."""
         try:
-            # This works both in development and when installed as a package
-            with importlib.resources.files('src.agent').joinpath('custom_system_prompt.md').open('r') as f:
-                self.prompt_template = f.read()
+            self.prompt_template = _read_prompt_template('src.agent', 'custom_system_prompt.md')
         except Exception as e:
             raise RuntimeError(f'Failed to load system prompt template: {e}')
 
@@ -30,6 +39,10 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
             result: Optional[List[ActionResult]] = None,
             include_attributes: list[str] = [],
             step_info: Optional[CustomAgentStepInfo] = None,
+            cache_friendly: bool = False,
+            screenshot_optimizer: Optional[ScreenshotOptimizer] = None,
+            dom_delta: Optional[DomDeltaTracker] = None,
+            element_pruner: Optional[ElementPruner] = None,
     ):
         super(CustomAgentMessagePrompt, self).__init__(state=state,
                                                        result=result,
@@ -37,6 +50,13 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
                                                        step_info=step_info
                                                        )
         self.actions = actions
+        # put the fields changing every step last, so that the prompt prefix stays identical
+        self.cache_friendly = cache_friendly
+        self.screenshot_optimizer = screenshot_optimizer
+        # send the changes of the element list against the one pinned in the history
+        self.dom_delta = dom_delta
+        # cut the element list of large pages to the elements relevant to the task
+        self.element_pruner = element_pruner
 
     def get_user_message(self, use_vision: bool = True) -> HumanMessage:
         if self.step_info:
@@ -48,6 +68,11 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
         step_info_description += f"Current date and time: {time_str}"
 
         elements_text = self.state.element_tree.clickable_elements_to_string(include_attributes=self.include_attributes)
+        if self.element_pruner is not None and elements_text != '':
+            elements_text = self.element_pruner.prune(elements_text, self.step_info.task,
+                                                      getattr(self.step_info, 'next_goal', ''))
+        if self.dom_delta is not None and elements_text != '':
+            elements_text = self.dom_delta.render(self.state, elements_text)
 
         has_content_above = (self.state.pixels_above or 0) > 0
         has_content_below = (self.state.pixels_below or 0) > 0
@@ -68,8 +93,9 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
         else:
             elements_text = 'empty page'
 
-        state_description = f"""
-{step_info_description}
+        state_description = "" if self.cache_friendly else f"""
+{step_info_description}"""
+        state_description += f"""
 1. Task: {self.step_info.task}. 
 2. Hints(Optional): 
 {self.step_info.add_infos}
@@ -98,7 +124,17 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
                     if result.extracted_content:
                         state_description += f"Result of previous action {i + 1}/{len(self.result)}: {result.extracted_content}\n"
 
+        if self.cache_friendly:
+            state_description += f"\n{step_info_description}\n"
+
         if self.state.screenshot and use_vision == True:
+            if self.screenshot_optimizer is not None:
+                # the message manager pins the sent screenshot in the history
+                if self.screenshot_optimizer.process(self.state.screenshot) is not None:
+                    state_description += "\nThe screenshot above is current.\n"
+                else:
+                    state_description += "\nThe page looks the same as in the screenshot above.\n"
+                return HumanMessage(content=state_description)
             # Format message for vision model
             return HumanMessage(
                 content=[
@@ -1,11 +1,16 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import hashlib
 from typing import Any, Dict, List, Literal, Optional, Type
 import uuid
 
-from browser_use.agent.views import AgentOutput, AgentState, ActionResult, AgentHistoryList, MessageManagerState
+from browser_use.agent.views import AgentOutput, AgentSettings, AgentState, ActionResult, AgentHistoryList, \
+    MessageManagerState, StepMetadata
 from browser_use.controller.registry.views import ActionModel
+from browser_use.telemetry.views import AgentEndTelemetryEvent
 from pydantic import BaseModel, ConfigDict, Field, create_model
 
+from src.utils.agent_memory import AgentMemory
+
 
 @dataclass
 class CustomAgentStepInfo:
@@ -13,7 +18,35 @@ class CustomAgentStepInfo:
     max_steps: int
     task: str
     add_infos: str
-    memory: str
+    memory: str  # rendered view of memory_store put into the prompt
+    memory_store: AgentMemory = field(default_factory=AgentMemory)
+    next_goal: str = ""  # next_goal of the previous model output
+
+
+@dataclass
+class CustomAgentEndTelemetryEvent(AgentEndTelemetryEvent):
+    steps_saved: int = 0  # steps of the run left unused because the loop detection stopped it
+
+
+class CustomAgentSettings(AgentSettings):
+    """Options for the custom agent on top of the browser-use defaults"""
+
+    llm_timeout: Optional[float] = None  # seconds per LLM call, None waits forever
+    stream_actions: bool = False  # execute actions while the LLM response is still streaming
+    cache_friendly_prompt: bool = False  # stable prompt prefix with provider cache breakpoints
+    memory_max_tokens: int = 2000  # budget of the memory rendered into the state message
+    background_planner: bool = False  # plan while the actions execute instead of before the llm call
+
+
+class CustomStepMetadata(StepMetadata):
+    """Step metadata with the wall time in seconds of every phase of the step, the prompt cache usage and the model tier"""
+
+    phase_timings: Dict[str, float] = Field(default_factory=dict)
+    # input tokens read from / not found in the provider prompt cache, None if the provider does not report them
+    cached_input_tokens: Optional[int] = None
+    uncached_input_tokens: Optional[int] = None
+    llm_tier: Optional[str] = None  # model cascade tier that answered the step, None without a cascade
+    replayed: bool = False  # the actions were replayed from a saved history without the llm
 
 
 class CustomAgentBrain(BaseModel):
@@ -51,6 +84,14 @@ class CustomAgentOutput(AgentOutput):
         return model_
 
 
+class ExtractedPage(BaseModel):
+    """Content extracted from a page during the task"""
+
+    url: Optional[str] = None
+    content_hash: str
+    content: str
+
+
 class CustomAgentState(BaseModel):
     agent_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     n_steps: int = 1
@@ -64,4 +105,20 @@ class CustomAgentState(BaseModel):
     message_manager_state: MessageManagerState = Field(default_factory=MessageManagerState)
 
     last_action: Optional[List['ActionModel']] = None
-    extracted_content: str = ''
+    # why the run was stopped before max_steps by the loop detection, and how many steps that saved
+    stop_reason: Optional[str] = None
+    steps_saved: int = 0
+    # extracted pages by content hash, in extraction order
+    extracted_pages: Dict[str, ExtractedPage] = Field(default_factory=dict)
+
+    def add_extracted_page(self, content: str, url: Optional[str] = None) -> bool:
+        """Record an extracted page, returns False if the same content was already recorded"""
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if content_hash in self.extracted_pages:
+            return False
+        self.extracted_pages[content_hash] = ExtractedPage(url=url, content_hash=content_hash, content=content)
+        return True
+
+    def get_extracted_content(self) -> str:
+        """All extracted pages concatenated"""
+        return "".join(page.content for page in self.extracted_pages.values())
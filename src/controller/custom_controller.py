@@ -1,7 +1,7 @@
 import pdb
 
 import pyperclip
-from typing import Optional, Type
+from typing import List, Optional, Type
 from pydantic import BaseModel
 from browser_use.agent.views import ActionResult
 from browser_use.browser.context import BrowserContext
@@ -21,15 +21,26 @@ from browser_use.controller.views import (
 )
 import logging
 
+from src.utils.offload import run_in_thread
+from src.utils.schema_cache import use_cached_registry
+from src.utils.skill_store import SkillStore, execute_skill, get_domain
+
 logger = logging.getLogger(__name__)
 
 
 class CustomController(Controller):
     def __init__(self, exclude_actions: list[str] = [],
-                 output_model: Optional[Type[BaseModel]] = None
+                 output_model: Optional[Type[BaseModel]] = None,
+                 skill_store: Optional[SkillStore] = None,
                  ):
         super().__init__(exclude_actions=exclude_actions, output_model=output_model)
+        # share the action models and descriptions with the other controllers of the same actions
+        self.registry = use_cached_registry(self.registry)
+        self.skill_store = skill_store
         self._register_custom_actions()
+        self._skills_registered = skill_store is not None and bool(skill_store.find())
+        if self._skills_registered:
+            self._register_skill_actions()
 
     def _register_custom_actions(self):
         """Register all custom browser actions"""
@@ -47,3 +58,29 @@ class CustomController(Controller):
             await page.keyboard.type(text)
 
             return ActionResult(extracted_content=text)
+
+    def _register_skill_actions(self):
+        """Offer the skills learned from earlier runs as one macro action"""
+
+        @self.registry.action(
+            "Run a skill, a sequence of actions that reached a goal on a site before, in one step. "
+            "The page is checked after every action and the skill stops where it no longer fits. "
+            "inputs are the texts the skill types, in order. The skills of the current site are listed with the page."
+        )
+        async def use_skill(name: str, browser: BrowserContext, inputs: Optional[List[str]] = None):
+            skill = self.skill_store.get(name)
+            if skill is None:
+                return ActionResult(error=f"Unknown skill {name}", include_in_memory=True)
+
+            async def execute_action(action_name: str, params: dict):
+                return await self.registry.execute_action(action_name, params, browser=browser)
+
+            result = await execute_skill(skill, browser, execute_action, inputs)
+            await run_in_thread(self.skill_store.record_result, name, result.error is None)
+            return result
+
+    def describe_skills(self, url: str) -> str:
+        """Skills of the domain of url offered by use_skill, empty if there are none"""
+        if not self._skills_registered:
+            return ""
+        return self.skill_store.describe(get_domain(url))
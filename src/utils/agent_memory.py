@@ -0,0 +1,97 @@
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class MemoryEntry:
+    text: str
+    step: int
+    tokens: int
+    # words in order, and as a set for the similarity
+    sequence: tuple
+    words: frozenset
+
+
+class AgentMemory:
+    """
+    Memory of the important contents found by the agent.
+    Entries are deduplicated by the hash of their normalized text, near duplicates replace the older entry,
+    and the oldest entries are dropped once the memory exceeds max_tokens. The same words in another order
+    are another fact ("A beats B", "B beats A"), never a duplicate.
+    """
+
+    def __init__(
+            self,
+            max_tokens: int = 2000,
+            token_counter: Optional[Callable[[str], int]] = None,
+            similarity_threshold: float = 0.8,
+            similarity_window: int = 32,
+    ):
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or (lambda text: len(text) // 3)
+        self.similarity_threshold = similarity_threshold
+        # only the most recent entries are compared for near duplicates, to keep adding constant time
+        self.similarity_window = similarity_window
+        self.entries: "OrderedDict[str, MemoryEntry]" = OrderedDict()
+        self.tokens = 0
+        self.dropped = 0
+        self._rendered: Optional[str] = None
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(_SPACE_RE.sub(" ", text.lower()).encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str) -> None:
+        self.tokens -= self.entries.pop(key).tokens
+
+    def add(self, text: str, step: int = 0) -> bool:
+        """Add an entry, returns False if it was already known"""
+        text = text.strip()
+        if not text:
+            return False
+        key = self._key(text)
+        if key in self.entries:
+            # seen again, keep it as a recent entry
+            self.entries[key].step = step
+            self.entries.move_to_end(key)
+            self._rendered = None
+            return False
+
+        sequence = tuple(_WORD_RE.findall(text.lower()))
+        words = frozenset(sequence)
+        for i, (other_key, other) in enumerate(reversed(self.entries.items())):
+            if i >= self.similarity_window:
+                break
+            if other.words == words and other.sequence != sequence:
+                # reordered words, not an update
+                continue
+            union = len(words | other.words)
+            if union and len(words & other.words) / union >= self.similarity_threshold:
+                # a near duplicate is an update of the older entry
+                self._remove(other_key)
+                break
+
+        entry = MemoryEntry(text=text, step=step, tokens=self.token_counter(text) + 1, sequence=sequence,
+                            words=words)
+        self.entries[key] = entry
+        self.tokens += entry.tokens
+        while self.tokens > self.max_tokens and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.dropped += 1
+        self._rendered = None
+        return True
+
+    def render(self) -> str:
+        """The entries from oldest to newest, one per line"""
+        if self._rendered is None:
+            self._rendered = "".join(entry.text + "\n" for entry in self.entries.values())
+        return self._rendered
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class AgentCheckpoint(BaseModel):
+    """Everything needed to continue a run after its last completed step, in another process if need be"""
+
+    task: str
+    add_infos: str = ""
+    max_steps: int
+    # steps of the run loop done, failed ones included
+    steps_done: int
+    step_number: int
+    next_goal: str = ""
+    # memory entries as (text, step), oldest first
+    memory: List[Tuple[str, int]] = Field(default_factory=list)
+    url: Optional[str] = None
+    cookies: List[Dict[str, Any]] = Field(default_factory=list)
+    # CustomAgentState dump without the history, the actions are validated again with the action models
+    # of the resuming agent
+    state: Dict[str, Any]
+    # steps of the history appended to the JSONL file next to the checkpoint, later lines are ignored
+    history_steps: int = 0
+    # blob store of the screenshots and long contents of that history
+    history_blob_dir: str = "./tmp/history_blobs"
+    saved_at: float = Field(default_factory=time.time)
+
+
+def task_key(task: str) -> str:
+    return hashlib.sha256(task.encode("utf-8")).hexdigest()[:16]
+
+
+def checkpoint_path(directory: str, task: str, agent_id: str) -> str:
+    """Checkpoint file of a run, named by the task so that the runs of a task are found without reading them"""
+    return os.path.join(directory, f"{task_key(task)}-{agent_id}.json")
+
+
+def checkpoint_history_path(path: str) -> str:
+    """JSONL history of the run of a checkpoint"""
+    return f"{os.path.splitext(path)[0]}.jsonl"
+
+
+def save_checkpoint(checkpoint: AgentCheckpoint, path: str) -> None:
+    """
+    Write the checkpoint atomically, a crash while writing leaves the previous one intact.
+    It holds the session cookies, only the owner can read it.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+        # a tmp file left by a crash keeps its mode
+        os.chmod(tmp_path, 0o600)
+        json.dump(checkpoint.model_dump(mode="json"), f)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> AgentCheckpoint:
+    with open(path, "r", encoding="utf-8") as f:
+        return AgentCheckpoint.model_validate(json.load(f))
+
+
+def remove_checkpoint(path: str) -> None:
+    history_path = checkpoint_history_path(path)
+    for file_path in (path, history_path, f"{history_path}.idx"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
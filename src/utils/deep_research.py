@@ -31,6 +31,7 @@ from src.agent.custom_prompts import CustomSystemPrompt, CustomAgentMessagePromp
 from src.controller.custom_controller import CustomController
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import BrowserContextConfig, BrowserContext
+from src.utils.offload import run_in_process
 from browser_use.browser.context import (
     BrowserContextConfig,
     BrowserContextWindowSize,
@@ -89,7 +90,9 @@ async def deep_research(task, llm, agent_state=None, **kwargs):
         jina_url = f"https://r.jina.ai/{url}"
         await page.goto(jina_url)
         output_format = 'markdown'
-        content = MainContentExtractor.extract(  # type: ignore
+        # parsing a large page takes seconds of CPU, off the event loop
+        content = await run_in_process(  # type: ignore
+            MainContentExtractor.extract,
             html=await page.content(),
             output_format=output_format,
         )
@@ -198,7 +201,7 @@ Provide your output as a JSON formatted list. Each item in the list must adhere
             history_infos_ = json.dumps(history_infos, indent=4)
             query_prompt = f"This is search {search_iteration} of {max_search_iterations} maximum searches allowed.\n User Instruction:{task} \n Previous Queries:\n {history_query_} \n Previous Search Results:\n {history_infos_}\n"
             search_messages.append(HumanMessage(content=query_prompt))
-            ai_query_msg = llm.invoke(search_messages[:1] + search_messages[1:][-1:])
+            ai_query_msg = await llm.ainvoke(search_messages[:1] + search_messages[1:][-1:])
             search_messages.append(ai_query_msg)
             if hasattr(ai_query_msg, "reasoning_content"):
                 logger.info("🤯 Start Search Deep Thinking: ")
@@ -287,7 +290,7 @@ Provide your output as a JSON formatted list. Each item in the list must adhere
                     history_infos_ = json.dumps(history_infos, indent=4)
                     record_prompt = f"User Instruction:{task}. \nPrevious Recorded Information:\n {history_infos_}\n Current Search Iteration: {search_iteration}\n Current Search Plan:\n{query_plan}\n Current Search Query:\n {query_tasks[i]}\n Current Search Results: {query_result_}\n "
                     record_messages.append(HumanMessage(content=record_prompt))
-                    ai_record_msg = llm.invoke(record_messages[:1] + record_messages[-1:])
+                    ai_record_msg = await llm.ainvoke(record_messages[:1] + record_messages[-1:])
                     record_messages.append(ai_record_msg)
                     if hasattr(ai_record_msg, "reasoning_content"):
                         logger.info("🤯 Start Record Deep Thinking: ")
@@ -361,7 +364,7 @@ async def generate_final_report(task, history_infos, save_dir, llm, error_msg=No
         report_prompt = f"User Instruction:{task} \n Search Information:\n {history_infos_}"
         report_messages = [SystemMessage(content=writer_system_prompt),
                            HumanMessage(content=report_prompt)]  # New context for report generation
-        ai_report_msg = llm.invoke(report_messages)
+        ai_report_msg = await llm.ainvoke(report_messages)
         if hasattr(ai_report_msg, "reasoning_content"):
             logger.info("🤯 Start Report Deep Thinking: ")
             logger.info(ai_report_msg.reasoning_content)
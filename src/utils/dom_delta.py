@@ -0,0 +1,90 @@
+import logging
+import re
+from typing import Dict, Optional, Tuple
+
+from browser_use.browser.views import BrowserState
+
+logger = logging.getLogger(__name__)
+
+DOM_BASE_MESSAGE_ID = "dom_base"
+
+_INDEX_RE = re.compile(r"^\[(\d+)\]")
+
+
+def keyed_element_lines(elements_text: str, state: BrowserState) -> Dict[Tuple, str]:
+    """
+    Key the lines of clickable_elements_to_string by a stable identity:
+    the xpath of interactive elements, and the text and occurrence of the other lines.
+    """
+    lines = {}
+    for line in elements_text.split("\n"):
+        match = _INDEX_RE.match(line)
+        element = state.selector_map.get(int(match.group(1))) if match else None
+        if element is not None:
+            key = ("element", element.xpath)
+        else:
+            key = ("text", line)
+        occurrence = 0
+        while key + (occurrence,) in lines:
+            occurrence += 1
+        lines[key + (occurrence,)] = line
+    return lines
+
+
+class DomDeltaTracker:
+    """
+    Tracks the element list pinned in the message history, the base, and renders the following
+    element lists of the same page as the changes against it.
+    """
+
+    def __init__(self):
+        self.url: Optional[str] = None
+        self.base: Dict[Tuple, str] = {}
+        # base element list the message manager has to pin in the history
+        self.pending_base: Optional[str] = None
+        self.full_lists = 0
+        self.deltas = 0
+
+    def reset(self) -> None:
+        """Forget the base, the next element list is sent in full"""
+        self.url = None
+        self.base = {}
+
+    def _diff(self, lines: Dict[Tuple, str]) -> str:
+        added, changed, removed = [], [], []
+        for key, line in lines.items():
+            if key not in self.base:
+                added.append(line)
+            elif self.base[key] != line:
+                changed.append(line)
+        for key, line in self.base.items():
+            if key not in lines:
+                # without its index, the element can't be used anymore
+                removed.append(_INDEX_RE.sub("", line))
+        if not (added or changed or removed):
+            return "No changes to the element list above."
+        delta = "Changes to the element list above, the other elements are unchanged:"
+        for title, section in (("Added", added), ("Changed", changed), ("Removed", removed)):
+            if section:
+                delta += f"\n{title}:\n" + "\n".join(section)
+        return delta
+
+    def render(self, state: BrowserState, elements_text: str) -> str:
+        """The elements to put into the state message, the changes against the base if they are smaller"""
+        lines = keyed_element_lines(elements_text, state)
+        if self.base and self.url == state.url:
+            delta = self._diff(lines)
+            if len(delta) < len(elements_text):
+                self.deltas += 1
+                return delta
+
+        # first list of a page, or too many changes: send the full list as the new base
+        self.url = state.url
+        self.base = lines
+        self.pending_base = f"Interactive elements of {state.url}, the following steps list the changes to them:\n" \
+                            f"{elements_text}"
+        self.full_lists += 1
+        return "The element list above is current."
+
+    def log_stats(self) -> None:
+        logger.info(f"🧩 Element lists sent as changes: {self.deltas}/{self.deltas + self.full_lists}")
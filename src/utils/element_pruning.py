@@ -0,0 +1,114 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_INDEX_RE = re.compile(r"^\[(\d+)\]")
+
+# words of the task and goal that say nothing about which element to use
+STOP_WORDS = frozenset("""
+a an and are as at be by for from go in into is it of on or the then this to with your you me my
+click open find get page button link input field select search type enter use
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and numbers of a text"""
+    return _WORD_RE.findall(text.lower())
+
+
+class ElementPruner:
+    """
+    Keeps the elements of a large page most relevant to the task and the next goal within a token budget.
+    Elements are scored with BM25 against the words of the query, the next goal counting twice,
+    and the kept lines stay in page order.
+    """
+
+    def __init__(
+            self,
+            max_tokens: int,
+            token_counter: Optional[Callable[[str], int]] = None,
+            estimated_characters_per_token: int = 3,
+            k1: float = 1.2,
+            b: float = 0.75,
+    ):
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.estimated_characters_per_token = estimated_characters_per_token
+        self.k1 = k1
+        self.b = b
+        self.pages = 0
+        self.pruned_pages = 0
+        self.omitted_elements = 0
+        self.tokens_saved = 0
+
+    def _count_tokens(self, text: str) -> int:
+        if self.token_counter is not None:
+            return self.token_counter(text)
+        return len(text) // self.estimated_characters_per_token
+
+    def score(self, lines: List[str], task: str, next_goal: str = "") -> List[float]:
+        """BM25 score of every line against the task and the next goal"""
+        query = Counter(w for w in tokenize(task) if w not in STOP_WORDS)
+        for word in tokenize(next_goal):
+            if word not in STOP_WORDS:
+                query[word] += 2
+        documents = [Counter(tokenize(line)) for line in lines]
+        if not query or not documents:
+            return [0.0] * len(lines)
+
+        document_frequency = Counter()
+        for document in documents:
+            document_frequency.update(w for w in document if w in query)
+        average_length = sum(sum(d.values()) for d in documents) / len(documents) or 1
+        n = len(documents)
+        idf = {w: math.log(1 + (n - f + 0.5) / (f + 0.5)) for w, f in document_frequency.items()}
+
+        scores = []
+        for document in documents:
+            length_norm = self.k1 * (1 - self.b + self.b * sum(document.values()) / average_length)
+            score = 0.0
+            for word, weight in query.items():
+                tf = document.get(word, 0)
+                if tf:
+                    score += weight * idf[word] * tf * (self.k1 + 1) / (tf + length_norm)
+            scores.append(score)
+        return scores
+
+    def prune(self, elements_text: str, task: str, next_goal: str = "") -> str:
+        """The element list cut to max_tokens, with a note of how many elements were left out"""
+        self.pages += 1
+        total_tokens = self._count_tokens(elements_text)
+        if total_tokens <= self.max_tokens:
+            return elements_text
+
+        lines = elements_text.split("\n")
+        scores = self.score(lines, task, next_goal)
+        # best scores first, interactive elements before text on ties, then page order
+        ranking = sorted(range(len(lines)),
+                         key=lambda i: (-scores[i], _INDEX_RE.match(lines[i]) is None, i))
+        budget = self.max_tokens
+        kept = set()
+        for i in ranking:
+            tokens = self._count_tokens(lines[i]) + 1
+            if tokens > budget:
+                continue
+            kept.add(i)
+            budget -= tokens
+
+        omitted = sum(1 for i, line in enumerate(lines) if i not in kept and _INDEX_RE.match(line))
+        pruned = "\n".join(line for i, line in enumerate(lines) if i in kept)
+        pruned += f"\n... {omitted} interactive elements less relevant to the task are omitted, " \
+                  f"scroll or extract content to find them ..."
+        self.pruned_pages += 1
+        self.omitted_elements += omitted
+        self.tokens_saved += max(total_tokens - self._count_tokens(pruned), 0)
+        return pruned
+
+    def log_stats(self) -> None:
+        logger.info(f"✂️ Element tokens saved: {self.tokens_saved} ({self.pruned_pages}/{self.pages} pages pruned, "
+                    f"{self.omitted_elements} elements omitted)")
@@ -0,0 +1,167 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+import platform
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from browser_use.agent.gif import _add_overlay_to_image, _create_task_frame
+from browser_use.agent.views import AgentHistory
+from PIL import GifImagePlugin, Image, ImageFont
+
+from .offload import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+FONT_NAMES = ["Helvetica", "Arial", "DejaVuSans", "Verdana"]
+
+
+def _load_font(size: int) -> ImageFont.ImageFont:
+    for font_name in FONT_NAMES:
+        if platform.system() == "Windows":
+            font_name = os.path.join(os.getenv("WIN_FONT_DIR", "C:\\Windows\\Fonts"), font_name + ".ttf")
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+class GifRecorder:
+    """
+    Renders the frame of every step while the agent runs, on the offload threads, and appends it to the GIF
+    as soon as it is rendered, so that only the frames not written yet are held in memory and the file
+    is complete when the task finishes.
+    Frames are downscaled to max_size pixels on their longest side. The frame rate halves every time half of
+    the frames left to max_frames are used, each frame then lasting for the steps it stands for, so that
+    long runs keep their whole timeline within max_frames.
+    """
+
+    def __init__(
+            self,
+            task: str,
+            output_path: str = "agent_history.gif",
+            max_size: int = 1280,
+            max_frames: int = 100,
+            frame_duration: float = 3.0,
+            show_task: bool = True,
+            font_size: int = 40,
+            title_font_size: int = 56,
+            margin: int = 40,
+    ):
+        self.task = task
+        self.output_path = output_path
+        self.max_size = max_size
+        self.max_frames = max_frames
+        self.frame_duration = frame_duration
+        self.show_task = show_task
+        self.margin = margin
+        self.regular_font = _load_font(font_size)
+        self.title_font = _load_font(title_font_size)
+        # the last frame written, every frame is written after the previous one
+        self._writer: Optional[asyncio.Future] = None
+        self._file: Optional[BinaryIO] = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._has_task_frame = False
+        self._stride = 1
+        self._frames_added = 0
+        self._next_stride_at = max(max_frames // 2, 1)
+        self.frames = 0
+        self.steps = 0
+
+    @property
+    def _tmp_path(self) -> str:
+        return f"{self.output_path}.tmp"
+
+    def _fit(self, image: Image.Image) -> Image.Image:
+        image = image.convert("RGB")
+        image.thumbnail((self.max_size, self.max_size), Image.Resampling.LANCZOS)
+        # quantized now, the encoder then only compresses the frames
+        return image.quantize(colors=256)
+
+    def _render_task_frame(self, screenshot: str) -> Optional[Image.Image]:
+        try:
+            return self._fit(_create_task_frame(self.task, screenshot, self.title_font, self.regular_font))
+        except Exception as e:
+            # the task frame needs a truetype font
+            logger.debug(f"No task frame in the GIF: {e}")
+            return None
+
+    def _render_step_frame(self, screenshot: str, step_number: int, goal: Optional[str]) -> Image.Image:
+        image = Image.open(io.BytesIO(base64.b64decode(screenshot)))
+        if goal is not None:
+            image = _add_overlay_to_image(
+                image=image,
+                step_number=step_number,
+                goal_text=goal,
+                regular_font=self.regular_font,
+                title_font=self.title_font,
+                margin=self.margin,
+            )
+        return self._fit(image)
+
+    def _write_frame(self, image: Image.Image, duration: int) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+            self._file = open(self._tmp_path, "wb")
+            self._size = image.size
+            header, _ = GifImagePlugin.getheader(image, info={"loop": 0, "duration": duration})
+            self._file.writelines(header)
+        elif image.size != self._size:
+            # the frames can't be larger than the first one
+            image = image.convert("RGB").resize(self._size, Image.Resampling.LANCZOS).quantize(colors=256)
+        # every frame keeps its own palette
+        self._file.writelines(GifImagePlugin.getdata(image, duration=duration, include_color_table=True))
+        self.frames += 1
+
+    async def _write_after(self, previous: Optional[asyncio.Future], frame: asyncio.Future, duration: int) -> None:
+        if previous is not None:
+            await previous
+        try:
+            image = await frame
+            if image is not None:
+                await run_in_thread(self._write_frame, image, duration)
+        except Exception as e:
+            logger.warning(f"Failed to add a GIF frame: {e}")
+
+    def _add_frame(self, render: Callable[..., Optional[Image.Image]], *args, stride: int = 1) -> None:
+        frame = asyncio.ensure_future(run_in_thread(render, *args))
+        self._writer = asyncio.ensure_future(
+            self._write_after(self._writer, frame, int(self.frame_duration * 1000 * stride)))
+
+    def add_step(self, history_item: AgentHistory) -> None:
+        """Start rendering the frame of a step, called on the event loop after every step"""
+        self.steps += 1
+        screenshot = history_item.state.screenshot
+        if not screenshot:
+            return
+        if self.show_task and self.task and not self._has_task_frame:
+            self._has_task_frame = True
+            self._add_frame(self._render_task_frame, screenshot)
+        if self.steps % self._stride or self._frames_added >= self.max_frames:
+            return
+        goal = history_item.model_output.current_state.next_goal if history_item.model_output else None
+        self._add_frame(self._render_step_frame, screenshot, self.steps, goal, stride=self._stride)
+        self._frames_added += 1
+        if self._frames_added >= self._next_stride_at:
+            self._stride *= 2
+            self._next_stride_at += max((self.max_frames - self._next_stride_at) // 2, 1)
+
+    def _close(self) -> None:
+        self._file.write(b";")  # trailer
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.output_path)
+
+    async def finish(self) -> Optional[str]:
+        """Wait for the last frames and close the animation, returns its path if there were screenshots"""
+        if self._writer is not None:
+            await self._writer
+            self._writer = None
+        if self._file is None:
+            logger.warning("No images found in history to create GIF")
+            return None
+        await run_in_thread(self._close)
+        logger.info(f"Created GIF at {self.output_path} with {self.frames} frames")
+        return self.output_path
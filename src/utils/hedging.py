@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ERRORS = ("RateLimitError", "ResourceExhausted")
+
+
+class HedgePolicy:
+    """
+    Deadline after which the same request is sent to the secondary model,
+    the given percentile of the recent latencies of the primary model.
+    """
+
+    def __init__(
+            self,
+            percentile: float = 90,
+            initial_delay: float = 10.0,
+            min_delay: float = 1.0,
+            window: int = 50,
+            min_samples: int = 5,
+    ):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.failovers = 0
+        self.secondary_wins = 0
+
+    def observe(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def deadline(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        latencies = sorted(self.latencies)
+        rank = min(int(len(latencies) * self.percentile / 100), len(latencies) - 1)
+        return max(latencies[rank], self.min_delay)
+
+    async def race(
+            self,
+            primary: Callable[[], Awaitable[Any]],
+            secondary: Callable[[], Awaitable[Any]],
+            is_valid: Callable[[Any], bool],
+    ) -> Tuple[Any, bool]:
+        """
+        Run primary, and secondary as well if primary is still running at the deadline
+        or fails or answers an invalid answer before it.
+        Returns the first valid answer, or the last answer if none is valid, and whether it came from secondary.
+        Raises the last error if no request answered. The request still running is cancelled.
+        """
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        deadline = self.deadline()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = {primary_task}
+        secondary_task = None
+        answer = None
+        error = None
+        try:
+            while tasks:
+                timeout = None if secondary_task is not None else max(deadline - (loop.time() - start_time), 0)
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    logger.info(f"🏇 No answer after {deadline:.1f}s, hedging the request to the secondary model")
+                if primary_task in done:
+                    self.observe(loop.time() - start_time)
+                # the primary answer wins ties
+                for task in sorted(done, key=lambda t: t is not primary_task):
+                    if task.exception() is not None:
+                        error = task.exception()
+                        logger.debug(f"Hedged request failed: {error!r}")
+                        continue
+                    answer = task.result()
+                    if is_valid(answer):
+                        if task is secondary_task:
+                            self.secondary_wins += 1
+                        return answer, task is secondary_task
+                if secondary_task is None and done:
+                    self.failovers += 1
+                    logger.info(f"🏇 Primary model failed after {loop.time() - start_time:.1f}s, "
+                                f"failing over to the secondary model")
+                if secondary_task is None:
+                    secondary_task = asyncio.ensure_future(secondary())
+                    tasks.add(secondary_task)
+            if answer is None and error is not None:
+                raise error
+            return answer, False
+        finally:
+            for task in (primary_task, secondary_task):
+                if task is not None and not task.done():
+                    task.cancel()
+                    if task is primary_task:
+                        # a lower bound of its latency, so that slow providers raise the deadline
+                        self.observe(loop.time() - start_time)
+
+    def log_stats(self) -> None:
+        logger.info(f"🏇 Hedged requests: {self.hedged}/{self.requests}, {self.failovers} failed over, "
+                    f"{self.secondary_wins} won by the secondary model, deadline {self.deadline():.1f}s")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Rate limit errors of the openai, anthropic and google clients, without importing them"""
+    return type(error).__name__ in RATE_LIMIT_ERRORS
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait asked by the provider in the Retry-After header of the error response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(failures: int, max_delay: float, base_delay: float = 1.0,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before the next attempt: the provider's Retry-After if given,
+    else an exponential backoff with full jitter capped at max_delay.
+    """
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(max_delay, base_delay * 2 ** max(failures - 1, 0)))
@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+from browser_use.agent.views import AgentHistory, AgentHistoryList, AgentOutput, StepMetadata
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = "blob:"
+# byte offset of every line of a history file, in its .idx file
+_OFFSET = struct.Struct("<Q")
+
+
+class BlobStore:
+    """Content-addressed files named by their sha256, written once and shared by every history"""
+
+    def __init__(self, directory: str = "./tmp/history_blobs"):
+        self.directory = directory
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._path(digest), "rb") as f:
+            return f.read()
+
+
+def _is_blob(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX)
+
+
+def _line_offsets(path: str) -> Tuple[List[int], int]:
+    """Offsets of the complete lines of a file, and the end of the last one"""
+    offsets, offset = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offsets.append(offset)
+            offset += len(line)
+    return offsets, offset
+
+
+class HistoryWriter:
+    """
+    Appends the steps of a run to a JSONL file, one line per step, with a .idx file of the line offsets.
+    Screenshots and extracted contents above min_blob_size go to the blob store, the lines refer to them
+    as blob:<sha256>. The files are written in order by a worker thread, off the event loop.
+    """
+
+    def __init__(self, path: str, blob_store: BlobStore, min_blob_size: int = 4096):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.blob_store = blob_store
+        self.min_blob_size = min_blob_size
+        self.steps = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        if os.path.exists(path):
+            # continue a file, after a crash the last line may be cut and the index may lack it
+            offsets, end = _line_offsets(path)
+            if os.path.getsize(path) > end:
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+            index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else -1
+            if index_size != len(offsets) * _OFFSET.size:
+                with open(self.index_path, "wb") as f:
+                    f.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+            self.steps = len(offsets)
+
+    def _to_blob(self, data: bytes) -> str:
+        return BLOB_PREFIX + self.blob_store.put(data)
+
+    def _write(self, item: Dict[str, Any]) -> None:
+        state = item["state"]
+        if state.get("screenshot"):
+            state["screenshot"] = self._to_blob(base64.b64decode(state["screenshot"]))
+        for result in item["result"]:
+            content = result.get("extracted_content")
+            if content and len(content) >= self.min_blob_size:
+                result["extracted_content"] = self._to_blob(content.encode("utf-8"))
+        line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(line)
+        with open(self.index_path, "ab") as f:
+            f.write(_OFFSET.pack(offset))
+
+    def write_new(self, history: Sequence[AgentHistory]) -> None:
+        """Write the steps of history not written yet"""
+        for history_item in history[self.steps:]:
+            # dumped now, the item may change after this call
+            self._executor.submit(self._write, history_item.model_dump())
+            self.steps += 1
+
+    def flush(self) -> None:
+        """Wait for the pending writes, keeps the writer open"""
+        self._executor.submit(lambda: None).result()
+
+    def truncate(self, steps: int) -> None:
+        """Drop the steps after the first ones, written after the state they belong to was saved"""
+        self.flush()
+        if steps >= self.steps:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(steps * _OFFSET.size)
+            end = _OFFSET.unpack(f.read(_OFFSET.size))[0]
+        with open(self.path, "r+b") as f:
+            f.truncate(end)
+        with open(self.index_path, "r+b") as f:
+            f.truncate(steps * _OFFSET.size)
+        self.steps = steps
+
+    def close(self) -> None:
+        """Wait for the pending writes"""
+        self._executor.shutdown(wait=True)
+
+
+class HistoryReader:
+    """Reads any range of steps of a JSONL history, seeking to the lines with the .idx file"""
+
+    def __init__(self, path: str, blob_store: BlobStore):
+        self.path = path
+        self.blob_store = blob_store
+        index_path = f"{path}.idx"
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                data = f.read()
+            self.offsets = [offset for offset, in _OFFSET.iter_unpack(data)]
+        else:
+            self.offsets, _ = _line_offsets(path)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _resolve(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        state = item["state"]
+        if _is_blob(state.get("screenshot")):
+            data = self.blob_store.get(state["screenshot"][len(BLOB_PREFIX):])
+            state["screenshot"] = base64.b64encode(data).decode("utf-8")
+        for result in item["result"]:
+            if _is_blob(result.get("extracted_content")):
+                data = self.blob_store.get(result["extracted_content"][len(BLOB_PREFIX):])
+                result["extracted_content"] = data.decode("utf-8")
+        return item
+
+    def iter_steps(self, output_model: Type[AgentOutput], start: int = 0, stop: Optional[int] = None,
+                   resolve_blobs: bool = True, metadata_model: Type[StepMetadata] = StepMetadata) \
+            -> Iterator[AgentHistory]:
+        """
+        Steps start to stop, parsed one at a time. The model outputs are validated with output_model, the
+        AgentOutput of the agent that wrote them, and the metadata with metadata_model. Without resolving
+        the blobs the screenshots and long contents stay blob:<sha256> references.
+        """
+        offsets = self.offsets[start:stop]
+        if not offsets:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(offsets[0])
+            for _ in offsets:
+                item = json.loads(f.readline())
+                if resolve_blobs:
+                    item = self._resolve(item)
+                if item["model_output"]:
+                    item["model_output"] = output_model.model_validate(item["model_output"])
+                if item["metadata"]:
+                    item["metadata"] = metadata_model.model_validate(item["metadata"])
+                yield AgentHistory.model_validate(item)
+
+    def read(self, output_model: Type[AgentOutput], start: int = 0, stop: Optional[int] = None,
+             resolve_blobs: bool = True, metadata_model: Type[StepMetadata] = StepMetadata) -> List[AgentHistory]:
+        return list(self.iter_steps(output_model, start, stop, resolve_blobs, metadata_model))
+
+
+def load_history(path: str, output_model: Type[AgentOutput], blob_dir: str = "./tmp/history_blobs") \
+        -> AgentHistoryList:
+    """Load a history saved as JSONL with its blobs, or as the JSON of save_history"""
+    if path.endswith(".jsonl"):
+        return AgentHistoryList(history=HistoryReader(path, BlobStore(blob_dir)).read(output_model))
+    return AgentHistoryList.load_from_file(path, output_model)
@@ -1,5 +1,7 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import asyncio
 import pdb
+import weakref
 from langchain_openai import ChatOpenAI
 from langchain_core.globals import get_llm_cache
 from langchain_core.language_models.base import (
@@ -10,6 +12,7 @@ from langchain_core.language_models.base import (
 from langchain_core.load import dumpd, dumps
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     SystemMessage,
     AnyMessage,
     BaseMessage,
@@ -33,6 +36,7 @@ from langchain_core.tools import BaseTool
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Callable,
     Literal,
     Optional,
@@ -40,15 +44,129 @@ from typing import (
     cast,
 )
 
+# Shared OpenAI clients per endpoint, so that every agent reuses the same connection pool.
+# Async clients are kept per event loop since their connections can't be shared across loops.
+_openai_clients: dict[tuple, OpenAI] = {}
+_async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, AsyncOpenAI]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_openai_client(base_url: Optional[str], api_key: Optional[str]) -> OpenAI:
+    """Get the shared OpenAI client of an endpoint"""
+    key = (base_url, api_key)
+    if key not in _openai_clients:
+        _openai_clients[key] = OpenAI(base_url=base_url, api_key=api_key)
+    return _openai_clients[key]
+
+
+def get_async_openai_client(base_url: Optional[str], api_key: Optional[str]) -> AsyncOpenAI:
+    """Get the shared AsyncOpenAI client of an endpoint for the running event loop"""
+    clients = _async_openai_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (base_url, api_key)
+    if key not in clients:
+        clients[key] = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    return clients[key]
+
+
+def convert_to_openai_messages(input: LanguageModelInput) -> list[dict]:
+    """Convert langchain messages to the OpenAI chat format"""
+    message_history = []
+    for input_ in input:
+        if isinstance(input_, SystemMessage):
+            message_history.append({"role": "system", "content": input_.content})
+        elif isinstance(input_, AIMessage):
+            message_history.append({"role": "assistant", "content": input_.content})
+        else:
+            message_history.append({"role": "user", "content": input_.content})
+    return message_history
+
+
+class ThinkTagParser:
+    """
+    Incrementally split a `<think>reasoning</think>content` stream into reasoning and content.
+    A stream not opening with the think tag is all content.
+    Text that could be the start of a split tag is held back until the next chunk arrives.
+    Streamed content starts after the first JSON marker, since the content already sent can't be taken back,
+    split() keeps the content after the last one like the complete responses always did.
+    """
+
+    THINK_START = "<think>"
+    THINK_END = "</think>"
+    JSON_MARKER = "**JSON Response:**"
+
+    def __init__(self):
+        # None until the stream shows whether it opens with the think tag
+        self.in_reasoning: Optional[bool] = None
+        self._buffer = ""
+        self._content_started = False
+
+    @classmethod
+    def split(cls, text: str) -> tuple[str, str]:
+        """Split a complete response into (reasoning, content)"""
+        parser = cls()
+        reasoning, content = parser.feed(text)
+        rest_reasoning, rest_content = parser.flush()
+        return reasoning + rest_reasoning, (content + rest_content).split(cls.JSON_MARKER)[-1]
+
+    def feed(self, chunk: str) -> tuple[str, str]:
+        """Consume a chunk and return the (reasoning, content) that became available"""
+        self._buffer += chunk
+        reasoning, content = "", ""
+        if self.in_reasoning is None:
+            if self._buffer.lstrip().startswith(self.THINK_START):
+                self._buffer = self._buffer.lstrip()[len(self.THINK_START):]
+                self.in_reasoning = True
+            elif self.THINK_START.startswith(self._buffer.lstrip()):
+                # not enough text to tell if the reasoning tag is coming
+                return reasoning, content
+            else:
+                self.in_reasoning = False
+        if self.in_reasoning:
+            if self.THINK_END in self._buffer:
+                reasoning, self._buffer = self._buffer.split(self.THINK_END, 1)
+                self.in_reasoning = False
+            else:
+                keep = len(self.THINK_END) - 1
+                reasoning, self._buffer = self._buffer[:-keep], self._buffer[-keep:]
+                return reasoning, content
+        if not self._content_started:
+            # drop the text before the JSON marker once we know whether it is there
+            if self.JSON_MARKER in self._buffer:
+                self._buffer = self._buffer.split(self.JSON_MARKER, 1)[1]
+            elif "{" not in self._buffer and "`" not in self._buffer:
+                return reasoning, content
+            self._content_started = True
+        content, self._buffer = self._buffer, ""
+        return reasoning, content
+
+    def flush(self) -> tuple[str, str]:
+        """Return the text still held back at the end of the stream"""
+        buffer, self._buffer = self._buffer, ""
+        if self.in_reasoning:
+            return buffer, ""
+        if self.in_reasoning is None:
+            # a stream too short to hold the think tag
+            return "", buffer
+        if not self._content_started and self.JSON_MARKER in buffer:
+            buffer = buffer.split(self.JSON_MARKER, 1)[1]
+        return "", buffer
+
 
 class DeepSeekR1ChatOpenAI(ChatOpenAI):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
-        self.client = OpenAI(
-            base_url=kwargs.get("base_url"),
-            api_key=kwargs.get("api_key")
-        )
+        # the clients built on the http clients passed in share their connection pools
+        if self.http_client is None:
+            self.client = get_openai_client(kwargs.get("base_url"), kwargs.get("api_key"))
+        else:
+            self.client = self.root_client
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        if self.http_async_client is not None:
+            return self.root_async_client
+        api_key = self.openai_api_key.get_secret_value() if self.openai_api_key else None
+        return get_async_openai_client(self.openai_api_base, api_key)
 
     async def ainvoke(
             self,
@@ -58,16 +176,9 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
             stop: Optional[list[str]] = None,
             **kwargs: Any,
     ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
+        message_history = convert_to_openai_messages(input)
 
-        response = self.client.chat.completions.create(
+        response = await self._get_async_client().chat.completions.create(
             model=self.model_name,
             messages=message_history
         )
@@ -76,6 +187,32 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
         content = response.choices[0].message.content
         return AIMessage(content=content, reasoning_content=reasoning_content)
 
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Stream the reasoning (in additional_kwargs) and the content as separate chunks"""
+        message_history = convert_to_openai_messages(input)
+
+        stream = await self._get_async_client().chat.completions.create(
+            model=self.model_name,
+            messages=message_history,
+            stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning_content = getattr(delta, "reasoning_content", None)
+            if reasoning_content:
+                yield AIMessageChunk(content="", additional_kwargs={"reasoning_content": reasoning_content})
+            if delta.content:
+                yield AIMessageChunk(content=delta.content)
+
     def invoke(
             self,
             input: LanguageModelInput,
@@ -84,14 +221,7 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
             stop: Optional[list[str]] = None,
             **kwargs: Any,
     ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
+        message_history = convert_to_openai_messages(input)
 
         response = self.client.chat.completions.create(
             model=self.model_name,
@@ -113,13 +243,35 @@ class DeepSeekR1ChatOllama(ChatOllama):
             stop: Optional[list[str]] = None,
             **kwargs: Any,
     ) -> AIMessage:
-        org_ai_message = await super().ainvoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+        reasoning_content = ""
+        content = ""
+        async for chunk in self.astream(input, config, stop=stop, **kwargs):
+            reasoning_content += chunk.additional_kwargs.get("reasoning_content", "")
+            content += chunk.content
+        # the whole content is known, keep what follows the last JSON marker
+        return AIMessage(content=content.split(ThinkTagParser.JSON_MARKER)[-1], reasoning_content=reasoning_content)
+
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Stream the reasoning (in additional_kwargs) and the content, splitting think tags on the fly"""
+        parser = ThinkTagParser()
+        async for chunk in super().astream(input, config, stop=stop, **kwargs):
+            reasoning_content, content = parser.feed(str(chunk.content))
+            if reasoning_content:
+                yield AIMessageChunk(content="", additional_kwargs={"reasoning_content": reasoning_content})
+            if content:
+                yield AIMessageChunk(content=content)
+        reasoning_content, content = parser.flush()
+        if reasoning_content:
+            yield AIMessageChunk(content="", additional_kwargs={"reasoning_content": reasoning_content})
+        if content:
+            yield AIMessageChunk(content=content)
 
     def invoke(
             self,
@@ -130,9 +282,5 @@ class DeepSeekR1ChatOllama(ChatOllama):
             **kwargs: Any,
     ) -> AIMessage:
         org_ai_message = super().invoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
+        reasoning_content, content = ThinkTagParser.split(str(org_ai_message.content))
         return AIMessage(content=content, reasoning_content=reasoning_content)
@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, convert_to_messages
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
+from pydantic import ConfigDict, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Parts of the prompt that change between otherwise identical requests
+VOLATILE_PATTERNS = [
+    re.compile(r"Current date and time: [0-9-]+ [0-9:]+"),
+]
+
+
+def normalize_messages(messages: List[BaseMessage]) -> str:
+    """Serialize a message list for hashing, without its volatile parts"""
+
+    def normalize_text(text: str) -> str:
+        for pattern in VOLATILE_PATTERNS:
+            text = pattern.sub("", text)
+        return text
+
+    normalized = []
+    for message in messages:
+        if isinstance(message.content, list):
+            content = []
+            for item in message.content:
+                if isinstance(item, dict) and item.get("type") == "image_url":
+                    url = item["image_url"]["url"] if isinstance(item["image_url"], dict) else item["image_url"]
+                    content.append({"image": hashlib.sha256(url.encode("utf-8")).hexdigest()})
+                elif isinstance(item, dict) and "text" in item:
+                    content.append({"text": normalize_text(item["text"])})
+                else:
+                    content.append(normalize_text(str(item)))
+        else:
+            content = normalize_text(message.content)
+        normalized.append({
+            "type": message.type,
+            "content": content,
+            "tool_calls": getattr(message, "tool_calls", None) or None,
+        })
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class LLMResponseCache:
+    """
+    On-disk LRU cache of LLM responses, one JSON file per response.
+    Entries expire after ttl seconds and the least recently used ones are evicted above max_size bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 512 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = []
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith(".json"):
+                stat = os.stat(os.path.join(cache_dir, file_name))
+                entries.append((stat.st_mtime, file_name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        """Get a cached response, None on a miss or an expired entry"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            if time.time() - entry["created"] > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            # touch the file so the LRU order survives a restart
+            os.utime(self._path(key))
+            self._index.move_to_end(key)
+            self.hits += 1
+        message = AIMessage(content=entry["content"], additional_kwargs=entry.get("additional_kwargs", {}))
+        if entry.get("reasoning_content") is not None:
+            message.reasoning_content = entry["reasoning_content"]
+        return message
+
+    def put(self, key: str, message: BaseMessage) -> None:
+        """Store a response and evict the least recently used ones above max_size"""
+        data = json.dumps({
+            "created": time.time(),
+            "content": message.content,
+            "additional_kwargs": message.additional_kwargs,
+            "reasoning_content": getattr(message, "reasoning_content", None),
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            if key in self._index:
+                self._size -= self._index.pop(key)
+            self._index[key] = len(data.encode("utf-8"))
+            self._size += self._index[key]
+            while self._size > self.max_size and len(self._index) > 1:
+                self._remove(next(iter(self._index)))
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    Chat model answering from an LLMResponseCache before calling the wrapped model.
+    Identical requests in flight at the same time share a single call to the wrapped model.
+    A caller that can't use a response evicts it, so that a retry asks the wrapped model again.
+    """
+
+    llm: BaseChatModel
+    response_cache: Any
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _inflight: dict[str, asyncio.Future] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.llm._llm_type}"
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None)
+
+    def _cache_key(self, input: LanguageModelInput, stop: Optional[list[str]] = None, **kwargs: Any) -> str:
+        messages = convert_to_messages(input)
+        # the call options, like the tools or the response format, change the response too
+        llm_string = self.llm._get_llm_string(stop=stop, **kwargs)
+        return hashlib.sha256((llm_string + normalize_messages(messages)).encode("utf-8")).hexdigest()
+
+    def evict(self, input: LanguageModelInput, stop: Optional[list[str]] = None, **kwargs: Any) -> None:
+        """Drop the cached response to a request, called with the same arguments"""
+        self.response_cache.remove(self._cache_key(input, stop=stop, **kwargs))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self.invoke(messages, stop=stop, **kwargs))])
+
+    def invoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> BaseMessage:
+        key = self._cache_key(input, stop=stop, **kwargs)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.llm.invoke(input, config, stop=stop, **kwargs)
+        self.response_cache.put(key, response)
+        return response
+
+    async def ainvoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> BaseMessage:
+        key = self._cache_key(input, stop=stop, **kwargs)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return (await asyncio.shield(inflight)).model_copy(deep=True)
+            except asyncio.CancelledError:
+                current_task = asyncio.current_task()
+                if not inflight.cancelled() or (current_task and current_task.cancelling()):
+                    raise
+                # the shared call was cancelled by its owner, make our own call
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await asyncio.to_thread(self.response_cache.get, key)
+            if response is None:
+                response = await self.llm.ainvoke(input, config, stop=stop, **kwargs)
+                await asyncio.to_thread(self.response_cache.put, key, response)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is raised here, don't warn about it being never retrieved
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Replay a cached response as a single chunk, otherwise stream and cache the wrapped model"""
+        key = self._cache_key(input, stop=stop, **kwargs)
+        cached = await asyncio.to_thread(self.response_cache.get, key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached.content, additional_kwargs=cached.additional_kwargs)
+            return
+        response = None
+        async for chunk in self.llm.astream(input, config, stop=stop, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            await asyncio.to_thread(self.response_cache.put, key, response)
+
+    def bind_tools(self, *args: Any, **kwargs: Any):
+        return self.llm.bind_tools(*args, **kwargs)
+
+    def with_structured_output(self, *args: Any, **kwargs: Any):
+        return self.llm.with_structured_output(*args, **kwargs)
+
+
+def evict_cached_response(llm: BaseChatModel, input: LanguageModelInput) -> None:
+    """Drop the cached response of llm to input, if it caches its responses, after it failed to parse"""
+    if isinstance(llm, CachedChatModel):
+        llm.evict(input)
+
+
+def unwrap_chat_model(llm: BaseChatModel) -> BaseChatModel:
+    """Get the provider model behind wrappers like CachedChatModel"""
+    while isinstance(getattr(llm, "llm", None), BaseChatModel):
+        llm = llm.llm
+    return llm
+
+
+_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Get the process-wide response cache configured by the LLM_RESPONSE_CACHE_* variables"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = LLMResponseCache(
+            cache_dir=os.getenv("LLM_RESPONSE_CACHE_DIR", "./tmp/llm_cache"),
+            max_size=int(float(os.getenv("LLM_RESPONSE_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            ttl=float(os.getenv("LLM_RESPONSE_CACHE_TTL", str(7 * 24 * 3600))),
+        )
+    return _response_cache
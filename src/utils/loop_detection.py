@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+from browser_use.browser.views import BrowserState
+
+logger = logging.getLogger(__name__)
+
+HINT = "hint"
+ESCALATE = "escalate"
+STOP = "stop"
+
+
+def state_fingerprint(state: BrowserState) -> str:
+    """Hash of the url and the interactive elements of a page, equal for pages the agent can't tell apart"""
+    digest = hashlib.sha256(state.url.encode("utf-8"))
+    for index, element in sorted(state.selector_map.items()):
+        digest.update(f"\n{index}:{element.xpath}:{sorted(element.attributes.items())}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def step_fingerprint(state_hash: str, actions: List[dict]) -> str:
+    """Hash of a page state and the actions taken on it"""
+    return hashlib.sha256(f"{state_hash}\n{json.dumps(actions, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class LoopVerdict:
+    reason: str  # "cycle" or "stall"
+    response: str  # HINT, ESCALATE or STOP
+    message: str
+
+
+class LoopDetector:
+    """
+    Fingerprints every step as (url, DOM hash, actions) and detects when the agent is stuck:
+    the same step repeated within the window (a cycle), or a page unchanged for several steps without
+    extracting anything (a stall). The response to a detection grows from a hint to escalation to stopping.
+    """
+
+    def __init__(self, window: int = 10, max_repeats: int = 3, max_stall_steps: int = 4, can_escalate: bool = False):
+        self.max_repeats = max_repeats
+        self.max_stall_steps = max_stall_steps
+        self.responses = [HINT, ESCALATE, STOP] if can_escalate else [HINT, STOP]
+        self.steps: deque[str] = deque(maxlen=window)
+        self.last_state_hash: Optional[str] = None
+        self.stall_steps = 0
+        self.detections = 0
+
+    def observe(self, state: BrowserState, actions: List[dict], made_progress: bool = False) -> Optional[LoopVerdict]:
+        """Record a step, returns what to do if the agent looks stuck"""
+        state_hash = state_fingerprint(state)
+        fingerprint = step_fingerprint(state_hash, actions)
+        self.steps.append(fingerprint)
+        if state_hash == self.last_state_hash and not made_progress:
+            self.stall_steps += 1
+        else:
+            self.stall_steps = 0
+        self.last_state_hash = state_hash
+
+        if self.steps.count(fingerprint) >= self.max_repeats:
+            reason = "cycle"
+            message = (f"You repeated the same actions on the same page {self.steps.count(fingerprint)} times "
+                       f"in the last {len(self.steps)} steps without getting closer to the goal.")
+        elif self.stall_steps >= self.max_stall_steps:
+            reason = "stall"
+            message = f"The page has not changed for {self.stall_steps} steps."
+        else:
+            return None
+
+        response = self.responses[min(self.detections, len(self.responses) - 1)]
+        self.detections += 1
+        # count the next detection from scratch
+        self.steps.clear()
+        self.stall_steps = 0
+        if response != STOP:
+            message += " Try a different approach: another element, another page, or a search."
+        logger.warning(f"🔁 Loop detected ({reason}), response: {response}")
+        return LoopVerdict(reason=reason, response=response, message=message)
@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from browser_use.browser.views import BrowserState
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from .loop_detection import state_fingerprint
+from .step_profiler import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+PRIMARY_TIER = "primary"
+
+
+class TierStats:
+    """Calls, valid outputs and latency of one model tier"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.latency = LatencyHistogram()
+
+    def record(self, seconds: float, valid: bool) -> None:
+        self.calls += 1
+        self.hits += valid
+        self.latency.observe(seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.calls if self.calls else 0.0,
+            "latency": self.latency.to_dict(),
+        }
+
+
+# tier -> model name -> stats of all the runs, and the escalations of all the runs by reason
+_tier_stats: Dict[str, Dict[str, TierStats]] = {}
+_escalations: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+
+
+def get_model_name(llm: BaseChatModel) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def get_cascade_stats() -> dict:
+    """Snapshot of the tier stats of all the runs as {"tiers": {tier: {model_name: ...}}, "escalations": ...}"""
+    with _stats_lock:
+        return {
+            "tiers": {tier: {model_name: stats.to_dict() for model_name, stats in models.items()}
+                      for tier, models in _tier_stats.items()},
+            "escalations": dict(_escalations),
+        }
+
+
+class ModelCascade:
+    """
+    Routes every step to the fast model first and to the primary model when the fast one is not enough:
+    after a parse failure, a failed previous goal, or a page state that did not change.
+    The stats are kept per run, and added to the stats of all the runs reported by get_cascade_stats().
+    """
+
+    def __init__(self, fast_llm: BaseChatModel, primary_llm: BaseChatModel):
+        self.llms = {FAST_TIER: fast_llm, PRIMARY_TIER: primary_llm}
+        self.stats = {FAST_TIER: TierStats(), PRIMARY_TIER: TierStats()}
+        self.escalations: Dict[str, int] = {}
+        self._last_fingerprint: Optional[str] = None
+        self._forced_reason: Optional[str] = None
+
+    def select(self, state: Optional[BrowserState], last_evaluation: Optional[str],
+               consecutive_failures: int = 0) -> Tuple[str, Optional[str]]:
+        """Tier of the step and the reason of the escalation, if any"""
+        fingerprint = state_fingerprint(state) if state is not None else None
+        repeated = fingerprint is not None and fingerprint == self._last_fingerprint
+        self._last_fingerprint = fingerprint
+
+        reason, self._forced_reason = self._forced_reason, None
+        if reason is None:
+            if consecutive_failures > 0:
+                reason = "step_failure"
+            elif last_evaluation and "Failed" in last_evaluation:
+                reason = "failed_goal"
+            elif repeated:
+                reason = "repeated_state"
+        if reason is None:
+            return FAST_TIER, None
+        self.escalate(reason)
+        return PRIMARY_TIER, reason
+
+    def force_primary(self, reason: str) -> None:
+        """Send the next step to the primary model"""
+        self._forced_reason = reason
+
+    def escalate(self, reason: str) -> None:
+        self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        with _stats_lock:
+            _escalations[reason] = _escalations.get(reason, 0) + 1
+        logger.info(f"⬆️ Escalating the step to the primary model: {reason}")
+
+    def record(self, tier: str, seconds: float, valid: bool) -> None:
+        """Count an llm call of a tier and whether its output could be parsed"""
+        self.stats[tier].record(seconds, valid)
+        with _stats_lock:
+            _tier_stats.setdefault(tier, {}).setdefault(get_model_name(self.llms[tier]), TierStats()) \
+                .record(seconds, valid)
+
+    def to_dict(self) -> dict:
+        return {
+            "tiers": {tier: stats.to_dict() for tier, stats in self.stats.items()},
+            "escalations": dict(self.escalations),
+        }
+
+    def log_stats(self) -> None:
+        parts: List[str] = []
+        for tier, stats in self.stats.items():
+            parts.append(f"{tier} {stats.hits}/{stats.calls} valid, "
+                         f"p50 {stats.latency.percentile(50):.2f}s")
+        logger.info(f"🪜 Model cascade: {'; '.join(parts)}, escalations: {self.escalations}")
@@ -0,0 +1,124 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from .step_profiler import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# threads for the blocking file work and the CPU work on unpicklable objects
+OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", "8"))
+# processes for the CPU work on picklable arguments, 0 runs it on the threads
+OFFLOAD_PROCESSES = int(os.getenv("OFFLOAD_PROCESSES", "0"))
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pools_lock = threading.Lock()
+
+
+def configure_pools(threads: int = OFFLOAD_THREADS, processes: int = OFFLOAD_PROCESSES) -> None:
+    """Replace the worker pools, the running jobs of the previous ones finish first"""
+    global _thread_pool, _process_pool
+    with _pools_lock:
+        old_pools = [_thread_pool, _process_pool]
+        _thread_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="offload")
+        # spawned, forking a process running an event loop and threads is unsafe
+        _process_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) \
+            if processes > 0 else None
+    for pool in old_pools:
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+def _get_thread_pool() -> Executor:
+    if _thread_pool is None:
+        configure_pools()
+    return _thread_pool
+
+
+def shutdown_pools() -> None:
+    global _thread_pool, _process_pool
+    with _pools_lock:
+        pools, _thread_pool, _process_pool = [_thread_pool, _process_pool], None, None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking file or CPU work on the offload threads"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_thread_pool(), functools.partial(func, *args, **kwargs))
+
+
+async def run_in_process(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run CPU work on the offload processes, on the threads if there are none. func and args must be picklable"""
+    pool = _process_pool if _process_pool is not None else _get_thread_pool()
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a periodic timer, and flags the calls blocking it:
+    a watchdog thread logs the stack of the loop thread once the loop has been stuck for threshold_ms.
+    """
+
+    def __init__(self, threshold_ms: float = 100, interval: float = 0.05):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.lag = LatencyHistogram()
+        self.blocked = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag.observe(max(now - expected, 0.0))
+            self._last_beat = now
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            stuck = time.monotonic() - last_beat - self.interval
+            if stuck < self.threshold or last_beat == reported_beat:
+                continue
+            # report every blocking call once
+            reported_beat = last_beat
+            self.blocked += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            logger.warning(f"🐢 Event loop blocked for {stuck * 1000:.0f} ms by:\n{stack}")
+
+    def to_dict(self) -> dict:
+        return {"threshold_ms": self.threshold * 1000, "blocked": self.blocked, "lag": self.lag.to_dict()}
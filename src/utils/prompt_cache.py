@@ -0,0 +1,49 @@
+from typing import List, Optional, Tuple
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+
+from .llm_cache import unwrap_chat_model
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_cache_control(llm: BaseChatModel) -> bool:
+    """Whether the llm takes explicit prompt cache breakpoints, other providers cache prefixes automatically"""
+    return isinstance(unwrap_chat_model(llm), ChatAnthropic)
+
+
+def _with_cache_control(message: BaseMessage) -> BaseMessage:
+    if isinstance(message.content, str):
+        content = [{"type": "text", "text": message.content, "cache_control": CACHE_CONTROL}]
+    else:
+        content = [dict(item) if isinstance(item, dict) else {"type": "text", "text": item} for item in message.content]
+        if not content:
+            return message
+        content[-1]["cache_control"] = CACHE_CONTROL
+    return message.model_copy(update={"content": content})
+
+
+def add_cache_breakpoints(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Mark the end of the system prompt and the end of the history before the state message as cache breakpoints.
+    The history messages are copied, not changed.
+    """
+    messages = list(messages)
+    breakpoints = {0}
+    if len(messages) > 2:
+        breakpoints.add(len(messages) - 2)
+    for i in breakpoints:
+        if messages[i].content:
+            messages[i] = _with_cache_control(messages[i])
+    return messages
+
+
+def get_cached_input_tokens(usage: Optional[UsageMetadata]) -> Tuple[Optional[int], Optional[int]]:
+    """Split the input tokens reported by the provider into (cached, uncached), (None, None) if not reported"""
+    if not usage:
+        return None, None
+    cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    return cached, usage["input_tokens"] - cached
@@ -0,0 +1,62 @@
+import logging
+from typing import Dict, List, Optional
+
+from browser_use.agent.views import AgentHistory
+from browser_use.browser.views import BrowserState
+from browser_use.controller.registry.views import ActionModel
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.history_tree_processor.view import DOMHistoryElement
+from browser_use.dom.views import DOMElementNode
+
+logger = logging.getLogger(__name__)
+
+# attributes that identify an element across page loads, unlike classes or values
+IDENTIFYING_ATTRIBUTES = ("id", "name", "type", "role", "aria-label", "placeholder", "title", "alt", "href",
+                          "data-testid")
+
+
+def element_identity(attributes: Dict[str, str]) -> Dict[str, str]:
+    return {name: attributes[name] for name in IDENTIFYING_ATTRIBUTES if name in attributes}
+
+
+def resolve_element(historical: DOMHistoryElement, state: BrowserState) -> Optional[DOMElementNode]:
+    """
+    Find the element a saved step interacted with on the current page.
+    Tries the exact hash of browser-use first, then the same xpath with the same identifying attributes,
+    then the only element with the same tag and identifying attributes. None if the element is gone or ambiguous.
+    """
+    if state.element_tree is not None:
+        element = HistoryTreeProcessor.find_history_element_in_tree(historical, state.element_tree)
+        if element is not None and element.highlight_index is not None:
+            return element
+
+    identity = element_identity(historical.attributes)
+    candidates = [e for e in state.selector_map.values() if e.tag_name == historical.tag_name]
+    for element in candidates:
+        if element.xpath == historical.xpath and element_identity(element.attributes) == identity:
+            return element
+    if identity:
+        matches = [e for e in candidates if element_identity(e.attributes) == identity]
+        if len(matches) == 1:
+            return matches[0]
+    return None
+
+
+def replayable_actions(history_item: AgentHistory) -> List[ActionModel]:
+    """The actions of a saved step that executed without error"""
+    if not history_item.model_output or not history_item.model_output.action:
+        return []
+    actions = []
+    for action, result in zip(history_item.model_output.action, history_item.result):
+        if action is None or result.error:
+            break
+        actions.append(action)
+    return actions
+
+
+def is_done_action(action: ActionModel) -> bool:
+    return "done" in action.model_dump(exclude_unset=True)
+
+
+def same_page(url: str, recorded_url: str) -> bool:
+    return url.split("#")[0].rstrip("/") == recorded_url.split("#")[0].rstrip("/")
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from inspect import signature
+from typing import Any, Callable, Optional, Type
+
+from browser_use.controller.registry.service import Registry, Context
+from browser_use.controller.registry.views import ActionModel
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_SIZE = 32
+
+
+class SchemaCache:
+    """LRU cache of the pydantic models and prompt texts derived from an action registry"""
+
+    def __init__(self, max_size: int = SCHEMA_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        # created outside the lock, two threads may both create a missing entry, the last one is kept
+        value = factory()
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+    def to_dict(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+_schema_cache = SchemaCache()
+
+
+def get_schema_cache() -> SchemaCache:
+    return _schema_cache
+
+
+def _model_signature(model: Type[BaseModel]) -> str:
+    fields = [f"{name}:{field.annotation}={field.default!r}:{field.description}"
+              for name, field in model.model_fields.items()]
+    return f"{model.__name__}({', '.join(fields)})"
+
+
+def registry_signature(registry: Registry) -> str:
+    """Hash of the names, descriptions and parameters of the registered actions"""
+    digest = hashlib.sha256()
+    for name, action in registry.registry.actions.items():
+        digest.update(f"{name}\n{action.description}\n{_model_signature(action.param_model)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CachedRegistry(Registry[Context]):
+    """
+    Registry sharing its parameter models, action model and action descriptions with every other registry
+    of the same actions, so that creating a controller and an agent does not build them again.
+    """
+
+    def _create_param_model(self, function: Callable) -> Type[BaseModel]:
+        key = ("param_model", function.__module__, function.__qualname__, str(signature(function)))
+        return _schema_cache.get_or_create(key, lambda: super(CachedRegistry, self)._create_param_model(function))
+
+    def create_action_model(self, include_actions: Optional[list[str]] = None) -> Type[ActionModel]:
+        key = ("action_model", registry_signature(self), tuple(include_actions) if include_actions else None)
+        return _schema_cache.get_or_create(
+            key, lambda: super(CachedRegistry, self).create_action_model(include_actions))
+
+    def get_prompt_description(self) -> str:
+        key = ("prompt_description", registry_signature(self))
+        return _schema_cache.get_or_create(key, lambda: super(CachedRegistry, self).get_prompt_description())
+
+
+def use_cached_registry(registry: Registry) -> CachedRegistry:
+    """A cached registry with the actions of registry"""
+    cached = CachedRegistry(registry.exclude_actions)
+    cached.registry = registry.registry
+    return cached
+
+
+def cached_output_model(action_model: Type[ActionModel], factory: Callable[[Type[ActionModel]], Type[BaseModel]]) \
+        -> Type[BaseModel]:
+    """Agent output model of an action model, built once per action model"""
+    return _schema_cache.get_or_create(("output_model", action_model, factory), lambda: factory(action_model))
+
@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from PIL import Image
+
+from .llm_cache import unwrap_chat_model
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_MESSAGE_ID = "screenshot"
+
+# Default image token budget per provider, a full HD screenshot costs about 2765 tokens on anthropic
+DEFAULT_IMAGE_TOKEN_BUDGETS = {
+    "anthropic": 1200,
+    "openai": 765,
+    "google": 258,
+    "default": 1200,
+}
+
+
+def get_image_provider(llm: BaseChatModel) -> str:
+    """Provider whose image token pricing applies to the llm"""
+    llm = unwrap_chat_model(llm)
+    if isinstance(llm, ChatAnthropic):
+        return "anthropic"
+    if isinstance(llm, BaseChatOpenAI):
+        return "openai"
+    if isinstance(llm, ChatGoogleGenerativeAI):
+        return "google"
+    return "default"
+
+
+def image_token_cost(width: int, height: int, provider: str = "default") -> int:
+    """Estimated input tokens of an image of the given size"""
+    if provider == "openai":
+        # high detail: fit in 2048x2048, shortest side to 768, then 170 tokens per 512px tile
+        scale = min(1.0, 2048 / max(width, height))
+        scale *= min(1.0, 768 / (min(width, height) * scale))
+        tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+        return 85 + 170 * tiles
+    if provider == "google":
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+    return math.ceil(width * height / 750)
+
+
+def screenshot_hash(image: Image.Image, max_size: int = 640) -> str:
+    """
+    Exact hash of the pixels of a thumbnail. Any visible change, a typed character or a ticked checkbox,
+    changes it, while the thumbnail keeps hashing cheap.
+    """
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((max_size, max_size), Image.Resampling.BILINEAR)
+    return hashlib.sha1(thumbnail.tobytes()).hexdigest()
+
+
+@dataclass
+class PreparedScreenshot:
+    screenshot: str
+    hash: str
+    full_tokens: int
+    tokens: int
+    downscaled: bool
+    # None when the screenshot is the one sent last, it is only encoded to be sent
+    image_url: Optional[str]
+
+
+class ScreenshotOptimizer:
+    """
+    Skips screenshots identical to the previous one and downscales the others to an image token budget.
+    The sent screenshot is pinned in the message history, the following state messages refer to it while
+    the page is unchanged. Keeps the number of image tokens saved over the task.
+    Decoding, hashing and encoding are done by prepare(), which the message manager runs on the offload
+    threads before the state message is built.
+    """
+
+    def __init__(
+            self,
+            provider: str = "default",
+            max_image_tokens: Optional[int] = None,
+            jpeg_quality: int = 80,
+    ):
+        self.provider = provider
+        self.max_image_tokens = max_image_tokens or DEFAULT_IMAGE_TOKEN_BUDGETS.get(
+            provider, DEFAULT_IMAGE_TOKEN_BUDGETS["default"])
+        self.jpeg_quality = jpeg_quality
+        self.last_hash: Optional[str] = None
+        self._prepared: Optional[PreparedScreenshot] = None
+        # image the message manager has to pin in the history
+        self.pending_image: Optional[str] = None
+        self.images = 0
+        self.skipped_images = 0
+        self.downscaled_images = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    def _target_size(self, width: int, height: int) -> tuple[int, int]:
+        if image_token_cost(width, height, self.provider) <= self.max_image_tokens:
+            return width, height
+        # binary search of the largest scale within the budget
+        low, high = 0.0, 1.0
+        for _ in range(16):
+            scale = (low + high) / 2
+            if image_token_cost(max(int(width * scale), 1), max(int(height * scale), 1),
+                                self.provider) <= self.max_image_tokens:
+                low = scale
+            else:
+                high = scale
+        return max(int(width * low), 1), max(int(height * low), 1)
+
+    def prepare(self, screenshot: str) -> None:
+        """Decode and hash a base64 PNG screenshot, and downscale and encode it unless it was sent last"""
+        image = Image.open(io.BytesIO(base64.b64decode(screenshot)))
+        image_hash = screenshot_hash(image)
+        width, height = self._target_size(image.width, image.height)
+        image_url = None
+        if image_hash != self.last_hash:
+            resized = image.resize((width, height), Image.Resampling.LANCZOS) if (width, height) != image.size \
+                else image
+            buffer = io.BytesIO()
+            resized.convert("RGB").save(buffer, format="JPEG", quality=self.jpeg_quality)
+            image_url = f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+        self._prepared = PreparedScreenshot(
+            screenshot=screenshot,
+            hash=image_hash,
+            full_tokens=image_token_cost(image.width, image.height, self.provider),
+            tokens=image_token_cost(width, height, self.provider),
+            downscaled=(width, height) != image.size,
+            image_url=image_url,
+        )
+
+    def process(self, screenshot: str) -> Optional[str]:
+        """
+        Get the data url of a base64 PNG screenshot to send to the llm, also left in pending_image,
+        None if it is identical to the previously sent one. Prepares the screenshot unless prepare() did.
+        """
+        prepared = self._prepared
+        # prepared for another screenshot, or left unencoded before reset()
+        if prepared is None or prepared.screenshot is not screenshot or \
+                (prepared.image_url is None and prepared.hash != self.last_hash):
+            self.prepare(screenshot)
+            prepared = self._prepared
+        self._prepared = None
+        self.images += 1
+
+        if prepared.hash == self.last_hash:
+            self.skipped_images += 1
+            self.tokens_saved += prepared.full_tokens
+            return None
+        self.last_hash = prepared.hash
+        if prepared.downscaled:
+            self.downscaled_images += 1
+        self.tokens_sent += prepared.tokens
+        self.tokens_saved += prepared.full_tokens - prepared.tokens
+        self.pending_image = prepared.image_url
+        return self.pending_image
+
+    def reset(self) -> None:
+        """Send the next screenshot even if it is unchanged"""
+        self.last_hash = None
+
+    def log_stats(self) -> None:
+        logger.info(f"🖼️ Image tokens saved: {self.tokens_saved} ({self.tokens_sent} sent, "
+                    f"{self.skipped_images}/{self.images} screenshots skipped, "
+                    f"{self.downscaled_images} downscaled)")
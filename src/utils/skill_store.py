@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from browser_use.agent.views import ActionResult, AgentHistoryList
+from browser_use.browser.context import BrowserContext
+from browser_use.dom.history_tree_processor.view import DOMHistoryElement
+from pydantic import BaseModel
+
+from .replay import replayable_actions, resolve_element
+
+logger = logging.getLogger(__name__)
+
+# actions that move through a site, the ones worth repeating as a skill
+NAVIGATION_ACTIONS = frozenset([
+    "go_to_url", "go_back", "click_element", "input_text", "send_keys", "switch_tab", "open_tab",
+    "scroll_down", "scroll_up", "scroll_to_text", "select_dropdown_option", "wait",
+])
+
+
+def get_domain(url: str) -> str:
+    netloc = urlparse(url).netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def _slug(text: str, max_length: int = 40) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")[:max_length].rstrip("_")
+
+
+# typed texts are stored as <input>name</input>, or as the <secret>name</secret> placeholder the agent typed
+_PLACEHOLDER_RE = re.compile(r"^<(input|secret)>(.*)</\1>$", re.DOTALL)
+# attributes naming an input field, the first one found names the skill parameter
+_NAMING_ATTRIBUTES = ("name", "aria-label", "placeholder", "id")
+
+
+class SkillStep(BaseModel):
+    url: str
+    # action name -> params, as in the model output
+    actions: List[Dict[str, Any]]
+    # element every action interacted with, None for the actions without index
+    elements: List[Optional[Dict[str, Any]]]
+
+
+class Skill(BaseModel):
+    """Sequence of navigation actions that reached a goal on a site in a successful run"""
+
+    name: str
+    domain: str
+    intent: str
+    steps: List[SkillStep]
+    successes: int = 1
+    failures: int = 0
+
+    def input_names(self) -> List[str]:
+        """Names of the texts the skill types, in order, to pass as inputs"""
+        return [_PLACEHOLDER_RE.match(params["text"]).group(2) for step in self.steps for action in step.actions
+                for name, params in action.items() if name == "input_text"]
+
+    def describe(self) -> str:
+        description = f"{self.name}: {self.intent}"
+        names = self.input_names()
+        if names:
+            description += f" [inputs: {json.dumps(names)}]"
+        return description
+
+
+def _parameterize(steps: List[SkillStep]) -> List[SkillStep]:
+    """
+    Replace the texts typed by the input_text actions with placeholders named after their input field,
+    the values typed in a run are not stored nor shown to the llm
+    """
+    used_names = set()
+    for step in steps:
+        for action, element in zip(step.actions, step.elements):
+            params = action.get("input_text")
+            if params is None:
+                continue
+            match = _PLACEHOLDER_RE.match(str(params.get("text", "")))
+            if match is not None and match.group(1) == "secret":
+                name = match.group(2)
+            else:
+                attributes = (element or {}).get("attributes") or {}
+                name = next((_slug(attributes[a], 20) for a in _NAMING_ATTRIBUTES
+                             if _slug(attributes.get(a) or "", 20)), "text")
+                base_name, n = name, 2
+                while name in used_names:
+                    name, n = f"{base_name}_{n}", n + 1
+                params["text"] = f"<input>{name}</input>"
+            used_names.add(name)
+    return steps
+
+
+def _skill_key(steps: List[SkillStep]) -> str:
+    """Where the skill starts and which actions it runs, the same skill learned twice has the same key"""
+    start = urlparse(steps[0].url)
+    path = start.path.rstrip("/") or "/"
+    names = []
+    for action in (action for step in steps for action in step.actions):
+        name, params = next(iter(action.items()))
+        names.append(f"{name}({_PLACEHOLDER_RE.match(params['text']).group(2)})" if name == "input_text" else name)
+    return f"{get_domain(steps[0].url)}{path}: {' > '.join(names)}"
+
+
+class SkillStore:
+    """
+    Skills learned from successful runs, keyed by their start page and action names and persisted to a json file.
+    Learning the same skill again replaces its actions with the latest ones.
+    The skills are shared by the runs, learned in a worker thread and used on the event loop, always under _lock.
+    """
+
+    def __init__(self, path: str = "./tmp/skills.json", min_actions: int = 2, max_steps_per_skill: int = 5):
+        self.path = path
+        self.min_actions = min_actions
+        self.max_steps_per_skill = max_steps_per_skill
+        self.skills: Dict[str, Skill] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.skills = {name: Skill.model_validate(skill) for name, skill in json.load(f).items()}
+            for skill in self.skills.values():
+                # files written before the texts were parameterized may hold typed values
+                _parameterize(skill.steps)
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: skill.model_dump() for name, skill in self.skills.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _segments(self, history: AgentHistoryList) -> List[List[SkillStep]]:
+        """Runs of consecutive steps on one domain made of navigation actions only"""
+        segments, current, domain = [], [], None
+        for history_item in history.history:
+            actions = replayable_actions(history_item)
+            names = [next(iter(a.model_dump(exclude_unset=True)), None) for a in actions]
+            navigation = 0
+            while navigation < len(names) and names[navigation] in NAVIGATION_ACTIONS:
+                navigation += 1
+            step_domain = get_domain(history_item.state.url)
+            if current and (step_domain != domain or len(current) >= self.max_steps_per_skill):
+                segments.append(current)
+                current = []
+            domain = step_domain
+            if navigation:
+                interacted = history_item.state.interacted_element or []
+                elements = []
+                for i in range(navigation):
+                    element = interacted[i] if i < len(interacted) else None
+                    elements.append({
+                        "tag_name": element.tag_name,
+                        "xpath": element.xpath,
+                        "entire_parent_branch_path": element.entire_parent_branch_path,
+                        "attributes": element.attributes,
+                    } if element is not None else None)
+                step = SkillStep(url=history_item.state.url,
+                                 actions=[a.model_dump(exclude_unset=True) for a in actions[:navigation]],
+                                 elements=elements)
+                current.append(step)
+            if navigation < len(names) or not names:
+                # the run went on with something else than navigating, the skill ends here
+                if current:
+                    segments.append(current)
+                current = []
+        if current:
+            segments.append(current)
+        return segments
+
+    def learn(self, history: AgentHistoryList) -> List[Skill]:
+        """Add the navigation sequences of a successful run as skills"""
+        if not history.is_done() or not history.is_successful():
+            return []
+        learned = []
+        with self._lock:
+            for steps in self._segments(history):
+                if sum(len(step.actions) for step in steps) < self.min_actions:
+                    continue
+                intent = _skill_key(_parameterize(steps))
+                domain = get_domain(steps[0].url)
+                name = f"{_slug(domain, 20)}_{hashlib.sha1(intent.encode('utf-8')).hexdigest()[:8]}"
+                skill = self.skills.get(name)
+                if skill is not None:
+                    skill.steps = steps
+                    skill.successes += 1
+                else:
+                    skill = self.skills[name] = Skill(name=name, domain=domain, intent=intent, steps=steps)
+                learned.append(skill)
+            if learned:
+                self._save()
+        if learned:
+            logger.info(f"🧰 Learned {len(learned)} skills: {', '.join(s.name for s in learned)}")
+        return learned
+
+    def get(self, name: str) -> Optional[Skill]:
+        with self._lock:
+            return self.skills.get(name)
+
+    def find(self, domain: Optional[str] = None) -> List[Skill]:
+        """Skills of a domain, or of all domains, the most reliable first"""
+        if domain is not None:
+            domain = domain.lower().removeprefix("www.")
+        with self._lock:
+            skills = [s for s in self.skills.values() if domain is None or s.domain == domain]
+        return sorted(skills, key=lambda s: s.successes - s.failures, reverse=True)
+
+    def describe(self, domain: Optional[str] = None, max_skills: int = 20) -> str:
+        """One line per skill of the domain, or of all domains"""
+        return "\n".join(skill.describe() for skill in self.find(domain)[:max_skills])
+
+    def record_result(self, name: str, success: bool) -> None:
+        with self._lock:
+            skill = self.skills.get(name)
+            if skill is None:
+                return
+            if success:
+                skill.successes += 1
+            else:
+                skill.failures += 1
+            self._save()
+
+
+async def execute_skill(
+        skill: Skill,
+        browser: BrowserContext,
+        execute_action: Callable[[str, dict], Awaitable[Any]],
+        inputs: Optional[List[str]] = None,
+) -> ActionResult:
+    """
+    Run the actions of a skill on the current page, validating the page after every action:
+    the domain must match, the elements must be found again and the actions must succeed.
+    Stops at the first failed validation, the agent then continues on its own.
+    """
+    inputs = list(inputs or [])
+    total = sum(len(step.actions) for step in skill.steps)
+    done = 0
+    for step in skill.steps:
+        for action, element in zip(step.actions, step.elements):
+            name, params = next(iter(action.items()))
+            params = dict(params)
+            state = await browser.get_state()
+            if get_domain(state.url) != skill.domain and name != "go_to_url":
+                return ActionResult(error=f"Skill {skill.name} stopped after {done}/{total} actions: "
+                                          f"left {skill.domain} for {state.url}", include_in_memory=True)
+            if name == "input_text":
+                if not inputs:
+                    return ActionResult(error=f"Skill {skill.name} stopped after {done}/{total} actions: "
+                                              f"pass the text for {params['text']} in inputs", include_in_memory=True)
+                params["text"] = inputs.pop(0)
+            if element is not None and "index" in params:
+                current = resolve_element(DOMHistoryElement(highlight_index=None, **element), state)
+                if current is None:
+                    return ActionResult(error=f"Skill {skill.name} stopped after {done}/{total} actions: "
+                                              f"element <{element['tag_name']}> not found", include_in_memory=True)
+                params["index"] = current.highlight_index
+            try:
+                result = await execute_action(name, params)
+            except Exception as e:
+                result = ActionResult(error=str(e))
+            if isinstance(result, ActionResult) and result.error:
+                return ActionResult(error=f"Skill {skill.name} stopped after {done}/{total} actions: {result.error}",
+                                    include_in_memory=True)
+            done += 1
+            await asyncio.sleep(browser.config.wait_between_actions)
+    return ActionResult(extracted_content=f"🧰 Ran skill {skill.name}: {skill.intent}", include_in_memory=True)
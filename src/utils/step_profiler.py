@@ -0,0 +1,108 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+
+
+class LatencyHistogram:
+    """Fixed bucket latency histogram"""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0 < q <= 100)"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class StepProfiler:
+    """
+    Collects the wall time of the phases of one agent step.
+    The time of a phase excludes the phases nested in it, so that the phases add up to the step.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        # time spent in the nested phases of every running phase, innermost last
+        self._nested: List[float] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start_time = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+
+# histograms of the latest tasks, the oldest ones are dropped above this
+MAX_TASK_HISTOGRAMS = 32
+
+# task_id -> phase -> histogram, least recently updated first
+_task_histograms: "OrderedDict[str, Dict[str, LatencyHistogram]]" = OrderedDict()
+# model_name -> phase -> histogram
+_model_histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+_histograms_lock = threading.Lock()
+
+
+def record_step_timings(task_id: str, model_name: str, timings: Dict[str, float]) -> None:
+    """Add the phase timings of a step to the task and model histograms"""
+    with _histograms_lock:
+        task_phases = _task_histograms.setdefault(task_id, {})
+        _task_histograms.move_to_end(task_id)
+        while len(_task_histograms) > MAX_TASK_HISTOGRAMS:
+            _task_histograms.popitem(last=False)
+        for phases in (task_phases, _model_histograms.setdefault(model_name, {})):
+            for phase, seconds in timings.items():
+                phases.setdefault(phase, LatencyHistogram()).observe(seconds)
+
+
+def get_latency_histograms() -> dict:
+    """
+    Snapshot of the histograms as {"task": {task_id: {phase: ...}}, "model": {model_name: {phase: ...}}},
+    with the latest MAX_TASK_HISTOGRAMS tasks
+    """
+    with _histograms_lock:
+        return {
+            scope: {key: {phase: histogram.to_dict() for phase, histogram in phases.items()}
+                    for key, phases in histograms.items()}
+            for scope, histograms in (("task", _task_histograms), ("model", _model_histograms))
+        }
@@ -0,0 +1,81 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from json_repair import repair_json
+
+logger = logging.getLogger(__name__)
+
+
+class AgentOutputStreamParser:
+    """
+    Incremental parser for the agent output JSON:
+    {"current_state": {...}, "action": [{...}, {...}]}
+    Feed it the text chunks of a streamed LLM response, every call to feed returns the actions
+    of the `action` list whose JSON object has been closed since the previous call, None for an action
+    that could not be loaded so that the actions keep their positions.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.current_state: Optional[Dict[str, Any]] = None
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key = ""
+        self._in_action_list = False
+        self._object_start = -1
+        self._object_key = ""
+
+    def feed(self, chunk: str) -> List[Optional[Dict[str, Any]]]:
+        """Consume a chunk of text and return the actions completed by it"""
+        self.text += chunk
+        actions = []
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = self.text[self._string_start + 1:self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._last_key == "action":
+                    self._in_action_list = True
+                elif (self._depth == 2 and char == "{" and self._last_key == "current_state") or \
+                        (self._depth == 3 and char == "{" and self._in_action_list):
+                    self._object_start = self._pos
+                    self._object_key = "action" if self._in_action_list else "current_state"
+            elif char in "}]":
+                if self._object_start >= 0 and self._depth == (3 if self._object_key == "action" else 2):
+                    parsed = self._load(self.text[self._object_start:self._pos + 1])
+                    if self._object_key == "action":
+                        actions.append(parsed)
+                    elif parsed is not None:
+                        self.current_state = parsed
+                    self._object_start = -1
+                if self._depth == 2 and char == "]":
+                    self._in_action_list = False
+                self._depth -= 1
+            self._pos += 1
+        return actions
+
+    @staticmethod
+    def _load(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return json.loads(repair_json(text))
+            except Exception as e:
+                logger.debug(f"Could not parse streamed object {text}: {e}")
+                return None
@@ -0,0 +1,57 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """
+    Counts the tokens of a text with a tiktoken encoding.
+    Falls back to a characters per token estimate if the encoding can't be loaded.
+    """
+
+    def __init__(self, encoding_name: Optional[str] = None, estimated_characters_per_token: int = 3):
+        self.encoding_name = encoding_name
+        self.estimated_characters_per_token = estimated_characters_per_token
+        self._encoding = None
+        self._loaded = encoding_name is None
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Could not load the {self.encoding_name} tokenizer, estimating tokens: {e}")
+                    self._loaded = True
+        return self._encoding
+
+    def __call__(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // self.estimated_characters_per_token
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+_token_counters: dict[str, TokenCounter] = {}
+
+
+def get_token_counter(llm: BaseChatModel) -> Optional[Callable[[str], int]]:
+    """Get a counter using the tokenizer of the llm's model, None if the model has no known tokenizer"""
+    model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    if not isinstance(model_name, str):
+        return None
+    try:
+        from tiktoken.model import encoding_name_for_model
+        encoding_name = encoding_name_for_model(model_name)
+    except (ImportError, KeyError):
+        return None
+    if encoding_name not in _token_counters:
+        _token_counters[encoding_name] = TokenCounter(encoding_name)
+    return _token_counters[encoding_name]
@@ -1,8 +1,15 @@
+import asyncio
 import base64
+import hashlib
+import logging
 import os
+import threading
 import time
+import weakref
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Optional
+import httpx
 import requests
 import json
 import gradio as gr
@@ -15,6 +22,7 @@ from langchain_ollama import ChatOllama
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 
 from .llm import DeepSeekR1ChatOpenAI, DeepSeekR1ChatOllama
+from .llm_cache import CachedChatModel, get_response_cache
 
 PROVIDER_DISPLAY_NAMES = {
     "openai": "OpenAI",
@@ -27,14 +35,115 @@ PROVIDER_DISPLAY_NAMES = {
     "unbound": "Unbound AI"
 }
 
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of LLM clients, so agent runs with the same configuration reuse
+# one client and its keep-alive connections instead of paying new TLS handshakes.
+LLM_MODEL_CACHE_SIZE = int(os.getenv("LLM_MODEL_CACHE_SIZE", "16"))
+_llm_model_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_llm_model_cache_lock = threading.Lock()
+
+# Shared http connection pools of OpenAI compatible endpoints, by base url, closed with the last cached
+# client using them
+_http_clients: Dict[str, tuple[httpx.Client, httpx.AsyncClient]] = {}
+_closing_tasks: set = set()
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+
+class LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport keeping a connection pool per event loop, since connections can't be shared across loops.
+    A cached LLM client using it can be called from any loop.
+    """
+
+    def __init__(self, limits: httpx.Limits = HTTP_POOL_LIMITS):
+        self.limits = limits
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+
+    def _get_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._get_transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the connection pool of the running loop, the pools of the other loops go with their loop"""
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def get_http_clients(base_url: Optional[str]) -> Dict[str, object]:
+    """Get the shared http clients of an endpoint as ChatOpenAI keyword arguments"""
+    key = base_url or ""
+    with _llm_model_cache_lock:
+        if key not in _http_clients:
+            _http_clients[key] = (httpx.Client(limits=HTTP_POOL_LIMITS, timeout=None),
+                                  httpx.AsyncClient(transport=LoopLocalAsyncTransport(HTTP_POOL_LIMITS), timeout=None))
+        http_client, http_async_client = _http_clients[key]
+    return {"http_client": http_client, "http_async_client": http_async_client}
+
+
+def _llm_cache_key(provider: str, kwargs: dict) -> tuple:
+    """Cache key of an LLM configuration, the api key is only kept as a hash"""
+    items = []
+    for name, value in sorted(kwargs.items()):
+        if name == "api_key":
+            value = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+        items.append((name, value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)))
+    return provider, tuple(items)
+
+
+def _pop_unused_http_clients(evicted_llms: list) -> list[tuple[httpx.Client, httpx.AsyncClient]]:
+    """Remove the http clients of the evicted LLM clients that no cached LLM client uses, under the cache lock"""
+    in_use = {id(getattr(llm, "http_client", None)) for llm in _llm_model_cache.values()}
+    evicted = {id(getattr(llm, "http_client", None)) for llm in evicted_llms}
+    unused_keys = [key for key, (http_client, _) in _http_clients.items()
+                   if id(http_client) in evicted and id(http_client) not in in_use]
+    return [_http_clients.pop(key) for key in unused_keys]
+
+
+def _close_http_clients(http_client: httpx.Client, http_async_client: httpx.AsyncClient) -> None:
+    """Close evicted http clients from sync code, the async pool of the running loop is closed by a task"""
+    http_client.close()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # no loop running, the async pools went with their loops
+        return
+    task = loop.create_task(http_async_client.aclose())
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+async def close_llm_clients():
+    """Drop all cached LLM clients and close their connection pools, on shutdown"""
+    with _llm_model_cache_lock:
+        _llm_model_cache.clear()
+        http_clients = list(_http_clients.values())
+        _http_clients.clear()
+    for http_client, http_async_client in http_clients:
+        http_client.close()
+        await http_async_client.aclose()
+
 
 def get_llm_model(provider: str, **kwargs):
     """
     获取LLM 模型
+    Instances are cached by provider, model, base_url, api key hash and sampling parameters.
     :param provider: 模型类型
-    :param kwargs:
+    :param kwargs: response_cache=True (or LLM_RESPONSE_CACHE=true) answers repeated requests from disk
     :return:
     """
+    response_cache = kwargs.pop("response_cache", None)
+    if response_cache is None:
+        response_cache = os.getenv("LLM_RESPONSE_CACHE", "false").lower() == "true"
+
     if provider not in ["ollama"]:
         env_var = f"{provider.upper()}_API_KEY"
         api_key = kwargs.get("api_key", "") or os.getenv(env_var, "")
@@ -42,6 +151,53 @@ def get_llm_model(provider: str, **kwargs):
             raise MissingAPIKeyError(provider, env_var)
         kwargs["api_key"] = api_key
 
+    key = _llm_cache_key(provider, kwargs)
+    with _llm_model_cache_lock:
+        llm = _llm_model_cache.get(key)
+        if llm is not None:
+            _llm_model_cache.move_to_end(key)
+
+    if llm is None:
+        llm = _create_llm_model(provider, **kwargs)
+        with _llm_model_cache_lock:
+            _llm_model_cache[key] = llm
+            _llm_model_cache.move_to_end(key)
+            evicted = []
+            while len(_llm_model_cache) > LLM_MODEL_CACHE_SIZE:
+                evicted.append(_llm_model_cache.popitem(last=False)[1])
+            unused_http_clients = _pop_unused_http_clients(evicted)
+        for http_clients in unused_http_clients:
+            _close_http_clients(*http_clients)
+
+    if response_cache:
+        return CachedChatModel(llm=llm, response_cache=get_response_cache())
+    return llm
+
+
+async def warm_up_llm_models(model_specs: str):
+    """
+    Create the LLM clients of a comma separated list of `provider:model_name` and open
+    their connection pools, so that the first task does not pay the connection setup.
+    """
+    for model_spec in model_specs.split(","):
+        if ":" not in model_spec:
+            continue
+        provider, model_name = model_spec.strip().split(":", 1)
+        try:
+            llm = get_llm_model(provider, model_name=model_name)
+            http_async_client = getattr(llm, "http_async_client", None)
+            base_url = getattr(llm, "openai_api_base", None) or getattr(llm, "azure_endpoint", None)
+            if http_async_client and base_url:
+                await http_async_client.head(base_url)
+            logger.info(f"Warmed up LLM {provider}:{model_name}")
+        except Exception as e:
+            logger.warning(f"Could not warm up LLM {model_spec}: {e}")
+
+
+def _create_llm_model(provider: str, **kwargs):
+    """Create a new LLM client, use get_llm_model to get a cached one"""
+    api_key = kwargs.get("api_key")
+
     if provider == "anthropic":
         if not kwargs.get("base_url", ""):
             base_url = "https://api.anthropic.com"
@@ -81,6 +237,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            **get_http_clients(base_url),
         )
     elif provider == "deepseek":
         if not kwargs.get("base_url", ""):
@@ -94,6 +251,7 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                **get_http_clients(base_url),
             )
         else:
             return ChatOpenAI(
@@ -101,6 +259,7 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                **get_http_clients(base_url),
             )
     elif provider == "google":
         return ChatGoogleGenerativeAI(
@@ -141,6 +300,7 @@ def get_llm_model(provider: str, **kwargs):
             api_version=api_version,
             azure_endpoint=base_url,
             api_key=api_key,
+            **get_http_clients(base_url),
         )
     elif provider == "alibaba":
         if not kwargs.get("base_url", ""):
@@ -153,6 +313,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            **get_http_clients(base_url),
         )
     elif provider == "moonshot":
         return ChatOpenAI(
@@ -160,6 +321,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=os.getenv("MOONSHOT_ENDPOINT"),
             api_key=os.getenv("MOONSHOT_API_KEY"),
+            **get_http_clients(os.getenv("MOONSHOT_ENDPOINT")),
         )
     elif provider == "unbound":
         return ChatOpenAI(
@@ -167,6 +329,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url = os.getenv("UNBOUND_ENDPOINT", "https://api.getunbound.ai"),
             api_key=api_key,
+            **get_http_clients(os.getenv("UNBOUND_ENDPOINT", "https://api.getunbound.ai")),
         )
     else:
         raise ValueError(f"Unsupported provider: {provider}")
@@ -0,0 +1,95 @@
+"""Fakes shared by the tests: a chat model, agent and message manager factories, pages and model outputs"""
+import asyncio
+import json
+import time
+from typing import Any, List, Optional
+
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode, DOMTextNode
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+LLM_LATENCY = 0.5
+
+
+def model_output(actions: list[dict], next_goal: str = "", evaluation_previous_goal: str = "",
+                 important_contents: str = "", thought: str = "") -> dict:
+    """Agent output as the llm writes it"""
+    return {
+        "current_state": {
+            "evaluation_previous_goal": evaluation_previous_goal,
+            "important_contents": important_contents,
+            "thought": thought,
+            "next_goal": next_goal,
+        },
+        "action": actions,
+    }
+
+
+DONE_RESPONSE = json.dumps(model_output([{"done": {"text": "finished", "success": True}}],
+                                        next_goal="Finish the task", evaluation_previous_goal="Success",
+                                        thought="The task is finished."))
+
+
+class SlowChatModel(BaseChatModel):
+    """Chat model answering with a fixed response after a fixed latency"""
+
+    latency: float = LLM_LATENCY
+    response: str = DONE_RESPONSE
+    model_name: str = "slow-fake-model"
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+
+def create_agent(llm: BaseChatModel, **kwargs):
+    from src.agent.custom_agent import CustomAgent
+    from src.agent.custom_prompts import CustomSystemPrompt, CustomAgentMessagePrompt
+    from src.controller.custom_controller import CustomController
+
+    kwargs.setdefault("controller", CustomController())
+    return CustomAgent(
+        task="fake task",
+        llm=llm,
+        system_prompt_class=CustomSystemPrompt,
+        agent_prompt_class=CustomAgentMessagePrompt,
+        tool_calling_method="raw",
+        **kwargs
+    )
+
+
+def create_message_manager(**kwargs):
+    from src.agent.custom_message_manager import CustomMessageManager, CustomMessageManagerSettings
+    from browser_use.agent.views import MessageManagerState
+
+    return CustomMessageManager(
+        task="fake task",
+        system_message=SystemMessage(content="system"),
+        settings=CustomMessageManagerSettings(**kwargs),
+        state=MessageManagerState(),
+    )
+
+
+def make_state(labels: list[str], url: str = "https://example.com/dashboard") -> BrowserState:
+    """Page with one button per label, highlighted in order"""
+    body = DOMElementNode(tag_name="body", xpath="/body", attributes={}, children=[], is_visible=True, parent=None)
+    selector_map = {}
+    for i, label in enumerate(labels):
+        button = DOMElementNode(tag_name="button", xpath=f"/body/button[{label}]", attributes={}, children=[],
+                                is_visible=True, parent=body, highlight_index=i)
+        button.children.append(DOMTextNode(text=label, is_visible=True, parent=button))
+        body.children.append(button)
+        selector_map[i] = button
+    return BrowserState(element_tree=body, selector_map=selector_map, url=url, title="Dashboard", tabs=[])
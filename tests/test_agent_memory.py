@@ -0,0 +1,62 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def test_memory_deduplicates_entries():
+    from src.utils.agent_memory import AgentMemory
+
+    memory = AgentMemory()
+    assert memory.add("Price of item A: 10 USD", step=1)
+    assert not memory.add("  price of item a: 10 usd ", step=2)
+    assert memory.add("Price of item B: 12 USD", step=3)
+    # seen again, moves to the newest position
+    assert not memory.add("Price of item A: 10 USD", step=4)
+    assert memory.render() == "Price of item B: 12 USD\nPrice of item A: 10 USD\n"
+
+
+def test_reordered_words_are_different_entries():
+    from src.utils.agent_memory import AgentMemory
+
+    memory = AgentMemory()
+    assert memory.add("Team A beats team B", step=1)
+    assert memory.add("Team B beats team A", step=2)
+    assert memory.add("Item A: 10 USD, item B: 12 USD", step=3)
+    assert memory.add("Item A: 12 USD, item B: 10 USD", step=4)
+    assert len(memory) == 4
+    # the same words in the same order are still an update of the older entry
+    assert memory.add("Item A: 12 USD; item B: 10 USD", step=5)
+    assert len(memory) == 4 and memory.render().endswith("item B: 10 USD\n")
+
+
+def test_near_duplicates_replace_older_entries():
+    from src.utils.agent_memory import AgentMemory
+
+    memory = AgentMemory()
+    memory.add("Found the list of open positions on the careers page, 12 positions in total", step=1)
+    memory.add("Found the list of open positions on the careers page, 12 positions in total so far", step=2)
+    assert len(memory) == 1
+    assert memory.render().endswith("so far\n")
+
+
+def test_memory_stays_within_token_budget():
+    from src.utils.agent_memory import AgentMemory
+
+    memory = AgentMemory(max_tokens=100, token_counter=len)
+    for i in range(50):
+        memory.add(f"result number {i}: {'x' * i}", step=i)
+    assert memory.tokens <= 100
+    assert memory.tokens == sum(len(entry.text) + 1 for entry in memory.entries.values())
+    assert memory.dropped == 50 - len(memory)
+    # the newest entries are kept
+    assert memory.render().splitlines()[-1].startswith("result number 49")
+
+
+if __name__ == "__main__":
+    test_memory_deduplicates_entries()
+    test_reordered_words_are_different_entries()
+    test_near_duplicates_replace_older_entries()
+    test_memory_stays_within_token_budget()
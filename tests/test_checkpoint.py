@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def test_agent_state_round_trips_through_a_checkpoint():
+    from browser_use.agent.views import ActionResult, AgentHistory
+    from browser_use.browser.views import BrowserStateHistory
+    from langchain_core.messages import HumanMessage
+    from src.agent.custom_views import CustomStepMetadata
+    from src.utils.checkpoint import AgentCheckpoint, checkpoint_history_path, load_checkpoint, remove_checkpoint, \
+        save_checkpoint
+    from src.utils.history_store import BlobStore, HistoryReader
+    from tests.helpers import SlowChatModel, create_agent, model_output
+
+    agent = create_agent(SlowChatModel())
+    output = agent.AgentOutput(**model_output(
+        [{"click_element": {"index": 3}}, {"input_text": {"index": 4, "text": "user"}}], next_goal="Log in"))
+    agent.state.history.history.append(AgentHistory(
+        model_output=output,
+        result=[ActionResult(), ActionResult(extracted_content="typed")],
+        state=BrowserStateHistory(url="https://example.com/login", title="Login", tabs=[],
+                                  interacted_element=[None, None]),
+        metadata=CustomStepMetadata(step_number=1, step_start_time=0, step_end_time=1, input_tokens=10,
+                                    llm_tier="fast"),
+    ))
+    agent.state.n_steps = 2
+    agent.state.last_action = output.action
+    agent.state.last_result = agent.state.history.history[-1].result
+    agent.state.add_extracted_page("Extracted page: prices")
+    agent.message_manager._add_message_with_tokens(HumanMessage(content="state of step 1"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent._checkpoint_dir = tmp_dir
+        agent._history_blobs = BlobStore(os.path.join(tmp_dir, "blobs"))
+        writer = agent._get_checkpoint_writer()
+        writer.write_new(agent.state.history.history)
+        writer.flush()
+        path = agent._checkpoint_path
+        save_checkpoint(AgentCheckpoint(task=agent.task, max_steps=10, steps_done=1, step_number=2,
+                                        memory=[("price is 3$", 1)], url="https://example.com/login",
+                                        state=agent._dump_state(), history_steps=writer.steps,
+                                        history_blob_dir=agent._history_blobs.directory), path)
+        assert "history" not in load_checkpoint(path).state
+        if os.name == "posix":
+            # the cookies are readable by the owner only
+            assert os.stat(path).st_mode & 0o777 == 0o600
+
+        # a step written after the checkpoint was saved, before a crash
+        writer.write_new(agent.state.history.history * 2)
+        writer.close()
+        checkpoint = load_checkpoint(path)
+        reader = HistoryReader(checkpoint_history_path(path), BlobStore(checkpoint.history_blob_dir))
+        assert len(reader) == 2
+        history = reader.read(agent.AgentOutput, 0, checkpoint.history_steps, metadata_model=CustomStepMetadata)
+
+        resumed = create_agent(SlowChatModel())
+        resumed._checkpoint_dir = tmp_dir
+        resumed.state = resumed._load_state(checkpoint.state, history)
+        resumed._get_checkpoint_writer().truncate(checkpoint.history_steps)
+        resumed._get_checkpoint_writer().close()
+        assert len(HistoryReader(checkpoint_history_path(path), BlobStore(checkpoint.history_blob_dir))) == 1
+
+        remove_checkpoint(path)
+        assert not os.path.exists(path) and not os.path.exists(checkpoint_history_path(path))
+
+    resumed.message_manager.restore_state(resumed.state.message_manager_state)
+    assert resumed.state.agent_id == agent.state.agent_id
+    assert resumed.state.n_steps == 2
+    assert [a.model_dump(exclude_unset=True) for a in resumed.state.last_action] == \
+           [{"click_element": {"index": 3}}, {"input_text": {"index": 4, "text": "user"}}]
+    assert resumed.state.history.history[0].model_output.action[1].get_index() == 4
+    assert resumed.state.history.history[0].metadata.llm_tier == "fast"
+    assert resumed.state.get_extracted_content() == "Extracted page: prices"
+    assert [m.content for m in resumed.message_manager.get_messages()] == \
+           [m.content for m in agent.message_manager.get_messages()]
+    # the restored history still finds its latest state message
+    resumed.message_manager._remove_state_message_by_index(-1)
+    assert "state of step 1" not in [m.content for m in resumed.message_manager.get_messages()]
+
+
+if __name__ == "__main__":
+    test_agent_state_round_trips_through_a_checkpoint()
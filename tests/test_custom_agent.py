@@ -0,0 +1,259 @@
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from langchain_core.messages import HumanMessage
+
+from tests.helpers import DONE_RESPONSE, LLM_LATENCY, SlowChatModel, create_agent, make_state, model_output
+
+
+def test_get_next_action_overlaps_llm_latency():
+    """N agents on one loop should wait for their LLM calls concurrently"""
+    num_agents = 5
+    agents = [create_agent(SlowChatModel()) for _ in range(num_agents)]
+
+    async def run_all():
+        start_time = time.time()
+        outputs = await asyncio.gather(
+            *[agent.get_next_action([HumanMessage(content="go")]) for agent in agents])
+        return outputs, time.time() - start_time
+
+    outputs, elapsed = asyncio.run(run_all())
+    print(f"{num_agents} agents finished in {elapsed:.2f}s, sequential would take {num_agents * LLM_LATENCY:.2f}s")
+    assert len(outputs) == num_agents
+    assert all(output.action[0].done for output in outputs)
+    assert elapsed < 2 * LLM_LATENCY
+
+
+def test_get_next_action_timeout():
+    agent = create_agent(SlowChatModel(latency=5), llm_timeout=0.2)
+
+    async def run():
+        try:
+            await agent.get_next_action([HumanMessage(content="go")])
+        except TimeoutError:
+            return True
+        return False
+
+    start_time = time.time()
+    assert asyncio.run(run())
+    assert time.time() - start_time < 2
+
+
+def test_stop_interrupts_llm_call():
+    agent = create_agent(SlowChatModel(latency=5))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, agent.stop)
+        try:
+            await agent.get_next_action([HumanMessage(content="go")])
+        except InterruptedError:
+            return True
+        return False
+
+    start_time = time.time()
+    assert asyncio.run(run())
+    assert time.time() - start_time < 2
+
+
+def test_extracted_pages_are_deduplicated():
+    from src.agent.custom_views import CustomAgentState
+
+    state = CustomAgentState()
+    page_a = "📄  Extracted page content:\nA\n"
+    page_b = "📄  Extracted page content:\nB\n"
+    assert state.add_extracted_page(page_a, "https://a.com")
+    assert state.add_extracted_page(page_b, "https://b.com")
+    # exact duplicates are skipped, even from another url
+    assert not state.add_extracted_page(page_a, "https://a.com/?utm=1")
+    assert state.get_extracted_content() == page_a + page_b
+    assert [page.url for page in state.extracted_pages.values()] == ["https://a.com", "https://b.com"]
+    # the state stays serializable
+    assert CustomAgentState.model_validate_json(state.model_dump_json()).get_extracted_content() == page_a + page_b
+
+
+def test_background_planner_does_not_block_the_step():
+    agent = create_agent(SlowChatModel(latency=0), planner_llm=SlowChatModel(latency=0.5, response="1. finish"),
+                         background_planner=True)
+
+    async def run():
+        state_message = HumanMessage(content="state 1")
+        model_output = await agent.get_next_action([state_message])
+        start_time = time.time()
+        agent._start_background_planner(state_message, model_output)
+        assert time.time() - start_time < 0.1
+        # the plan is not ready at the next step, the step goes on without it
+        agent.message_manager._add_message_with_tokens(HumanMessage(content="state 2"))
+        agent._add_background_plan()
+        assert agent.message_manager.get_messages()[-1].content == "state 2"
+        await asyncio.sleep(0.6)
+        agent.message_manager._add_message_with_tokens(HumanMessage(content="state 3"))
+        agent._add_background_plan()
+        return agent.message_manager.get_messages()[-1].content
+
+    assert "Planning Agent outputs plans:\n 1. finish" in asyncio.run(run())
+    assert agent.state.last_plan == "1. finish"
+
+
+def test_cascade_escalates_to_the_primary_model_on_parse_failure():
+    from src.utils.model_cascade import FAST_TIER, PRIMARY_TIER, get_cascade_stats
+
+    agent = create_agent(SlowChatModel(latency=0), cascade_llm=SlowChatModel(latency=0, response="not json"))
+
+    async def run():
+        agent.message_manager._add_message_with_tokens(HumanMessage(content="state"))
+        return await agent.get_next_action([HumanMessage(content="go")])
+
+    output = asyncio.run(run())
+    assert output.action[0].done
+    assert agent._step_tier == PRIMARY_TIER
+    # the unparsable answer of the fast model is not kept in the history
+    assert agent.message_manager.get_messages()[-1].content == DONE_RESPONSE
+    assert agent.message_manager.get_messages()[-2].content == "state"
+    stats = agent._cascade.to_dict()
+    assert stats["tiers"][FAST_TIER]["calls"] == 1 and stats["tiers"][FAST_TIER]["hits"] == 0
+    assert stats["tiers"][PRIMARY_TIER]["hits"] == 1
+    assert stats["escalations"] == {"parse_failure": 1}
+    # the stats of all the runs, per tier and model
+    cascade_stats = get_cascade_stats()
+    assert cascade_stats["tiers"][FAST_TIER]["slow-fake-model"]["calls"] >= 1
+    assert cascade_stats["tiers"][PRIMARY_TIER]["slow-fake-model"]["hits"] >= 1
+    assert cascade_stats["escalations"]["parse_failure"] >= 1
+
+    # a failed previous goal sends the next step to the primary model
+    assert agent._cascade.select(None, "Failed - the button was not found") == (PRIMARY_TIER, "failed_goal")
+    assert agent._cascade.select(None, "Success") == (FAST_TIER, None)
+
+
+def test_streamed_actions_stop_at_an_invalid_one_and_reach_the_history():
+    from browser_use.agent.views import ActionResult
+    from src.agent.custom_views import CustomAgentStepInfo
+
+    response = json.dumps(model_output([{"click_element": {"index": 1}}, {"click_element": {"index": "second"}},
+                                        {"click_element": {"index": 3}}], next_goal="Click the buttons"))
+    agent = create_agent(SlowChatModel(latency=0, response=response), stream_actions=True)
+    executed = []
+
+    async def multi_act_streaming(action_queue):
+        results = []
+        while (action := await action_queue.get()) is not None:
+            executed.append(action.get_index())
+            results.append(ActionResult(extracted_content=f"clicked {action.get_index()}", include_in_memory=True))
+        return results
+
+    async def get_state():
+        return make_state(["Save", "Cancel"])
+
+    agent.multi_act_streaming = multi_act_streaming
+    agent.browser_context.get_state = get_state
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    asyncio.run(agent.step(step_info))
+
+    # the action after the invalid one is not dispatched
+    assert executed == [1]
+    # the answer does not parse, the result of the action that ran is kept with the error
+    result = agent.state.history.history[-1].result
+    assert result[0].extracted_content == "clicked 1"
+    assert "Could not parse response" in result[-1].error
+    assert agent.state.last_result == result
+
+
+def test_actions_after_an_unreadable_streamed_one_run_after_the_full_parse():
+    from unittest import mock
+
+    from browser_use.agent.views import ActionResult
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.stream_parser import AgentOutputStreamParser
+
+    response = json.dumps(model_output([{"click_element": {"index": 1}}, {"click_element": {"index": 2}},
+                                        {"click_element": {"index": 3}}], next_goal="Click the buttons"))
+    agent = create_agent(SlowChatModel(latency=0, response=response), stream_actions=True)
+    streamed, executed = [], []
+
+    async def multi_act_streaming(action_queue):
+        results = []
+        while (action := await action_queue.get()) is not None:
+            streamed.append(action.get_index())
+            results.append(ActionResult(extracted_content=f"clicked {action.get_index()}", include_in_memory=True))
+        return results
+
+    async def multi_act(actions, check_for_new_elements=True):
+        executed.extend(action.get_index() for action in actions)
+        return [ActionResult(extracted_content=f"clicked {action.get_index()}", include_in_memory=True)
+                for action in actions]
+
+    async def get_state():
+        return make_state(["Save", "Cancel"])
+
+    load = AgentOutputStreamParser._load
+
+    def load_all_but_the_second(text):
+        return None if '"index": 2' in text else load(text)
+
+    agent.multi_act_streaming = multi_act_streaming
+    agent.multi_act = multi_act
+    agent.browser_context.get_state = get_state
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    with mock.patch.object(AgentOutputStreamParser, "_load", staticmethod(load_all_but_the_second)):
+        asyncio.run(agent.step(step_info))
+
+    # the stream stops at the action it can't read, the full parse runs it and the one after it
+    assert streamed == [1]
+    assert executed == [2, 3]
+    result = agent.state.history.history[-1].result
+    assert [r.extracted_content for r in result] == ["clicked 1", "clicked 2", "clicked 3"]
+    assert [a.get_index() for a in agent.state.last_action] == [1, 2, 3]
+
+
+def test_run_end_telemetry_counts_the_steps_of_this_run():
+    from browser_use.agent.views import ActionResult, AgentHistory
+    from browser_use.browser.views import BrowserStateHistory
+    from src.agent.custom_views import CustomAgentEndTelemetryEvent
+
+    agent = create_agent(SlowChatModel(latency=0))
+    # a resumed run that already took more steps than this run may take
+    agent.state.n_steps = 20
+    events = []
+
+    async def step(step_info):
+        agent.state.n_steps += 1
+        agent.state.history.history.append(AgentHistory(
+            model_output=None, result=[ActionResult(extracted_content="clicked")],
+            state=BrowserStateHistory(url="", title="", tabs=[], interacted_element=[None]),
+        ))
+        if agent.state.n_steps == 22:
+            agent.state.stop_reason = "Stuck repeating the same action"
+
+    async def close():
+        pass
+
+    agent.step = step
+    agent.browser_context.close = close
+    agent.browser.close = close
+    agent.telemetry.capture = events.append
+    asyncio.run(agent.run(max_steps=5))
+
+    event = events[-1]
+    assert isinstance(event, CustomAgentEndTelemetryEvent)
+    assert event.steps == 22 and not event.max_steps_reached
+    assert event.properties["steps_saved"] == 3
+
+
+if __name__ == "__main__":
+    test_get_next_action_overlaps_llm_latency()
+    test_get_next_action_timeout()
+    test_stop_interrupts_llm_call()
+    test_extracted_pages_are_deduplicated()
+    test_background_planner_does_not_block_the_step()
+    test_cascade_escalates_to_the_primary_model_on_parse_failure()
+    test_streamed_actions_stop_at_an_invalid_one_and_reach_the_history()
+    test_actions_after_an_unreadable_streamed_one_run_after_the_full_parse()
+    test_run_end_telemetry_counts_the_steps_of_this_run()
@@ -0,0 +1,133 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from browser_use.browser.views import BrowserState
+
+from tests.helpers import create_message_manager, make_state
+
+
+def elements_text(state: BrowserState) -> str:
+    return state.element_tree.clickable_elements_to_string()
+
+
+def test_only_changes_are_sent_after_the_base():
+    from src.utils.dom_delta import DomDeltaTracker
+
+    tracker = DomDeltaTracker()
+    labels = [f"Widget {i}" for i in range(30)]
+    state = make_state(labels)
+    assert tracker.render(state, elements_text(state)) == "The element list above is current."
+    assert "[29]<button Widget 29/>" in tracker.pending_base
+
+    state = make_state(labels)
+    assert tracker.render(state, elements_text(state)) == "No changes to the element list above."
+
+    state = make_state(labels[:-1] + ["Widget 30"])
+    delta = tracker.render(state, elements_text(state))
+    assert "Added:\n[29]<button Widget 30/>" in delta
+    assert "Removed:\n<button Widget 29/>" in delta
+    assert len(delta) < len(elements_text(state))
+    assert tracker.full_lists == 1 and tracker.deltas == 2
+
+
+def test_full_list_after_navigation_or_large_diff():
+    from src.utils.dom_delta import DomDeltaTracker
+
+    tracker = DomDeltaTracker()
+    state = make_state(["Save", "Cancel"])
+    tracker.render(state, elements_text(state))
+    tracker.pending_base = None
+
+    state = make_state(["Save", "Cancel"], url="https://example.com/settings")
+    assert tracker.render(state, elements_text(state)) == "The element list above is current."
+    assert tracker.pending_base.startswith("Interactive elements of https://example.com/settings")
+
+    state = make_state(["Delete", "Archive"], url="https://example.com/settings")
+    tracker.render(state, elements_text(state))
+    assert tracker.full_lists == 3
+
+
+def test_message_manager_pins_a_single_base():
+    from src.utils.dom_delta import DOM_BASE_MESSAGE_ID
+    from src.agent.custom_prompts import CustomAgentMessagePrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+
+    message_manager = create_message_manager(agent_prompt_class=CustomAgentMessagePrompt, dom_delta=True)
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    history = message_manager.state.history
+    for url in ["https://a.com", "https://a.com", "https://b.com"]:
+        message_manager.add_state_message(make_state(["Save", "Cancel"], url=url), step_info=step_info)
+        message_manager._remove_state_message_by_index(-1)
+    bases = [m.message.content for m in history.messages if m.message.id == DOM_BASE_MESSAGE_ID]
+    assert len(bases) == 1 and bases[0].startswith("Interactive elements of https://b.com")
+    assert history.current_tokens == sum(m.metadata.tokens for m in history.messages)
+
+
+def test_cut_messages_keeps_the_pinned_base():
+    from langchain_core.messages import AIMessage
+    from src.utils.dom_delta import DOM_BASE_MESSAGE_ID
+    from src.agent.custom_prompts import CustomAgentMessagePrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+
+    message_manager = create_message_manager(agent_prompt_class=CustomAgentMessagePrompt, dom_delta=True,
+                                             token_counter=len, max_input_tokens=3000)
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    history = message_manager.state.history
+    labels = [f"Widget {i}" for i in range(30)]
+    for i in range(6):
+        message_manager.add_state_message(make_state(labels), step_info=step_info)
+        message_manager._remove_state_message_by_index(-1)
+        message_manager._add_message_with_tokens(AIMessage(content=f"output {i} " + "x" * 400))
+    message_manager.add_state_message(make_state(labels), step_info=step_info)
+    assert history.current_tokens > 3000
+
+    message_manager.cut_messages()
+    assert history.current_tokens <= 3000
+    contents = [m.message.content for m in history.messages]
+    assert not any(str(content).startswith("output 0") for content in contents)
+    # the state message refers to the base, which is still in the history
+    assert "No changes to the element list above." in str(contents[-1])
+    bases = [m.message.content for m in history.messages if m.message.id == DOM_BASE_MESSAGE_ID]
+    assert len(bases) == 1 and "[29]<button Widget 29/>" in bases[0]
+    assert history.current_tokens == sum(m.metadata.tokens for m in history.messages)
+
+
+def test_pausing_after_the_model_call_keeps_the_pinned_base():
+    import asyncio
+
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.dom_delta import DOM_BASE_MESSAGE_ID
+    from tests.helpers import SlowChatModel, create_agent
+
+    async def pause(state, model_output, n_steps):
+        agent.pause()
+
+    async def get_state():
+        return make_state(["Save", "Cancel"])
+
+    agent = create_agent(SlowChatModel(latency=0), dom_delta=True, register_new_step_callback=pause)
+    agent.browser_context.get_state = get_state
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    asyncio.run(agent.step(step_info))
+
+    assert agent.state.paused
+    history = agent.message_manager.state.history
+    # the state message was removed once, the base it referred to and the answer are kept
+    assert [m.message.id for m in history.messages].count(DOM_BASE_MESSAGE_ID) == 1
+    assert history.messages[-1].message.type == "ai"
+    assert "Save" in history.messages[-2].message.content
+    # a pinned message is never taken for the state message
+    agent.message_manager._remove_state_message_by_index(-1)
+    assert [m.message.id for m in history.messages].count(DOM_BASE_MESSAGE_ID) == 1
+
+
+if __name__ == "__main__":
+    test_only_changes_are_sent_after_the_base()
+    test_full_list_after_navigation_or_large_diff()
+    test_message_manager_pins_a_single_base()
+    test_cut_messages_keeps_the_pinned_base()
+    test_pausing_after_the_model_call_keeps_the_pinned_base()
@@ -0,0 +1,100 @@
+import glob
+import json
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+WIDGETS = ["Revenue", "Orders", "Customers", "Inventory", "Shipping", "Returns", "Invoices", "Refunds", "Reports",
+           "Campaigns", "Coupons", "Warehouses", "Suppliers", "Employees", "Payroll", "Tickets", "Settings"]
+
+
+def make_dashboard(n_elements: int, seed: int = 0) -> tuple[str, dict]:
+    """
+    Element list of a large SPA dashboard, as written by clickable_elements_to_string,
+    with a task whose target element is somewhere in the middle.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n_elements):
+        widget = rng.choice(WIDGETS)
+        row = rng.randint(1, 500)
+        lines.append(f"{widget} row {row}")
+        lines.append(f"[{i}]<button aria-label='{rng.choice(['Edit', 'View', 'Delete'])} {widget.lower()} {row}'>"
+                     f"{rng.choice(['Edit', 'View', 'Delete'])}</button>")
+    target = n_elements // 2
+    lines[2 * target] = "Order 48213 from Globex"
+    lines[2 * target + 1] = f"[{target}]<button aria-label='Download invoice 48213'>Download</button>"
+    snapshot = {
+        "task": "Download the invoice of order 48213 placed by Globex",
+        "next_goal": "Click the download button of invoice 48213",
+        "target_indices": [target],
+    }
+    return "\n".join(lines), snapshot
+
+
+def kept_indices(elements_text: str) -> set[int]:
+    return {int(line[1:line.index("]")]) for line in elements_text.split("\n") if line.startswith("[")}
+
+
+def test_large_page_is_cut_to_the_budget_keeping_relevant_elements():
+    from src.utils.element_pruning import ElementPruner
+
+    elements_text, snapshot = make_dashboard(3000)
+    pruner = ElementPruner(max_tokens=2000)
+    pruned = pruner.prune(elements_text, snapshot["task"], snapshot["next_goal"])
+
+    assert len(pruned) // 3 <= 2000 + 50
+    assert set(snapshot["target_indices"]) <= kept_indices(pruned)
+    assert "Order 48213 from Globex" in pruned
+    omitted = 3000 - len(kept_indices(pruned))
+    assert f"... {omitted} interactive elements less relevant to the task are omitted" in pruned
+    assert pruner.pruned_pages == 1 and pruner.omitted_elements == omitted
+
+    # small pages are sent as they are
+    small_text, _ = make_dashboard(20)
+    assert pruner.prune(small_text, snapshot["task"]) == small_text
+
+
+def benchmark_element_pruning(snapshot_dir: str = "./tmp/dom_snapshots", max_tokens: int = 4000):
+    """
+    Token reduction and target recall of the pruning on saved DOM snapshots.
+    A snapshot is a json file with the task, the next_goal, the elements_text of the page and the
+    target_indices of the elements the successful run used. A run can only succeed if its targets are kept,
+    so the recall bounds the task success. Generated dashboards are used if no snapshot is saved.
+    """
+    from src.utils.element_pruning import ElementPruner
+
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(snapshot_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            snapshots.append(json.load(f))
+    if not snapshots:
+        for seed, n_elements in enumerate([1000, 2500, 5000, 10000]):
+            elements_text, snapshot = make_dashboard(n_elements, seed)
+            snapshot["elements_text"] = elements_text
+            snapshots.append(snapshot)
+
+    pruner = ElementPruner(max_tokens=max_tokens)
+    targets = kept_targets = 0
+    for snapshot in snapshots:
+        start = time.time()
+        pruned = pruner.prune(snapshot["elements_text"], snapshot["task"], snapshot.get("next_goal", ""))
+        elapsed = time.time() - start
+        kept = kept_indices(pruned)
+        targets += len(snapshot["target_indices"])
+        kept_targets += len(set(snapshot["target_indices"]) & kept)
+        print(f"{len(snapshot['elements_text']) // 3} -> {len(pruned) // 3} tokens, "
+              f"{len(kept)} elements kept, {elapsed * 1000:.1f} ms")
+    print(f"Tokens saved: {pruner.tokens_saved}, target recall: {kept_targets}/{targets}")
+
+
+if __name__ == "__main__":
+    test_large_page_is_cut_to_the_budget_keeping_relevant_elements()
+    benchmark_element_pruning()
@@ -0,0 +1,64 @@
+import asyncio
+import base64
+import io
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def make_step(color: str, goal: str):
+    from browser_use.agent.views import AgentHistory
+    from browser_use.browser.views import BrowserStateHistory
+    from PIL import Image
+    from tests.helpers import SlowChatModel, create_agent, model_output
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1920, 1080), color).save(buffer, format="PNG")
+    output = create_agent(SlowChatModel()).AgentOutput(
+        **model_output([{"done": {"text": "ok", "success": True}}], next_goal=goal))
+    return AgentHistory(
+        model_output=output,
+        result=[],
+        state=BrowserStateHistory(url="https://example.com", title="", tabs=[], interacted_element=[None],
+                                  screenshot=base64.b64encode(buffer.getvalue()).decode("utf-8")),
+    )
+
+
+def test_frames_are_rendered_per_step_within_the_caps():
+    from PIL import Image, ImageSequence
+    from src.utils.gif_recorder import GifRecorder
+
+    steps = [make_step(color, f"Goal {i}") for i, color in enumerate(["red", "green", "blue", "white", "black"])]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "run.gif")
+
+        async def run():
+            recorder = GifRecorder(task="fake task", output_path=output_path, max_size=320, max_frames=2,
+                                   show_task=False)
+            for step in steps:
+                recorder.add_step(step)
+                await asyncio.sleep(0)
+            # the frames are written as they are rendered, before the run finishes
+            await recorder._writer
+            assert recorder.frames == 2 and os.path.getsize(output_path + ".tmp") > 0
+            return await recorder.finish()
+
+        assert asyncio.run(run()) == output_path
+        with Image.open(output_path) as gif:
+            # the first frame doubles the stride, the second one uses up max_frames
+            assert gif.n_frames == 2
+            assert max(gif.size) <= 320
+            assert [gif.info["duration"] for _ in ImageSequence.Iterator(gif)] == [3000, 6000]
+            gif.seek(1)
+            # each frame keeps its colors
+            assert gif.convert("RGB").getpixel((0, 0)) == (0, 128, 0)
+
+
+if __name__ == "__main__":
+    test_frames_are_rendered_per_step_within_the_caps()
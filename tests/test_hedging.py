@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+async def answer_after(seconds: float, answer: str) -> str:
+    await asyncio.sleep(seconds)
+    return answer
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    from src.utils.hedging import HedgePolicy
+
+    policy = HedgePolicy(initial_delay=0.1)
+    cancelled = []
+
+    async def hung_primary():
+        try:
+            return await answer_after(5, "primary")
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        return await policy.race(hung_primary, lambda: answer_after(0.1, "secondary"), lambda answer: True)
+
+    start_time = time.time()
+    assert asyncio.run(run()) == ("secondary", True)
+    assert time.time() - start_time < 1
+    assert cancelled == [True]
+    assert policy.hedged == 1 and policy.secondary_wins == 1
+
+
+def test_fast_primary_is_not_hedged_and_invalid_answers_lose():
+    from src.utils.hedging import HedgePolicy
+
+    policy = HedgePolicy(initial_delay=0.5)
+
+    async def run():
+        fast = await policy.race(lambda: answer_after(0.01, "primary"), lambda: answer_after(0, "secondary"),
+                                 lambda answer: True)
+        # the primary answers first but can't be parsed, the secondary answer is used
+        invalid = await policy.race(lambda: answer_after(0.6, "not json"), lambda: answer_after(0.2, "secondary"),
+                                    lambda answer: answer != "not json")
+        return fast, invalid
+
+    assert asyncio.run(run()) == (("primary", False), ("secondary", True))
+    assert policy.hedged == 1
+
+
+def test_failed_primary_fails_over_before_the_deadline():
+    from src.utils.hedging import HedgePolicy
+
+    policy = HedgePolicy(initial_delay=5)
+
+    async def failing(seconds: float):
+        await asyncio.sleep(seconds)
+        raise ConnectionError("connection reset")
+
+    async def run():
+        return await policy.race(lambda: failing(0.01), lambda: answer_after(0.05, "secondary"),
+                                 lambda answer: True)
+
+    async def run_both_failing():
+        return await policy.race(lambda: failing(0.01), lambda: failing(0.01), lambda answer: True)
+
+    start_time = time.time()
+    assert asyncio.run(run()) == ("secondary", True)
+    assert time.time() - start_time < 1
+    assert policy.failovers == 1 and policy.hedged == 0
+    try:
+        asyncio.run(run_both_failing())
+        assert False, "the error of the last request is raised"
+    except ConnectionError:
+        pass
+
+
+def test_hedge_messages_are_converted_for_the_hedge_model():
+    from langchain_anthropic import ChatAnthropic
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from tests.helpers import SlowChatModel, create_agent
+
+    agent = create_agent(ChatAnthropic(model="claude-3-5-sonnet-latest", api_key="fake"),
+                         hedge_llm=SlowChatModel(), cache_friendly_prompt=True)
+    messages = [SystemMessage(content="system"), HumanMessage(content="context"), AIMessage(content="output"),
+                HumanMessage(content="state")]
+    assert agent._convert_input_messages(messages)[0].content[-1]["cache_control"] == {"type": "ephemeral"}
+    assert [message.content for message in agent._convert_input_messages(messages, agent._hedge_llm)] == \
+           ["system", "context", "output", "state"]
+
+
+def test_hedged_answer_is_parsed_once_off_the_event_loop():
+    import threading
+
+    from langchain_core.messages import HumanMessage
+    from src.utils.hedging import HedgePolicy
+    from tests.helpers import SlowChatModel, create_agent
+
+    agent = create_agent(SlowChatModel(latency=5, response="not json"), hedge_llm=SlowChatModel(latency=0.05))
+    agent._hedge = HedgePolicy(initial_delay=0.05)
+    load_model_output = agent._load_model_output
+    parse_threads = []
+
+    def counted_load_model_output(ai_message):
+        parse_threads.append(threading.current_thread())
+        return load_model_output(ai_message)
+
+    agent._load_model_output = counted_load_model_output
+    start_time = time.time()
+    output = asyncio.run(agent.get_next_action([HumanMessage(content="go")]))
+    assert time.time() - start_time < 2
+    assert output.action[0].model_dump(exclude_unset=True) == {"done": {"text": "finished", "success": True}}
+    assert len(parse_threads) == 1 and parse_threads[0] is not threading.main_thread()
+
+
+def test_deadline_follows_the_latency_percentile():
+    from src.utils.hedging import HedgePolicy
+
+    policy = HedgePolicy(percentile=90, initial_delay=10, min_delay=0.5)
+    assert policy.deadline() == 10
+    for seconds in [1, 1, 1, 1, 1, 1, 1, 1, 1, 4]:
+        policy.observe(seconds)
+    assert policy.deadline() == 4
+
+
+def test_backoff_delay():
+    from src.utils.hedging import backoff_delay
+
+    assert backoff_delay(3, max_delay=10, retry_after=2.5) == 2.5
+    assert all(0 <= backoff_delay(1, max_delay=10) <= 1 for _ in range(20))
+    assert all(0 <= backoff_delay(10, max_delay=10) <= 10 for _ in range(20))
+
+
+if __name__ == "__main__":
+    test_slow_primary_is_hedged_and_cancelled()
+    test_fast_primary_is_not_hedged_and_invalid_answers_lose()
+    test_failed_primary_fails_over_before_the_deadline()
+    test_hedge_messages_are_converted_for_the_hedge_model()
+    test_hedged_answer_is_parsed_once_off_the_event_loop()
+    test_deadline_follows_the_latency_percentile()
+    test_backoff_delay()
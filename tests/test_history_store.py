@@ -0,0 +1,69 @@
+import base64
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def make_history(agent, n_steps: int):
+    from browser_use.agent.views import ActionResult, AgentHistory
+    from browser_use.browser.views import BrowserStateHistory
+    from tests.helpers import model_output
+
+    history = []
+    for i in range(n_steps):
+        output = agent.AgentOutput(**model_output([{"click_element": {"index": i}}], next_goal=f"Goal {i}"))
+        history.append(AgentHistory(
+            model_output=output,
+            result=[ActionResult(extracted_content="Extracted page: " + "x" * 5000)],
+            # the same screenshot on every step, stored once
+            state=BrowserStateHistory(url=f"https://example.com/{i}", title="", tabs=[], interacted_element=[None],
+                                      screenshot=base64.b64encode(b"fake png").decode("utf-8")),
+        ))
+    return history
+
+
+def test_steps_are_appended_and_read_back_by_range():
+    from src.utils.history_store import BlobStore, HistoryReader, HistoryWriter
+    from tests.helpers import SlowChatModel, create_agent
+
+    agent = create_agent(SlowChatModel())
+    history = make_history(agent, 5)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        blobs = BlobStore(os.path.join(tmp_dir, "blobs"))
+        path = os.path.join(tmp_dir, "run.jsonl")
+        writer = HistoryWriter(path, blobs)
+        writer.write_new(history[:2])
+        writer.write_new(history[:4])
+        writer.close()
+        # a crash cut the last line, the next writer continues after the last complete one
+        with open(path, "ab") as f:
+            f.write(b'{"model_output": ')
+        writer = HistoryWriter(path, blobs)
+        assert writer.steps == 4
+        writer.write_new(history)
+        writer.close()
+
+        # one screenshot and one extracted content for all the steps
+        assert sum(len(files) for _, _, files in os.walk(blobs.directory)) == 2
+        with open(path, "r", encoding="utf-8") as f:
+            assert "fake png" not in f.read()
+
+        reader = HistoryReader(path, blobs)
+        assert len(reader) == 5
+        steps = reader.read(agent.AgentOutput, 2, 4)
+        assert [step.state.url for step in steps] == ["https://example.com/2", "https://example.com/3"]
+        assert steps[0].model_output.action[0].get_index() == 2
+        assert steps[0].state.screenshot == history[2].state.screenshot
+        assert steps[0].result[0].extracted_content == history[2].result[0].extracted_content
+        lazy = reader.read(agent.AgentOutput, 4, resolve_blobs=False)
+        assert lazy[0].state.screenshot.startswith("blob:")
+
+
+if __name__ == "__main__":
+    test_steps_are_appended_and_read_back_by_range()
@@ -0,0 +1,99 @@
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def test_async_connection_pools_are_kept_per_event_loop():
+    from src.utils.utils import get_http_clients
+
+    http_async_client = get_http_clients("https://pool.example.com/v1")["http_async_client"]
+    transport = http_async_client._transport
+
+    async def get_pools():
+        return transport._get_transport(), transport._get_transport()
+
+    first, same = asyncio.run(get_pools())
+    other, _ = asyncio.run(get_pools())
+    assert first is same
+    assert other is not first
+    assert get_http_clients("https://pool.example.com/v1")["http_async_client"] is http_async_client
+
+
+def test_deepseek_reasoner_uses_the_pooled_clients():
+    from src.utils.llm import DeepSeekR1ChatOpenAI
+    from src.utils.utils import get_http_clients
+
+    http_clients = get_http_clients("https://deepseek.example.com/v1")
+    llm = DeepSeekR1ChatOpenAI(model="deepseek-reasoner", base_url="https://deepseek.example.com/v1",
+                               api_key="fake", **http_clients)
+    assert llm.client._client is http_clients["http_client"]
+    assert llm._get_async_client()._client is http_clients["http_async_client"]
+
+
+def test_closing_the_clients_empties_the_caches():
+    from src.utils import utils
+
+    http_clients = utils.get_http_clients("https://closed.example.com/v1")
+    asyncio.run(utils.close_llm_clients())
+    assert http_clients["http_client"].is_closed and http_clients["http_async_client"].is_closed
+    assert utils.get_http_clients("https://closed.example.com/v1")["http_client"] is not http_clients["http_client"]
+
+
+def test_llm_clients_are_reused_per_configuration():
+    from src.utils import utils
+
+    asyncio.run(utils.close_llm_clients())
+    llm = utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://reuse.example.com/v1", api_key="a")
+    assert utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://reuse.example.com/v1",
+                               api_key="a") is llm
+    # another configuration of the endpoint is another client on the same connection pools
+    other = utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://reuse.example.com/v1",
+                                api_key="a", temperature=0.5)
+    assert other is not llm
+    assert other.http_client is llm.http_client and other.http_async_client is llm.http_async_client
+    assert utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://reuse.example.com/v1",
+                               api_key="b") is not llm
+
+
+def test_evicted_clients_close_the_pools_nobody_else_uses():
+    from src.utils import utils
+
+    asyncio.run(utils.close_llm_clients())
+    cache_size = utils.LLM_MODEL_CACHE_SIZE
+    utils.LLM_MODEL_CACHE_SIZE = 2
+
+    async def run():
+        first = utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://a.example.com/v1", api_key="a")
+        shared = utils.get_llm_model("openai", model_name="gpt-4o-mini", base_url="https://a.example.com/v1",
+                                     api_key="a")
+        # evicts the first client, its endpoint is still used by the second one
+        other = utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://b.example.com/v1", api_key="a")
+        await asyncio.sleep(0)
+        assert not first.http_client.is_closed
+        # evicts the second client, the last one of the endpoint
+        utils.get_llm_model("openai", model_name="gpt-4o-mini", base_url="https://b.example.com/v1", api_key="a")
+        await asyncio.sleep(0.1)
+        assert shared.http_client.is_closed and shared.http_async_client.is_closed
+        assert not other.http_client.is_closed
+        again = utils.get_llm_model("openai", model_name="gpt-4o", base_url="https://a.example.com/v1",
+                                    api_key="a")
+        assert again is not first and not again.http_client.is_closed
+
+    try:
+        asyncio.run(run())
+    finally:
+        utils.LLM_MODEL_CACHE_SIZE = cache_size
+        asyncio.run(utils.close_llm_clients())
+
+
+if __name__ == "__main__":
+    test_async_connection_pools_are_kept_per_event_loop()
+    test_deepseek_reasoner_uses_the_pooled_clients()
+    test_closing_the_clients_empties_the_caches()
+    test_llm_clients_are_reused_per_configuration()
+    test_evicted_clients_close_the_pools_nobody_else_uses()
@@ -0,0 +1,104 @@
+import asyncio
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from tests.helpers import SlowChatModel
+
+
+class CountingChatModel(SlowChatModel):
+    calls: int = 0
+
+    async def _agenerate(self, *args, **kwargs):
+        self.calls += 1
+        return await super()._agenerate(*args, **kwargs)
+
+
+def test_response_cache_normalizes_and_collapses_requests():
+    from src.utils.llm_cache import CachedChatModel, LLMResponseCache
+
+    inner_llm = CountingChatModel(latency=0.2)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        llm = CachedChatModel(llm=inner_llm, response_cache=LLMResponseCache(cache_dir))
+
+        def messages(time_str):
+            return [SystemMessage(content="system"),
+                    HumanMessage(content=f"Current step: 1/10\nCurrent date and time: {time_str}\n1. Task: fake")]
+
+        async def run():
+            # identical requests in flight at the same time share one call
+            responses = await asyncio.gather(*[llm.ainvoke(messages("2025-01-01 10:00")) for _ in range(3)])
+            # the timestamp is not part of the cache key
+            responses.append(await llm.ainvoke(messages("2025-01-01 10:05")))
+            return responses
+
+        responses = asyncio.run(run())
+        assert inner_llm.calls == 1
+        assert len(set(response.content for response in responses)) == 1
+
+        # a new process reads the responses back from disk
+        llm = CachedChatModel(llm=inner_llm, response_cache=LLMResponseCache(cache_dir))
+        assert llm.invoke(messages("2025-01-02 08:00")).content == responses[0].content
+        assert inner_llm.calls == 1
+        assert llm.model_name == inner_llm.model_name
+
+
+def test_call_options_are_part_of_the_key_and_unparsed_responses_are_evicted():
+    from src.utils.llm_cache import CachedChatModel, LLMResponseCache
+    from tests.helpers import create_agent
+
+    inner_llm = CountingChatModel(latency=0, response="not json")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        llm = CachedChatModel(llm=inner_llm, response_cache=LLMResponseCache(cache_dir))
+        messages = [HumanMessage(content="go")]
+
+        async def run():
+            await llm.ainvoke(messages)
+            await llm.ainvoke(messages, stop=["}"])
+            await llm.ainvoke(messages, response_format={"type": "json_object"})
+            await llm.ainvoke(messages, stop=["}"])
+
+        asyncio.run(run())
+        assert inner_llm.calls == 3
+
+        # the agent can't parse the cached answer and evicts it, its retry asks the model again
+        agent = create_agent(llm)
+        for _ in range(2):
+            try:
+                asyncio.run(agent.get_next_action(messages))
+                assert False, "the answer should not parse"
+            except ValueError:
+                pass
+        assert inner_llm.calls == 4
+        # only the responses to the calls with other options are left
+        assert len(llm.response_cache._index) == 2
+
+
+def test_response_cache_evicts_least_recently_used():
+    from src.utils.llm_cache import LLMResponseCache
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = LLMResponseCache(cache_dir, max_size=500)
+        cache.put("a", AIMessage(content="a" * 100))
+        cache.put("b", AIMessage(content="b" * 100))
+        assert cache.get("a") is not None
+        cache.put("c", AIMessage(content="c" * 100))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+
+        expired_cache = LLMResponseCache(cache_dir, ttl=-1)
+        assert expired_cache.get("a") is None
+
+
+if __name__ == "__main__":
+    test_response_cache_normalizes_and_collapses_requests()
+    test_call_options_are_part_of_the_key_and_unparsed_responses_are_evicted()
+    test_response_cache_evicts_least_recently_used()
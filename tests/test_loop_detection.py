@@ -0,0 +1,45 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from tests.helpers import make_state
+
+CLICK = [{"click_element": {"index": 1}}]
+
+
+def test_repeated_actions_get_a_hint_then_stop():
+    from src.utils.loop_detection import HINT, STOP, LoopDetector
+
+    detector = LoopDetector(max_repeats=3)
+    verdicts = [detector.observe(make_state(["Save", "Cancel"]), CLICK) for _ in range(6)]
+    assert verdicts[:2] == [None, None]
+    assert verdicts[2].reason == "cycle" and verdicts[2].response == HINT
+    assert "Try a different approach" in verdicts[2].message
+    assert verdicts[3:5] == [None, None]
+    assert verdicts[5].response == STOP
+
+
+def test_cycles_between_pages_and_stalls_are_detected():
+    from src.utils.loop_detection import ESCALATE, LoopDetector
+
+    detector = LoopDetector(max_repeats=2, can_escalate=True)
+    page_a, page_b = make_state(["Next"], url="https://a.com"), make_state(["Back"], url="https://b.com")
+    assert detector.observe(page_a, CLICK) is None
+    assert detector.observe(page_b, CLICK) is None
+    assert detector.observe(page_a, CLICK).reason == "cycle"
+    assert detector.observe(page_b, CLICK) is None
+
+    # a different action every step, but the page never changes
+    scrolls = [[{"scroll_down": {"amount": i}}] for i in range(5)]
+    verdicts = [detector.observe(page_a, actions) for actions in scrolls]
+    assert verdicts[-1].reason == "stall" and verdicts[-1].response == ESCALATE
+    # extracting content counts as progress
+    assert all(detector.observe(page_a, actions, made_progress=True) is None for actions in scrolls)
+
+
+if __name__ == "__main__":
+    test_repeated_actions_get_a_hint_then_stop()
+    test_cycles_between_pages_and_stalls_are_detected()
@@ -0,0 +1,91 @@
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from tests.helpers import SlowChatModel, create_message_manager
+
+
+def test_latest_state_message_is_removed_with_its_tokens():
+    message_manager = create_message_manager(token_counter=len)
+    history = message_manager.state.history
+    for i in range(3):
+        message_manager._add_message_with_tokens(HumanMessage(content=f"state {i}"))
+        message_manager._add_message_with_tokens(AIMessage(content=f"output {i}"))
+    message_manager._add_message_with_tokens(HumanMessage(content="state 3"))
+
+    message_manager._remove_state_message_by_index(-1)
+    assert [m.message.content for m in history.messages][-2:] == ["state 2", "output 2"]
+    # the state message before the model output
+    message_manager._remove_state_message_by_index(-1)
+    assert [m.message.content for m in history.messages][-2:] == ["output 1", "output 2"]
+    message_manager._remove_state_message_by_index(-2)
+    assert [m.message.content for m in history.messages][1:] == ["output 0", "state 1", "output 1", "output 2"]
+    assert history.current_tokens == sum(message_manager._count_tokens(m.message) for m in history.messages)
+
+
+def test_cut_messages_removes_oldest_messages_in_one_pass():
+    message_manager = create_message_manager(token_counter=len, max_input_tokens=30)
+    history = message_manager.state.history
+    for i in range(10):
+        message_manager._add_message_with_tokens(HumanMessage(content=f"message {i}"))
+
+    message_manager.cut_messages()
+    # the system message is kept, the oldest messages are removed
+    assert history.messages[0].message.content == "system"
+    assert [m.message.content for m in history.messages][1:] == ["message 8", "message 9"]
+    assert history.current_tokens == 6 + 9 + 9 <= 30
+    message_manager._remove_state_message_by_index(-1)
+    assert history.messages[-1].message.content == "message 8"
+
+
+def test_evicted_messages_are_folded_into_a_summary():
+    from src.agent.custom_message_manager import SUMMARY_MESSAGE_ID
+
+    compaction_llm = SlowChatModel(latency=0.1, response="visited page " * 100)
+    message_manager = create_message_manager(token_counter=len, max_input_tokens=200, compaction_llm=compaction_llm,
+                                             summary_max_tokens=50)
+    history = message_manager.state.history
+
+    async def run():
+        for i in range(30):
+            message_manager._add_message_with_tokens(AIMessage(content=f"output {i}"))
+            message_manager._add_message_with_tokens(HumanMessage(content=f"state {i}"))
+            message_manager.cut_messages()
+            assert history.current_tokens <= 200
+            message_manager._remove_state_message_by_index(-1)
+            message_manager.start_compaction()
+            await asyncio.sleep(0.02)
+        await message_manager.wait_compaction()
+        message_manager.start_compaction()
+        await message_manager.wait_compaction()
+
+    asyncio.run(run())
+    summary = history.messages[1]
+    assert summary.message.id == SUMMARY_MESSAGE_ID
+    assert summary.metadata.tokens <= 50 + len("Summary of the earlier steps of the task:\n")
+    assert not message_manager._evicted_messages
+    # the newest messages are kept as they are
+    assert history.messages[-1].message.content == "output 29"
+    assert history.current_tokens == sum(message_manager._count_tokens(m.message) for m in history.messages)
+
+
+def test_token_counter_falls_back_to_estimate():
+    from src.utils.token_counter import TokenCounter, get_token_counter
+
+    counter = TokenCounter("not-an-encoding")
+    assert counter("a" * 30) == 10
+    assert get_token_counter(SlowChatModel()) is None
+
+
+if __name__ == "__main__":
+    test_latest_state_message_is_removed_with_its_tokens()
+    test_cut_messages_removes_oldest_messages_in_one_pass()
+    test_evicted_messages_are_folded_into_a_summary()
+    test_token_counter_falls_back_to_estimate()
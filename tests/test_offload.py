@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def blocking_work(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def test_offloaded_work_does_not_block_the_loop():
+    from src.utils.offload import EventLoopLagMonitor, run_in_process, run_in_thread
+
+    async def run():
+        monitor = EventLoopLagMonitor(threshold_ms=100, interval=0.01)
+        monitor.start()
+        results = await asyncio.gather(run_in_thread(blocking_work, 0.3), run_in_process(blocking_work, 0.3))
+        offloaded_blocked = monitor.blocked
+        # a call left on the loop is flagged
+        blocking_work(0.3)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return results, offloaded_blocked, monitor
+
+    results, offloaded_blocked, monitor = asyncio.run(run())
+    assert results == [0.3, 0.3]
+    assert offloaded_blocked == 0
+    assert monitor.blocked == 1
+    assert monitor.lag.max >= 0.25
+
+
+if __name__ == "__main__":
+    test_offloaded_work_does_not_block_the_loop()
@@ -0,0 +1,62 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+
+def test_cache_breakpoints_mark_the_stable_prefix():
+    from src.utils.prompt_cache import add_cache_breakpoints
+
+    messages = [
+        SystemMessage(content="system"),
+        HumanMessage(content="context"),
+        AIMessage(content="output 1"),
+        HumanMessage(content=[{"type": "text", "text": "state"},
+                              {"type": "image_url", "image_url": {"url": "data:image/png;base64,"}}]),
+    ]
+    cached_messages = add_cache_breakpoints(messages)
+    assert cached_messages[0].content[-1]["cache_control"] == {"type": "ephemeral"}
+    assert cached_messages[2].content == [{"type": "text", "text": "output 1", "cache_control": {"type": "ephemeral"}}]
+    # the state message changes every step and the history is left untouched
+    assert cached_messages[3] is messages[3]
+    assert messages[0].content == "system" and messages[2].content == "output 1"
+
+
+def test_cached_input_tokens_from_usage():
+    from src.utils.prompt_cache import get_cached_input_tokens
+
+    usage = {"input_tokens": 1200, "output_tokens": 50, "total_tokens": 1250,
+             "input_token_details": {"cache_read": 1000, "cache_creation": 0}}
+    assert get_cached_input_tokens(usage) == (1000, 200)
+    assert get_cached_input_tokens({"input_tokens": 10, "output_tokens": 1, "total_tokens": 11}) == (0, 10)
+    assert get_cached_input_tokens(None) == (None, None)
+
+
+def test_cache_friendly_state_message_ends_with_volatile_fields():
+    from browser_use.browser.views import BrowserState
+    from browser_use.dom.views import DOMElementNode
+    from src.agent.custom_prompts import CustomAgentMessagePrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+
+    state = BrowserState(
+        element_tree=DOMElementNode(tag_name="body", xpath="", attributes={}, children=[], is_visible=True,
+                                    parent=None),
+        selector_map={}, url="https://example.com", title="Example", tabs=[],
+    )
+    step_info = CustomAgentStepInfo(step_number=3, max_steps=10, task="fake task", add_infos="", memory="")
+    content = CustomAgentMessagePrompt(state, step_info=step_info, cache_friendly=True).get_user_message().content
+    assert content.index("1. Task: fake task") < content.index("Current step: 3/10")
+    assert content.rstrip().splitlines()[-1].startswith("Current date and time: ")
+
+    content = CustomAgentMessagePrompt(state, step_info=step_info).get_user_message().content
+    assert content.index("Current step: 3/10") < content.index("1. Task: fake task")
+
+
+if __name__ == "__main__":
+    test_cache_breakpoints_mark_the_stable_prefix()
+    test_cached_input_tokens_from_usage()
+    test_cache_friendly_state_message_ends_with_volatile_fields()
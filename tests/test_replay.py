@@ -0,0 +1,100 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode
+
+
+def make_form(fields: list[tuple[str, dict]]) -> BrowserState:
+    """Page with one input per (xpath, attributes), highlighted in order"""
+    body = DOMElementNode(tag_name="body", xpath="/body", attributes={}, children=[], is_visible=True, parent=None)
+    selector_map = {}
+    for i, (xpath, attributes) in enumerate(fields):
+        element = DOMElementNode(tag_name="input", xpath=xpath, attributes=attributes, children=[], is_visible=True,
+                                 parent=body, highlight_index=i)
+        body.children.append(element)
+        selector_map[i] = element
+    return BrowserState(element_tree=body, selector_map=selector_map, url="https://example.com/login",
+                        title="Login", tabs=[])
+
+
+def test_elements_are_resolved_when_indices_shift():
+    from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+    from src.utils.replay import resolve_element
+
+    user = ("/body/form/input[1]", {"name": "user", "type": "text"})
+    password = ("/body/form/input[2]", {"name": "password", "type": "password"})
+    saved = make_form([user, password])
+    historical = HistoryTreeProcessor.convert_dom_element_to_history_element(saved.selector_map[1])
+
+    # a banner input was added before the form, the indices shifted
+    shifted = make_form([("/body/input[1]", {"name": "search"}), user, password])
+    assert resolve_element(historical, shifted).highlight_index == 2
+
+    # the form moved in the page, found by its identifying attributes
+    moved = make_form([("/body/div/form/input[1]", user[1]), ("/body/div/form/input[2]", password[1])])
+    assert resolve_element(historical, moved).highlight_index == 1
+
+    # the field is gone
+    assert resolve_element(historical, make_form([user])) is None
+
+
+def test_only_actions_that_succeeded_are_replayed():
+    from browser_use.agent.views import ActionResult, AgentHistory
+    from browser_use.browser.views import BrowserStateHistory
+    from src.utils.replay import replayable_actions, same_page
+    from tests.helpers import SlowChatModel, create_agent, model_output
+
+    agent = create_agent(SlowChatModel())
+    output = agent.AgentOutput(**model_output(
+        [{"input_text": {"index": 0, "text": "me"}}, {"click_element": {"index": 3}},
+         {"input_text": {"index": 1, "text": "secret"}}], next_goal="log in"))
+    history_item = AgentHistory(
+        model_output=output,
+        result=[ActionResult(), ActionResult(error="Element not found")],
+        state=BrowserStateHistory(url="https://example.com/login", title="Login", tabs=[], interacted_element=[]),
+    )
+    assert len(replayable_actions(history_item)) == 1
+    assert same_page("https://example.com/login/#top", "https://example.com/login")
+
+
+def test_a_failed_replay_closes_the_browser():
+    import asyncio
+
+    from browser_use.agent.views import ActionResult, AgentHistory, AgentHistoryList
+    from browser_use.browser.views import BrowserStateHistory
+    from tests.helpers import SlowChatModel, create_agent, model_output
+
+    agent = create_agent(SlowChatModel())
+    output = agent.AgentOutput(**model_output([{"click_element": {"index": 3}}], next_goal="open the form"))
+    history = AgentHistoryList(history=[AgentHistory(
+        model_output=output, result=[ActionResult()],
+        state=BrowserStateHistory(url="https://example.com/login", title="Login", tabs=[], interacted_element=[]),
+    )])
+    closed = []
+
+    async def replay_step(history_item, replay_done):
+        raise ConnectionError("browser disconnected")
+
+    async def close():
+        closed.append(True)
+
+    agent._replay_step = replay_step
+    agent.browser_context.close = close
+    agent.browser.close = close
+    try:
+        asyncio.run(agent.replay(history))
+        assert False, "the replay error is raised"
+    except ConnectionError:
+        pass
+    assert closed == [True, True]
+
+
+if __name__ == "__main__":
+    test_elements_are_resolved_when_indices_shift()
+    test_only_actions_that_succeeded_are_replayed()
+    test_a_failed_replay_closes_the_browser()
@@ -0,0 +1,55 @@
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def test_agents_of_the_same_actions_share_their_models():
+    from src.controller.custom_controller import CustomController
+    from tests.helpers import SlowChatModel, create_agent
+
+    first, second = create_agent(SlowChatModel()), create_agent(SlowChatModel())
+    assert first.ActionModel is second.ActionModel
+    assert first.AgentOutput is second.AgentOutput
+    assert first.available_actions == second.available_actions
+
+    controller = CustomController()
+
+    @controller.registry.action("Say hello")
+    def say_hello(name: str):
+        return name
+
+    third = create_agent(SlowChatModel(), controller=controller)
+    assert third.ActionModel is not first.ActionModel
+    assert "say_hello" in third.ActionModel.model_fields
+    assert "Say hello" in third.available_actions
+
+
+def benchmark_agent_construction(n_agents: int = 50):
+    """Construction time of an agent with a new controller, as in the backend and deep research, cold and warm"""
+    from src.agent.custom_prompts import _read_prompt_template
+    from src.utils.schema_cache import get_schema_cache
+    from tests.helpers import SlowChatModel, create_agent
+
+    def construct(clear_cache: bool) -> float:
+        start = time.time()
+        for _ in range(n_agents):
+            if clear_cache:
+                get_schema_cache().clear()
+                _read_prompt_template.cache_clear()
+            create_agent(SlowChatModel())
+        return (time.time() - start) / n_agents
+
+    uncached = construct(clear_cache=True)
+    cached = construct(clear_cache=False)
+    print(f"Agent construction: {uncached * 1000:.1f} ms uncached, {cached * 1000:.1f} ms cached, "
+          f"{get_schema_cache().to_dict()}")
+
+
+if __name__ == "__main__":
+    test_agents_of_the_same_actions_share_their_models()
+    benchmark_agent_construction()
@@ -0,0 +1,144 @@
+import asyncio
+import base64
+import io
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from PIL import Image, ImageDraw
+
+
+def make_screenshot(text: str, size=(1920, 1080), checked: bool = False) -> str:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 900, 500), fill="navy")
+    draw.text((1000, 300), text, fill="black")
+    draw.rectangle((200, 700, 1700, 1000), fill="darkgreen" if "other" in text else "white")
+    # a 14px checkbox
+    draw.rectangle((1000, 600, 1014, 614), outline="gray")
+    if checked:
+        draw.line((1003, 607, 1006, 611, 1011, 603), fill="black", width=2)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def test_unchanged_screenshots_are_skipped_and_others_downscaled():
+    from src.utils.screenshot import ScreenshotOptimizer, image_token_cost
+
+    optimizer = ScreenshotOptimizer(provider="anthropic", max_image_tokens=1000)
+    image_url = optimizer.process(make_screenshot("page"))
+    assert image_url.startswith("data:image/jpeg;base64,")
+    image = Image.open(io.BytesIO(base64.b64decode(image_url.split(",", 1)[1])))
+    assert image_token_cost(image.width, image.height, "anthropic") <= 1000
+    # the aspect ratio is kept
+    assert abs(image.width / image.height - 1920 / 1080) < 0.01
+
+    # the same page is not sent again
+    assert optimizer.process(make_screenshot("page")) is None
+    assert optimizer.process(make_screenshot("other page")) is not None
+    assert optimizer.skipped_images == 1 and optimizer.downscaled_images == 2
+    full_tokens = image_token_cost(1920, 1080, "anthropic")
+    assert optimizer.tokens_saved == 3 * full_tokens - optimizer.tokens_sent
+
+
+def test_small_ui_changes_are_sent():
+    from src.utils.screenshot import ScreenshotOptimizer
+
+    optimizer = ScreenshotOptimizer(provider="anthropic")
+    assert optimizer.process(make_screenshot("Name: Jo")) is not None
+    # a typed character, then a ticked checkbox
+    assert optimizer.process(make_screenshot("Name: Joe")) is not None
+    assert optimizer.process(make_screenshot("Name: Joe", checked=True)) is not None
+    assert optimizer.process(make_screenshot("Name: Joe", checked=True)) is None
+
+
+def test_screenshots_are_prepared_off_the_event_loop():
+    import threading
+
+    from src.agent.custom_prompts import CustomAgentMessagePrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.screenshot import ScreenshotOptimizer
+    from tests.helpers import create_message_manager, make_state
+
+    optimizer = ScreenshotOptimizer(provider="anthropic")
+    message_manager = create_message_manager(agent_prompt_class=CustomAgentMessagePrompt,
+                                             screenshot_optimizer=optimizer)
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    prepare = optimizer.prepare
+    threads = []
+
+    def record_thread(screenshot):
+        threads.append(threading.current_thread())
+        prepare(screenshot)
+
+    optimizer.prepare = record_thread
+
+    async def run():
+        for text in ["page", "page", "other page"]:
+            state = make_state(["Save"])
+            state.screenshot = make_screenshot(text)
+            await message_manager.prepare_screenshot(state)
+            message_manager.add_state_message(state, step_info=step_info)
+            message_manager._remove_state_message_by_index(-1)
+
+    asyncio.run(run())
+    assert len(threads) == 3 and threading.main_thread() not in threads
+    assert optimizer.images == 3 and optimizer.skipped_images == 1
+
+
+def test_image_token_costs():
+    from src.utils.screenshot import image_token_cost
+
+    assert image_token_cost(1092, 1092, "anthropic") == 1590
+    # 1920x1080 is scaled to 1365x768, 3x2 tiles
+    assert image_token_cost(1920, 1080, "openai") == 85 + 170 * 6
+    assert image_token_cost(300, 300, "google") == 258
+
+
+def test_message_manager_pins_the_sent_screenshot():
+    from src.agent.custom_prompts import CustomAgentMessagePrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.screenshot import SCREENSHOT_MESSAGE_ID, ScreenshotOptimizer
+    from tests.helpers import create_message_manager, make_state
+
+    optimizer = ScreenshotOptimizer(provider="anthropic")
+    message_manager = create_message_manager(agent_prompt_class=CustomAgentMessagePrompt,
+                                             screenshot_optimizer=optimizer)
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fake task", add_infos="", memory="")
+    history = message_manager.state.history
+
+    def add_state(text: str) -> str:
+        state = make_state(["Save"])
+        state.screenshot = make_screenshot(text)
+        message_manager.add_state_message(state, step_info=step_info)
+        content = history.messages[-1].message.content
+        # the agent removes the state message after the model call
+        message_manager._remove_state_message_by_index(-1)
+        return content
+
+    assert "The screenshot above is current." in add_state("page")
+    # the state message is gone, the screenshot it refers to is still in the history
+    assert "looks the same as in the screenshot above" in add_state("page")
+    pinned = [m.message for m in history.messages if m.message.id == SCREENSHOT_MESSAGE_ID]
+    assert len(pinned) == 1 and pinned[0].content[1]["image_url"]["url"].startswith("data:image/jpeg")
+
+    assert "The screenshot above is current." in add_state("other page")
+    assert len([m for m in history.messages if m.message.id == SCREENSHOT_MESSAGE_ID]) == 1
+
+    # without a pinned screenshot to refer to, an unchanged one is sent again
+    history.remove_messages(len(history.messages) - 1, len(history.messages))
+    assert "The screenshot above is current." in add_state("other page")
+    assert history.current_tokens == sum(m.metadata.tokens for m in history.messages)
+
+
+if __name__ == "__main__":
+    test_unchanged_screenshots_are_skipped_and_others_downscaled()
+    test_small_ui_changes_are_sent()
+    test_screenshots_are_prepared_off_the_event_loop()
+    test_image_token_costs()
+    test_message_manager_pins_the_sent_screenshot()
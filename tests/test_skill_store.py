@@ -0,0 +1,98 @@
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def make_history(steps: list[tuple], success: bool = True):
+    """History of a run of (url, next_goal, actions) or (url, next_goal, actions, interacted) steps, ending with done"""
+    from browser_use.agent.views import ActionResult, AgentHistory, AgentHistoryList
+    from browser_use.browser.views import BrowserStateHistory
+    from tests.helpers import SlowChatModel, create_agent, model_output
+
+    agent = create_agent(SlowChatModel())
+    history = AgentHistoryList(history=[])
+    for url, goal, actions, *interacted in steps + [("https://example.com/results", "Finish",
+                                                     [{"done": {"text": "ok", "success": True}}])]:
+        output = agent.AgentOutput(**model_output(actions, next_goal=goal))
+        results = [ActionResult() for _ in actions]
+        if "done" in actions[0]:
+            results = [ActionResult(is_done=True, success=success, extracted_content="ok")]
+        history.history.append(AgentHistory(
+            model_output=output,
+            result=results,
+            state=BrowserStateHistory(url=url, title="", tabs=[],
+                                      interacted_element=interacted[0] if interacted else [None] * len(actions)),
+        ))
+    return history
+
+
+def test_skills_are_learned_from_successful_runs():
+    from src.utils.skill_store import SkillStore
+
+    history = make_history([
+        ("https://www.example.com/", "Open the login page", [{"click_element": {"index": 3}}]),
+        ("https://www.example.com/login", "Log in",
+         [{"input_text": {"index": 1, "text": "<secret>user</secret>"}},
+          {"input_text": {"index": 2, "text": "<secret>password</secret>"}},
+          {"click_element": {"index": 4}}]),
+        ("https://www.example.com/search", "Extract the results", [{"extract_content": {"goal": "results"}}]),
+    ])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "skills.json")
+        store = SkillStore(path)
+        assert store.learn(make_history([("https://a.com", "Open", [{"click_element": {"index": 1}}])],
+                                        success=False)) == []
+        skills = store.learn(history)
+        assert len(skills) == 1
+        skill = skills[0]
+        assert skill.domain == "example.com"
+        assert skill.intent == "example.com/: click_element > input_text(user) > input_text(password) > click_element"
+        assert sum(len(step.actions) for step in skill.steps) == 4
+        assert skill.input_names() == ["user", "password"]
+
+        # the same actions from the same page learned again update the skill, whatever the goals said
+        store.learn(make_history([(url, f"{goal}, again", actions) for url, goal, actions in [
+            ("https://example.com/", "Open the login page", [{"click_element": {"index": 3}}]),
+            ("https://example.com/login", "Log in",
+             [{"input_text": {"index": 1, "text": "<secret>user</secret>"}},
+              {"input_text": {"index": 2, "text": "<secret>password</secret>"}},
+              {"click_element": {"index": 4}}]),
+        ]]))
+        reloaded = SkillStore(path)
+        assert len(reloaded.find()) == 1
+        assert reloaded.find("www.example.com")[0].successes == 2
+        assert f"{skill.name}: {skill.intent}" in reloaded.describe("example.com")
+        assert reloaded.describe("other.com") == ""
+
+
+def test_typed_texts_are_not_stored():
+    from browser_use.dom.history_tree_processor.view import DOMHistoryElement
+    from src.utils.skill_store import SkillStore
+
+    email = DOMHistoryElement(tag_name="input", xpath="/body/form/input[1]", highlight_index=1,
+                              entire_parent_branch_path=["body", "form", "input"], attributes={"name": "email"})
+    history = make_history([
+        ("https://shop.com/search", "Search for the blue kettle for jane@example.com",
+         [{"input_text": {"index": 1, "text": "jane@example.com"}},
+          {"input_text": {"index": 2, "text": "blue kettle"}}], [email, None]),
+    ])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "skills.json")
+        store = SkillStore(path)
+        skill = store.learn(history)[0]
+        assert skill.input_names() == ["email", "text"]
+        with open(path, encoding="utf-8") as f:
+            stored = f.read()
+        for text in (stored, store.describe()):
+            assert "jane@example.com" not in text and "kettle" not in text
+
+
+if __name__ == "__main__":
+    test_skills_are_learned_from_successful_runs()
+    test_typed_texts_are_not_stored()
@@ -0,0 +1,72 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+
+def test_percentiles_are_bucket_upper_bounds():
+    from src.utils.step_profiler import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    for seconds in [0.02] * 50 + [0.3] * 40 + [3.0] * 9 + [200.0]:
+        histogram.observe(seconds)
+    assert histogram.percentile(50) == 0.025
+    assert histogram.percentile(90) == 0.5
+    assert histogram.percentile(99) == 5.0
+    # the unbounded bucket reports the largest latency seen
+    assert histogram.percentile(100) == 200.0
+
+    summary = histogram.to_dict()
+    assert summary["count"] == 100 and summary["max"] == 200.0
+    assert summary["buckets"]["0.025"] == 50 and summary["buckets"]["+Inf"] == 1
+    assert abs(summary["mean"] - (50 * 0.02 + 40 * 0.3 + 9 * 3.0 + 200.0) / 100) < 1e-9
+
+    # a single fast step is not reported as slow as its bucket bound
+    histogram = LatencyHistogram()
+    histogram.observe(0.07)
+    assert histogram.percentile(99) == 0.07
+
+
+def test_nested_phases_are_not_counted_twice():
+    import time
+
+    from src.utils.step_profiler import StepProfiler
+
+    profiler = StepProfiler()
+    with profiler.phase("llm"):
+        time.sleep(0.05)
+        with profiler.phase("multi_act"):
+            time.sleep(0.1)
+    with profiler.phase("multi_act"):
+        time.sleep(0.05)
+    assert 0.05 <= profiler.timings["llm"] < 0.1
+    assert 0.15 <= profiler.timings["multi_act"] < 0.2
+
+
+def test_only_the_latest_tasks_are_kept():
+    from src.utils import step_profiler
+
+    first_task = "profiled-task-0"
+    step_profiler.record_step_timings(first_task, "profiled-model", {"llm_call": 1.0})
+    for i in range(1, step_profiler.MAX_TASK_HISTOGRAMS + 5):
+        step_profiler.record_step_timings(f"profiled-task-{i}", "profiled-model", {"llm_call": 1.0})
+        if i == 10:
+            # a step of a running task keeps it
+            step_profiler.record_step_timings(first_task, "profiled-model", {"llm_call": 2.0})
+
+    histograms = step_profiler.get_latency_histograms()
+    assert len(histograms["task"]) == step_profiler.MAX_TASK_HISTOGRAMS
+    assert histograms["task"][first_task]["llm_call"]["count"] == 2
+    assert "profiled-task-1" not in histograms["task"]
+    assert f"profiled-task-{step_profiler.MAX_TASK_HISTOGRAMS + 4}" in histograms["task"]
+    # the model histograms aggregate the evicted tasks too
+    assert histograms["model"]["profiled-model"]["llm_call"]["count"] == step_profiler.MAX_TASK_HISTOGRAMS + 6
+
+
+if __name__ == "__main__":
+    test_percentiles_are_bucket_upper_bounds()
+    test_nested_phases_are_not_counted_twice()
+    test_only_the_latest_tasks_are_kept()
@@ -0,0 +1,94 @@
+import json
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+
+from src.utils.llm import ThinkTagParser
+from src.utils.stream_parser import AgentOutputStreamParser
+
+OUTPUT = {
+    "current_state": {
+        "evaluation_previous_goal": "Success - opened the page {not an object}",
+        "important_contents": "",
+        "thought": "Type the query \"[x]\" and search",
+        "next_goal": "Search",
+    },
+    "action": [
+        {"input_text": {"index": 3, "text": "a } tricky [ string"}},
+        {"click_element": {"index": 4}},
+        {"done": {"text": "finished", "success": True}},
+    ],
+}
+
+
+def test_actions_are_emitted_as_soon_as_closed():
+    text = "```json\n" + json.dumps(OUTPUT, indent=2) + "\n```"
+    parser = AgentOutputStreamParser()
+    emitted = []
+    # feed the response a few characters at a time, like an LLM stream
+    for i in range(0, len(text), 7):
+        for action in parser.feed(text[i:i + 7]):
+            emitted.append((action, len(parser.text)))
+
+    assert [action for action, _ in emitted] == OUTPUT["action"]
+    assert parser.current_state == OUTPUT["current_state"]
+    # every action is emitted before the whole response has been received
+    assert all(received < len(text) for _, received in emitted)
+    assert parser.text == text
+
+
+def test_nested_and_incomplete_objects_are_not_emitted():
+    parser = AgentOutputStreamParser()
+    assert parser.feed('{"current_state": {}, "action": [{"click_element": {"index": 4}') == []
+    assert parser.feed('}') == [{"click_element": {"index": 4}}]
+    assert parser.feed(']}') == []
+
+
+def test_think_tags_are_split_incrementally():
+    text = '<think>Maybe click {index} 4</think>\n**JSON Response:** ```json\n{"action": []}```'
+    for chunk_size in (1, 4, len(text)):
+        parser = ThinkTagParser()
+        reasoning, content = "", ""
+        for i in range(0, len(text), chunk_size):
+            reasoning_, content_ = parser.feed(text[i:i + chunk_size])
+            reasoning += reasoning_
+            content += content_
+        reasoning_, content_ = parser.flush()
+        assert reasoning + reasoning_ == "Maybe click {index} 4"
+        assert content + content_ == ' ```json\n{"action": []}```'
+
+
+def test_text_without_think_tags_is_content():
+    text = '{"action": [{"click_element": {"index": 4}}]}'
+    for chunk_size in (1, 3, len(text)):
+        parser = ThinkTagParser()
+        reasoning, content = "", ""
+        for i in range(0, len(text), chunk_size):
+            reasoning_, content_ = parser.feed(text[i:i + chunk_size])
+            reasoning += reasoning_
+            content += content_
+        reasoning_, content_ = parser.flush()
+        assert reasoning + reasoning_ == ""
+        assert content + content_ == text
+    assert ThinkTagParser.split("<th") == ("", "<th")
+
+
+def test_complete_responses_keep_the_content_after_the_last_json_marker():
+    text = '<think>plan</think>\n**JSON Response:** draft\n**JSON Response:** {"action": []}'
+    assert ThinkTagParser.split(text) == ("plan", ' {"action": []}')
+    # streamed content can't be taken back, it starts after the first marker
+    parser = ThinkTagParser()
+    reasoning, content = parser.feed(text)
+    assert (reasoning, content + parser.flush()[1]) == ("plan", ' draft\n**JSON Response:** {"action": []}')
+
+
+if __name__ == "__main__":
+    test_actions_are_emitted_as_soon_as_closed()
+    test_nested_and_incomplete_objects_are_not_emitted()
+    test_think_tags_are_split_incrementally()
+    test_text_without_think_tags_is_content()
+    test_complete_responses_keep_the_content_after_the_last_json_marker()